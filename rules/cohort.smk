@@ -0,0 +1,70 @@
+"""
+This rule aggregates the MSI scores and sites of all samples into cohort
+tables, with an index of sites per sample.
+"""
+rule cohort:
+    input:
+        unpack(get_cohort_inputs_w)
+    output:
+        scores = report(
+            "msisensor/cohort/scores.tsv",
+            caption="../report/cohort.rst",
+            category="MSI",
+            subcategory="Cohort"
+        ),
+        sites = "msisensor/cohort/sites.tsv",
+        index = "msisensor/cohort/sites.tsv.idx"
+    message:
+        "Aggregating MSI results of the whole cohort"
+    threads:
+        1
+    resources:
+        mem_mb = (
+            lambda wildcards, attempt: min(attempt * 1024, 4096)
+        ),
+        time_min = (
+            lambda wildcards, attempt: min(attempt * 15, 60)
+        )
+    log:
+        "logs/cohort/cohort.logs"
+    benchmark:
+        "benchmarks/cohort/cohort.tsv"
+    conda:
+        "../envs/py3.yaml"
+    shell:
+        "python3 {workflow.basedir}/scripts/cohort_table.py"
+        " msisensor/cohort {input.msi_scores} > {log} 2>&1"
+
+
+"""
+This rule aggregates the benchmarks of all rules into performance tables:
+runtime percentiles, peak memory and bytes read, by rule and by job.
+"""
+rule performance:
+    input:
+        unpack(get_performance_inputs_w)
+    output:
+        rules = report(
+            "msisensor/performance/rules.tsv",
+            caption="../report/performance.rst",
+            category="Performance"
+        ),
+        jobs = "msisensor/performance/jobs.tsv"
+    message:
+        "Aggregating benchmarks of all rules"
+    threads:
+        1
+    resources:
+        mem_mb = (
+            lambda wildcards, attempt: min(attempt * 512, 2048)
+        ),
+        time_min = (
+            lambda wildcards, attempt: min(attempt * 10, 60)
+        )
+    log:
+        "logs/performance/performance.logs"
+    conda:
+        "../envs/py3.yaml"
+    shell:
+        "python3 {workflow.basedir}/scripts/performance_report.py"
+        " benchmarks -r {output.rules} -j {output.jobs} > {log} 2>&1"
@@ -4,33 +4,66 @@ one gathers all the python instructions surch as config mappings or input
 validations.
 """
 
-import pandas as pd
+import shlex
+import sys
+import yaml
 
 
+from pathlib import Path
+from snakemake.logging import logger
 from snakemake.utils import validate
 
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(workflow.basedir, "scripts"))
+from bgzf import index_suffix, is_cram
+from design_index import load_design
+from fasta_index import load_fai, read_contigs
+from filter_regions import read_bed, regions_span
+from prune_sites import cram_normals
+from resource_model import Observation, estimate_sites, fit, load_history
+from resource_model import merge_observations, predict, priors
+from resource_model import read_benchmark, update_history
+from scan_cache import cached_scan, evict_scans, scan_key
+from stage import is_cold
 
-my_snw = "https://raw.githubusercontent.com/tdayris/snakemake-wrappers/Unofficial"
 swv = "0.51.0"
 
 
 configfile: "config.yaml"
 validate(config, schema="../schemas/config.schemas.yaml")
 
-design = pd.read_csv(
-    config["design"],
-    sep="\t",
-    header=0,
-    index_col=None,
-    dtype=str
+# The design is validated as a whole, on the required columns of
+# schemas/design.schemas.yaml, and its pickled index is reused as long as
+# it does not change
+design_schema_path = os.path.join(
+    workflow.basedir, "schemas", "design.schemas.yaml"
+)
+with open(design_schema_path, "r") as schema_stream:
+    design_schema = yaml.safe_load(schema_stream)
+design = load_design(
+    Path(config["design"]), required=design_schema["required"]
 )
-design.set_index(design["Sample_id"])
-validate(design, schema="../schemas/design.schemas.yaml")
 
 report: "../report/general.rst"
 
 
+def get_normal_keys() -> Dict[str, str]:
+    """
+    This function gives the staged name of the normal bam of each sample.
+    A normal bam shared by several tumors (multi-region or longitudinal
+    samples) is staged once, under the name of the first sample using it
+    in the design. It returns a dictionnary:
+
+    {sample1: sample1_N, sample2: sample1_N, sample3: sample3_N, ...}
+    """
+    owners = {}
+    return {
+        sample: owners.setdefault(normal, f"{sample}_N")
+        for sample, normal in zip(design["Sample_id"], design["Normal_Bam"])
+    }
+
+
 def get_bam_from_path() -> Dict[str, str]:
     """
     This function gives the correspondancy between real bam paths, and the
@@ -40,7 +73,9 @@ def get_bam_from_path() -> Dict[str, str]:
      sample1_T: real_path to tumor  sample, ...}
 
     Input paths are not predictable, besides in design file.
-    All output bams, will be in raw_data/{sample_id}.bam
+    All output bams, will be in raw_data/{sample_id}.bam (or .cram, see
+    get_staged_path). Shared normal bams only appear once (see
+    get_normal_keys).
     """
     result = {}
 
@@ -51,12 +86,183 @@ def get_bam_from_path() -> Dict[str, str]:
     )
 
     for sample, normal, tumor in design_iterator:
-        result[f"{sample}_N"] = normal
+        result[normal_keys[sample]] = normal
         result[f"{sample}_T"] = tumor
 
     return result
 
 
+def get_bai_from_path() -> Dict[str, str]:
+    """
+    This function gives the correspondancy between real bam index paths,
+    and the ones used in this pipeline. It returns a dictionnary:
+
+    {sample1_N: real_path to normal index,
+     sample1_T: real_path to tumor  index, ...}
+
+    Indexes are taken from the design file when available, and are
+    expected next to their bam file otherwise.
+    """
+    result = {}
+    for kind, suffix in [("Normal", "N"), ("Tumor", "T")]:
+        bams = design[f"{kind}_Bam"]
+        design_iterator = zip(
+            design["Sample_id"],
+            bams,
+            design.get(f"{kind}_Index", [""] * len(bams))
+        )
+        for sample, bam, bai in design_iterator:
+            key = normal_keys[sample] if suffix == "N" else f"{sample}_T"
+            result.setdefault(key, bai or f"{bam}{index_suffix(bam)}")
+
+    return result
+
+
+def get_staged_path(key: str) -> str:
+    """
+    This function returns the staged path of a bam file, from its key in
+    bam_path_dict (e.g. sample1_N). Cram files are staged as they are,
+    and keep their extension:
+
+    raw_data/sample1_N.bam or raw_data/sample1_N.cram
+    """
+    extension = "cram" if is_cram(bam_path_dict[key]) else "bam"
+    return f"raw_data/{key}.{extension}"
+
+
+def get_staged_index(key: str) -> str:
+    """
+    This function returns the staged path of a bam index, next to its bam
+    file:
+
+    raw_data/sample1_N.bam.bai or raw_data/sample1_N.cram.crai
+    """
+    staged = get_staged_path(key)
+    return f"{staged}{index_suffix(staged)}"
+
+
+def get_cold_storage() -> str:
+    """
+    This function returns the cold storage mount points, as a quoted and
+    space separated string for the staging command line.
+    """
+    return " ".join(
+        shlex.quote(mount)
+        for mount in config.get("cold_storage", [])
+        if mount.strip()
+    )
+
+
+def get_staging_batches() -> List[List[str]]:
+    """
+    This function groups the samples in batches staged by a single job,
+    when a staging batch size is provided. It returns a list of batches:
+
+    [[sample1_N, sample1_T, sample2_N, sample2_T], ...]
+
+    An empty list means one staging job per sample.
+    """
+    batch_size = config.get("staging_batch_size", 1)
+    if batch_size <= 1:
+        return []
+
+    samples = list(design["Sample_id"])
+    return [
+        [
+            f"{sample}_{kind}"
+            for sample in samples[start:start + batch_size]
+            for kind in ["N", "T"]
+            if f"{sample}_{kind}" in bam_path_dict
+        ]
+        for start in range(0, len(samples), batch_size)
+    ]
+
+
+def get_staged_size(sample: str) -> int:
+    """
+    This function returns the number of bytes written in the working
+    directory when a bam file and its index are staged: their size when
+    they are copied, nothing when they are linked. Shared normal bams
+    only count for the first sample using them.
+    """
+    if sample not in bam_path_dict:
+        return 0
+    method = config.get("staging_method", "auto")
+    size = 0
+    for path in [Path(bam_path_dict[sample]), Path(bai_path_dict[sample])]:
+        copied = method == "copy" or (
+            method == "auto" and is_cold(path, config.get("cold_storage", []))
+        )
+        if copied and path.exists():
+            size += path.stat().st_size
+    return size
+
+
+def get_scratch_gates() -> Dict[str, str]:
+    """
+    This function bounds the disk space used by staged bam files. Samples
+    are staged in design order, and a sample (or batch of samples) is only
+    staged once msi is over for all previous samples that would not fit in
+    the scratch budget alongside with it. It returns a dictionnary:
+
+    {sample: last sample which msi must be over before staging, ...}
+    """
+    budget = config.get("scratch_budget", 0) * 1024 ** 3
+    if budget <= 0:
+        return {}
+
+    samples = list(design["Sample_id"])
+    if staging_batches:
+        units = [
+            list(dict.fromkeys(key[:-len("_N")] for key in batch))
+            for batch in staging_batches
+        ]
+    else:
+        units = [[sample] for sample in samples]
+    sizes = [
+        sum(get_staged_size(f"{s}_{k}") for s in unit for k in ["N", "T"])
+        for unit in units
+    ]
+
+    gates = {}
+    start = total = 0
+    for index, unit in enumerate(units):
+        total += sizes[index]
+        while total > budget and start < index:
+            total -= sizes[start]
+            start += 1
+        if total > budget:
+            logger.warning(
+                f"{', '.join(unit)} alone does not fit in the scratch budget"
+            )
+        if start > 0:
+            gates.update({sample: units[start - 1][-1] for sample in unit})
+    return gates
+
+
+def get_scratch_gate_w(wildcards: Any) -> Dict[str, str]:
+    """
+    This function returns the gate of a staged sample, when a scratch
+    budget is provided, as a dictionnary: {gate: path}
+    """
+    sample = wildcards.sample[:-len("_N")]
+    if sample not in scratch_gates:
+        return {}
+    return {"gate": f"msisensor/gates/{scratch_gates[sample]}"}
+
+
+def get_previous_gate_w(wildcards: Any) -> List[str]:
+    """
+    This function returns the gate of the previous sample, in design order,
+    so that a gate is open only once msi is over for all previous samples
+    """
+    samples = list(design["Sample_id"])
+    index = samples.index(wildcards.sample)
+    if index == 0:
+        return []
+    return [f"msisensor/gates/{samples[index - 1]}"]
+
+
 def get_bam_pairs() -> Dict[str, Dict[str, str]]:
     """
     This function gives the correspondancy between sample id and bam pairs.
@@ -66,13 +272,67 @@ def get_bam_pairs() -> Dict[str, Dict[str, str]]:
     """
     return {
         sample: {
-            "normal": f"raw_data/{sample}_N.bam",
-            "tumor": f"raw_data/{sample}_T.bam"
+            "normal": get_staged_path(normal_keys[sample]),
+            "tumor": get_staged_path(f"{sample}_T")
         }
         for sample in design["Sample_id"]
     }
 
 
+def get_contig_index() -> Optional[Path]:
+    """
+    This function returns the path to the contig index built at
+    configuration time, if any.
+    """
+    contig_index = Path(config.get("contig_index", ""))
+    if config.get("contig_index") and contig_index.exists():
+        return contig_index
+    return None
+
+
+def get_contig_lengths() -> Dict[str, int]:
+    """
+    This function returns the length of each contig of the reference, in
+    fasta order, from the contig index or the fasta index.
+    """
+    contig_index = get_contig_index()
+    if contig_index is not None:
+        return read_contigs(contig_index)
+    fai = config.get("fasta_index")
+    return {
+        entry.name: entry.length
+        for entry in load_fai(Path(config["fasta"]), fai and Path(fai))
+    }
+
+
+def get_preflight_w(wildcards: Any) -> Dict[str, str]:
+    """
+    This function returns the pre-flight report, when pre-flight checks are
+    required, as a dictionnary: {preflight: path}. Every msi job waits for
+    it, so that bam files are checked once, before any analysis.
+    """
+    if config.get("preflight", False) is not True:
+        return {}
+    return {"preflight": "msisensor/preflight.tsv"}
+
+
+def get_design_stamp_w(wildcards: Any) -> Dict[str, str]:
+    """
+    This function returns the design manifest of a given sample, in
+    incremental mode, as a dictionnary: {manifest: path}. This manifest is
+    rewritten only when the sample bam files change, forcing a new run.
+    Samples which outputs do not exist yet are processed in any case.
+    """
+    if config.get("incremental", False) is not True:
+        return {}
+
+    manifest_dir = Path(f"{config['design']}.manifest")
+    manifest = manifest_dir / f"{wildcards.sample}.tsv"
+    if not manifest.exists():
+        return {}
+    return {"manifest": str(manifest.absolute())}
+
+
 def get_bam_pair_w(wildcards: Any) -> Dict[str, Dict[str, str]]:
     """
     This function returns a single pair of normal/tumor bams from a given
@@ -89,36 +349,380 @@ def get_bam_index_pairs_w(wildcards: Any) -> Dict[str, Dict[str, str]]:
     {normal: bam_normal, tumor: bam_tumor}
     """
     return {
-        f"{k}_idx": f"{v}.bai"
+        f"{k}_idx": f"{v}{index_suffix(v)}"
         for k, v in bam_pairs_dict[wildcards.sample].items()
     }
 
 
-def get_target_dict() -> Dict[str, Any]:
+def get_native_pair_w(wildcards: Any) -> Dict[str, str]:
+    """
+    This function returns the inputs of the native msi engine for a given
+    sample id: the profile of its normal bam, counted once for all tumors
+    sharing it, and its tumor bam, as a dictionnary:
+    {normal: normal_profile, tumor: bam_tumor, tumor_idx: bai_tumor}
+    """
+    tumor = bam_pairs_dict[wildcards.sample]["tumor"]
+    return {
+        "normal": f"msisensor/normal/{normal_keys[wildcards.sample]}.profile",
+        "tumor": tumor,
+        "tumor_idx": f"{tumor}{index_suffix(tumor)}"
+    }
+
+
+def get_native_msi() -> bool:
+    """
+    This function tells whether repeats are counted by the native engine:
+    when required in the configuration, or when the design holds cram
+    files, which MSISensor msi can not read.
+    """
+    if config.get("native_msi", False) is True:
+        return True
+    crams = [path for path in bam_path_dict.values() if is_cram(path)]
+    if crams:
+        logger.info(
+            f"{len(crams)} cram files in the design: MSI is scored by the"
+            " native engine"
+        )
+    return len(crams) > 0
+
+
+def get_msi_shards() -> List[str]:
+    """
+    This function returns the list of region shards used to scatter
+    msisensor msi. A single shard means no scattering at all. The native
+    engine is never scattered: it distributes sites over its own pool of
+    processes.
+    """
+    if native_msi:
+        return ["0"]
+    return [str(shard) for shard in range(config.get("scatter", 1))]
+
+
+def get_msi_threads(rule_name: str) -> int:
+    """
+    This function returns the number of threads of a msi job: msisensor msi
+    does not scale beyond 8 threads, the native engine uses all of them.
+    """
+    if rule_name == "msi_native":
+        return config["threads"]
+    return min(config["threads"], 8)
+
+
+def get_msi_thresholds() -> str:
+    """
+    This function returns the coverage and FDR options (-c and -f) given
+    to msisensor msi in its extra parameters, so that gathered shards are
+    scored with the same thresholds.
+    """
+    extra = shlex.split(config["params"].get("msi_extra", ""))
+    return " ".join(
+        f"{option} {value}"
+        for option, value in zip(extra, extra[1:])
+        if option in ["-c", "-f"]
+    )
+
+
+def get_msi_shards_w(wildcards: Any) -> Dict[str, List[str]]:
+    """
+    This function returns all msisensor msi shard results of a given
+    sample, in genome order, as a dictionnary:
+    {msi_scores: [shard1, ...], read_count: [shard1_dis, ...], ...}
+    """
+    prefixes = expand(
+        "msisensor/shards/{sample}/{shard}",
+        sample=wildcards.sample,
+        shard=msi_shards
+    )
+    return {
+        "msi_scores": prefixes,
+        "read_count": [f"{prefix}_dis" for prefix in prefixes],
+        "somatic_sites": [f"{prefix}_somatic" for prefix in prefixes],
+        "germline_sites": [f"{prefix}_germline" for prefix in prefixes]
+    }
+
+
+def get_scan_path() -> str:
+    """
+    This function returns the path to the homopolymers and microsatellites
+    list. When a scan cache directory is provided, the scan is searched in
+    that cache (keyed on the fasta content and scan parameters), and
+    produced there if missing.
+    """
+    if not config.get("scan_cache_dir"):
+        return "msisensor/scan/homopolymers_micosats.msi"
+
+    cache_dir = Path(config["scan_cache_dir"])
+    scanner = "native" if config.get("native_scan", False) else "msisensor"
+    key = scan_key(
+        Path(config["fasta"]),
+        cache_dir,
+        f"{scanner} {config['params'].get('msi_scan_extra', '')}"
+    )
+    return str(cached_scan(cache_dir, key))
+
+
+def get_scan_output() -> Any:
+    """
+    This function returns the output of the scan: a temporary file, unless
+    it is stored in the scan cache.
+    """
+    if config.get("scan_cache_dir"):
+        return scan_path
+    return temp(scan_path)
+
+
+def get_sites_path() -> str:
+    """
+    This function returns the path to the list of sites analysed by
+    msisensor msi: the whole scan, or only the sites overlapping the
+    targeted regions (panel mode) when a BED file is provided.
+    """
+    if config.get("regions"):
+        return "msisensor/scan/regions.msi"
+    return scan_path
+
+
+def get_sites(name: str) -> str:
+    """
+    This function returns the path to the list of sites analysed for a
+    sample (or a normal bam): when a pruning depth is provided, only the
+    sites which may reach this depth in its bam files, according to their
+    indexes. Region shards (scatter) are shared by all samples, and are not
+    pruned. Neither are the sites of cram files: cram indexes do not count
+    reads. A normal bam, and all the samples sharing it, are left unpruned
+    as soon as one of their bam files is a cram file, so that the profile
+    of the normal bam covers the sites of each sample.
+    """
+    if config.get("prune_depth", 0) <= 0:
+        return sites_path
+    normal = normal_keys[name] if name in bam_pairs_dict else name
+    if normal in unpruned_normals:
+        return sites_path
+    return f"msisensor/sites/{name}.msi"
+
+
+def get_prune_keys(name: str) -> List[str]:
+    """
+    This function returns the keys (in bam_path_dict) of the bam files a
+    list of sites is pruned on: those of a sample (normal and tumor), or
+    a normal bam shared by several samples.
+    """
+    if name in bam_pairs_dict:
+        return [normal_keys[name], f"{name}_T"]
+    return [name]
+
+
+def get_prune_inputs_w(wildcards: Any) -> Dict[str, List[str]]:
     """
-    This function calls all important output
+    This function returns the original bam files and indexes used to prune
+    the sites of a sample (its normal and tumor bams), or of a normal bam
+    shared by several samples, as a dictionnary:
+    {bams: [bam, ...], bais: [bai, ...]}
     """
+    keys = get_prune_keys(wildcards.name)
     return {
-        "msi_scores": expand(
-            "msisensor/msi/{sample}",
-            sample=bam_pairs_dict.keys()
-        ),
-        "read_count": expand(
-            "msisensor/msi/{sample}_dis",
-            sample=bam_pairs_dict.keys()
-        ),
-        "somatic_sites": expand(
-            "msisensor/msi/{sample}_somatic",
-            sample=bam_pairs_dict.keys()
-        ),
-        "germline_sites": expand(
-            "msisensor/msi/{sample}_germline",
-            sample=bam_pairs_dict.keys()
+        "bams": [bam_path_dict[key] for key in keys],
+        "bais": [bai_path_dict[key] for key in keys]
+    }
+
+
+def get_sites_estimate() -> float:
+    """
+    This function estimates the number of sites analysed by msisensor msi,
+    in millions. In panel mode, and before the first run, it is scaled by
+    the fraction of the genome covered by the targeted regions.
+    """
+    fraction = 1.0
+    if config.get("regions"):
+        genome = sum(get_contig_lengths().values())
+        covered = regions_span(read_bed(Path(config["regions"])))
+        fraction = min(covered / max(genome, 1), 1.0)
+    return estimate_sites(
+        Path(config.get("workdir", os.getcwd())) / sites_path,
+        Path(config["fasta"]),
+        fraction
+    )
+
+
+def evict_scan_cache() -> None:
+    """
+    This function removes the least recently used scans from the cache,
+    until it fits in the configured size.
+    """
+    if config.get("scan_cache_dir"):
+        evict_scans(
+            Path(config["scan_cache_dir"]),
+            int(config.get("scan_cache_max_size", 50) * 1024 ** 3),
+            keep=[Path(scan_path)]
         )
+
+
+def get_pair_size_gb(sample: str) -> float:
+    """
+    This function returns the size of the normal and tumor bam files of a
+    sample, in GB. Missing files count for nothing.
+    """
+    size = 0
+    for key in [normal_keys[sample], f"{sample}_T"]:
+        path = Path(bam_path_dict[key])
+        if path.exists():
+            size += path.stat().st_size
+    return size / 1024 ** 3
+
+
+def get_observations() -> List[Observation]:
+    """
+    This function reads the benchmarks of samples still in the design, as
+    observations of the resource models.
+    """
+    benchmarks = Path(config.get("workdir", os.getcwd())) / "benchmarks"
+    observations = []
+    for rule_name in priors:
+        shards = len(msi_shards) if rule_name == "msi_shard" else 1
+        paths = sorted((benchmarks / rule_name).glob("*.tsv"))
+        for benchmark_path in paths:
+            name = benchmark_path.name[:-len(".tsv")]
+            sample = name if shards == 1 else name.rsplit(".", 1)[0]
+            measures = read_benchmark(benchmark_path)
+            if sample not in bam_pairs_dict or measures is None:
+                continue
+            observations.append(Observation(
+                rule_name, name, benchmark_path.stat().st_mtime_ns,
+                get_pair_size_gb(sample), scan_sites_m / shards,
+                get_msi_threads(rule_name),
+                *measures
+            ))
+    return observations
+
+
+def get_resource_models() -> Dict[str, Any]:
+    """
+    This function learns the memory and walltime models of msisensor msi
+    from the benchmarks of previous runs: a model is fitted for each rule
+    on the history file, and the benchmarks of samples still in the design.
+    The history file is only read here (see update_resource_history). It
+    returns a dictionnary:
+
+    {rule: ResourceModel, ...}
+    """
+    history = load_history(history_path)
+    merge_observations(history, get_observations())
+    return {
+        rule_name: fit(
+            [obs for obs in history.values() if obs.rule == rule_name],
+            prior
+        )
+        for rule_name, prior in priors.items()
     }
 
 
-fasta_path = f"genome/{os.path.basename(config['fasta'])}"
+def update_resource_history() -> None:
+    """
+    This function adds the benchmarks of samples still in the design to the
+    history file, so that they survive the removal of samples. It is only
+    called by the main Snakemake process, once the pipeline succeeded, and
+    not by every job parsing the Snakefile.
+    """
+    if update_history(history_path, get_observations()) > 0:
+        logger.info(f"Resource history updated: {history_path}")
+
+
+def get_resources(rule_name: str,
+                  sample: str,
+                  attempt: int,
+                  maximum: Dict[str, int]) -> Dict[str, int]:
+    """
+    This function predicts the memory (MB) and walltime (minutes) of a
+    msisensor msi job, from the size of its bam files, the number of sites
+    it scans, and its threads. It returns a dictionnary:
+
+    {mem_mb: memory, time_min: walltime}
+    """
+    shards = len(msi_shards) if rule_name == "msi_shard" else 1
+    return predict(
+        resource_models[rule_name],
+        get_pair_size_gb(sample),
+        scan_sites_m / shards,
+        get_msi_threads(rule_name),
+        attempt,
+        maximum
+    )
+
+
+def get_sample_outputs(patterns: Dict[str, str],
+                       samples: List[str]) -> Dict[str, List[str]]:
+    """
+    This function returns the outputs of each sample, for each pattern, as
+    a dictionnary: {key: [pattern of sample1, ...], ...}. Patterns are
+    formatted directly, which is much cheaper than expand() on large
+    cohorts.
+    """
+    return {
+        key: [pattern.format(sample=sample) for sample in samples]
+        for key, pattern in patterns.items()
+    }
+
+
+def get_cohort_inputs_w(wildcards: Any) -> Dict[str, List[str]]:
+    """
+    This function returns the msisensor msi results of all samples of the
+    design, as a dictionnary:
+    {msi_scores: [sample1, ...], somatic_sites: [...], ...}
+    """
+    return get_sample_outputs(
+        {
+            key: target_patterns[key]
+            for key in ["msi_scores", "somatic_sites", "germline_sites"]
+        },
+        list(bam_pairs_dict)
+    )
+
+
+def get_targets_w(wildcards: Any) -> Dict[str, Any]:
+    """
+    This function calls all important output. Being an input function,
+    target lists are built along with the DAG, and not while the pipeline
+    is parsed.
+    """
+    return {
+        **get_sample_outputs(target_patterns, list(design["Sample_id"])),
+        "cohort": "msisensor/cohort/scores.tsv",
+        "performance": "msisensor/performance/rules.tsv"
+    }
+
+
+def get_performance_inputs_w(wildcards: Any) -> Dict[str, Any]:
+    """
+    This function returns all outputs but the performance tables, so that
+    they are aggregated once all other jobs are over.
+    """
+    targets = get_targets_w(wildcards)
+    targets.pop("performance")
+    return targets
+
+
+target_patterns = {
+    "msi_scores": "msisensor/msi/{sample}",
+    "read_count": "msisensor/msi/{sample}_dis",
+    "somatic_sites": "msisensor/msi/{sample}_somatic",
+    "germline_sites": "msisensor/msi/{sample}_germline",
+    "read_count_store": "msisensor/store/{sample}",
+    "rescored": "msisensor/rescore/{sample}"
+}
+fasta_path = config["fasta"]
+normal_keys = get_normal_keys()
 bam_path_dict = get_bam_from_path()
+bai_path_dict = get_bai_from_path()
+staging_batches = get_staging_batches()
+scratch_gates = get_scratch_gates()
 bam_pairs_dict = get_bam_pairs()
-target_dict = get_target_dict()
+unpruned_normals = cram_normals(normal_keys, bam_path_dict)
+native_msi = get_native_msi()
+msi_shards = get_msi_shards()
+scan_path = get_scan_path()
+sites_path = get_sites_path()
+scan_sites_m = get_sites_estimate()
+history_path = (
+    Path(config.get("workdir", os.getcwd())) / "benchmarks" / "resources.tsv"
+)
+resource_models = get_resource_models()
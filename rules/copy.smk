@@ -1,96 +1,172 @@
-"""
-This rule copies or soft links the bam files. It handles cold/hot storages
-issues on a cluster. More information at:
-https://github.com/tdayris/snakemake-wrappers/tree/Unofficial/bio/cp
-"""
-rule copy_bams:
-    input:
-        lambda wildcards: bam_path_dict[wildcards.sample]
-    output:
-        temp("raw_data/{sample}.bam")
-    message:
-        "Copy/soft-link {wildcards.sample}"
-    threads:
-        1
-    resources:
-        mem_mb = (
-            lambda wildcards, attempt: min(attempt * 256, 512)
-        ),
-        time_min = (
-            lambda wildcards, attempt: min(attempt * 45, 180)
-        )
-    log:
-        "logs/cp/{sample}.logs"
-    params:
-        extra = config["params"].get(
-            "copy_extra",
-            "--verbose"
-        ),
-        cold_storage = config.get(
-            "cold_storage",
-            [" "]
-        )
-    wrapper:
-        f"{my_snw}/bio/cp"
+if staging_batches:
+    for batch, staged in enumerate(staging_batches):
+        """
+        These rules stage the bam files and indexes of a batch of samples in
+        a single job, with a pool of threads. Copies out of cold storage
+        share a bandwidth limit per mount point.
+        """
+        rule:
+            input:
+                files = [
+                    path for sample in staged
+                    for path in [bam_path_dict[sample], bai_path_dict[sample]]
+                ],
+                gate = [
+                    f"msisensor/gates/{scratch_gates[sample[:-len('_N')]]}"
+                    for sample in staged[:1]
+                    if sample[:-len("_N")] in scratch_gates
+                ]
+            output:
+                temp([
+                    path for sample in staged
+                    for path in [
+                        get_staged_path(sample),
+                        get_staged_index(sample)
+                    ]
+                ])
+            message:
+                f"Staging batch {batch} ({len(staged)} bam files)"
+            threads:
+                config.get("staging_concurrency", 4)
+            resources:
+                mem_mb = (
+                    lambda wildcards, attempt: min(attempt * 512, 2048)
+                ),
+                time_min = (
+                    lambda wildcards, attempt: min(attempt * 120, 720)
+                ),
+                scratch_mb = sum(
+                    get_staged_size(sample) for sample in staged
+                ) // 1024 ** 2
+            log:
+                f"logs/stage/batch.{batch}.logs"
+            benchmark:
+                f"benchmarks/stage_batch/{batch}.tsv"
+            params:
+                cold_storage = get_cold_storage(),
+                method = config.get("staging_method", "auto"),
+                bandwidth = config.get("staging_bandwidth", 0)
+            conda:
+                "../envs/py3.yaml"
+            shell:
+                "python3 {workflow.basedir}/scripts/stage.py"
+                " -i {input.files} -o {output}"
+                " --cold-storage {params.cold_storage} -m {params.method}"
+                " -c {threads} -b {params.bandwidth} > {log} 2>&1"
+else:
+    """
+    This rule stages the bam file of a sample and its index in a single job,
+    with the cheapest method for each file: hard/soft links, or reflinks and
+    in-kernel copies for files on cold storage.
+    """
+    localrules: stage_bam
 
+    rule stage_bam:
+        input:
+            unpack(get_scratch_gate_w),
+            bam = lambda wildcards: bam_path_dict[wildcards.sample],
+            bai = lambda wildcards: bai_path_dict[wildcards.sample]
+        output:
+            bam = temp("raw_data/{sample}.bam"),
+            bai = temp("raw_data/{sample}.bam.bai")
+        message:
+            "Staging {wildcards.sample}"
+        threads:
+            1
+        resources:
+            mem_mb = (
+                lambda wildcards, attempt: min(attempt * 256, 512)
+            ),
+            time_min = (
+                lambda wildcards, attempt: min(attempt * 45, 180)
+            ),
+            scratch_mb = (
+                lambda wildcards:
+                    get_staged_size(wildcards.sample) // 1024 ** 2
+            )
+        log:
+            "logs/stage/{sample}.logs"
+        benchmark:
+            "benchmarks/stage_bam/{sample}.tsv"
+        wildcard_constraints:
+            sample = r"[^/]+"
+        params:
+            cold_storage = get_cold_storage(),
+            method = config.get("staging_method", "auto")
+        conda:
+            "../envs/py3.yaml"
+        shell:
+            "python3 {workflow.basedir}/scripts/stage.py"
+            " -i {input.bam} {input.bai} -o {output.bam} {output.bai}"
+            " --cold-storage {params.cold_storage} -m {params.method}"
+            " > {log} 2>&1"
 
-rule copy_bam_indexes:
-    input:
-        lambda wildcards: f"{bam_path_dict[wildcards.sample]}.bai"
-    output:
-        temp("raw_data/{sample}.bam.bai")
-    message:
-        "Copy/soft-link {wildcards.sample}"
-    threads:
-        1
-    resources:
-        mem_mb = (
-            lambda wildcards, attempt: min(attempt * 256, 512)
-        ),
-        time_min = (
-            lambda wildcards, attempt: min(attempt * 45, 180)
-        )
-    log:
-        "logs/cp/{sample}.logs"
-    params:
-        extra = config["params"].get(
-            "copy_extra",
-            "--verbose"
-        ),
-        cold_storage = config.get(
-            "cold_storage",
-            [" "]
-        )
-    wrapper:
-        f"{my_snw}/bio/cp"
 
+    """
+    This rule stages the cram file of a sample and its index, as stage_bam
+    does for bam files: cram files are never decompressed to bam, only
+    their (smaller) compressed content is moved.
+    """
+    localrules: stage_cram
 
-rule copy_ref:
-    input:
-        config["fasta"]
-    output:
-        temp(fasta_path)
-    message:
-        "Copy/soft-link fasta-formatted reference"
-    threads:
-        1
-    resources:
-        mem_mb = (
-            lambda wildcards, attempt: min(attempt * 256, 512)
-        ),
-        time_min = (
-            lambda wildcards, attempt: min(attempt * 45, 180)
-        )
-    log:
-        "logs/cp/fasta.logs"
-    params:
-        extra = config["params"].get(
-            "copy_extra",
-            "--verbose"
-        ),
-        cold_storage = config.get(
-            "cold_storage",
-            [" "]
-        )
-    wrapper:
-        f"{my_snw}/bio/cp"
+    rule stage_cram:
+        input:
+            unpack(get_scratch_gate_w),
+            cram = lambda wildcards: bam_path_dict[wildcards.sample],
+            crai = lambda wildcards: bai_path_dict[wildcards.sample]
+        output:
+            cram = temp("raw_data/{sample}.cram"),
+            crai = temp("raw_data/{sample}.cram.crai")
+        message:
+            "Staging {wildcards.sample}"
+        threads:
+            1
+        resources:
+            mem_mb = (
+                lambda wildcards, attempt: min(attempt * 256, 512)
+            ),
+            time_min = (
+                lambda wildcards, attempt: min(attempt * 45, 180)
+            ),
+            scratch_mb = (
+                lambda wildcards:
+                    get_staged_size(wildcards.sample) // 1024 ** 2
+            )
+        log:
+            "logs/stage/{sample}.logs"
+        benchmark:
+            "benchmarks/stage_cram/{sample}.tsv"
+        wildcard_constraints:
+            sample = r"[^/]+"
+        params:
+            cold_storage = get_cold_storage(),
+            method = config.get("staging_method", "auto")
+        conda:
+            "../envs/py3.yaml"
+        shell:
+            "python3 {workflow.basedir}/scripts/stage.py"
+            " -i {input.cram} {input.crai} -o {output.cram} {output.crai}"
+            " --cold-storage {params.cold_storage} -m {params.method}"
+            " > {log} 2>&1"
+
+
+if scratch_gates:
+    """
+    This rule opens the gate of a sample once msi is over for this sample
+    and all previous ones (in design order). Staging jobs wait for these
+    gates, so that staged bam files never exceed the scratch budget.
+    """
+    localrules: scratch_gate
+
+    rule scratch_gate:
+        input:
+            msi = "msisensor/msi/{sample}",
+            previous = get_previous_gate_w
+        output:
+            touch("msisensor/gates/{sample}")
+        message:
+            "Releasing scratch space of {wildcards.sample}"
+        threads:
+            1
+        wildcard_constraints:
+            sample = r"[^/]+"
@@ -0,0 +1,76 @@
+"""
+This rule converts the read count distributions of a sample into a
+compact columnar store (memory-mapped NumPy arrays), used by any
+downstream analysis.
+"""
+rule dis_store:
+    input:
+        "msisensor/msi/{sample}_dis"
+    output:
+        directory("msisensor/store/{sample}")
+    message:
+        "Storing read count distributions of {wildcards.sample}"
+    threads:
+        1
+    resources:
+        mem_mb = (
+            lambda wildcards, attempt: min(attempt * 1024, 4096)
+        ),
+        time_min = (
+            lambda wildcards, attempt: min(attempt * 30, 120)
+        )
+    log:
+        "logs/store/{sample}.logs"
+    benchmark:
+        "benchmarks/dis_store/{sample}.tsv"
+    wildcard_constraints:
+        sample = r"[^/]+"
+    conda:
+        "../envs/py3.yaml"
+    shell:
+        "python3 {workflow.basedir}/scripts/dis_store.py"
+        " {input} {output} > {log} 2>&1"
+
+
+"""
+This rule re-scores MSI out of the stored read count distributions, with
+vectorized tests, so that thresholds can be changed (or swept) without
+reading the bam files again.
+"""
+rule rescore:
+    input:
+        "msisensor/store/{sample}"
+    output:
+        msi_scores = report(
+            "msisensor/rescore/{sample}",
+            caption="../report/rescore.rst",
+            category="MSI",
+            subcategory="Re-scored"
+        ),
+        somatic_sites = "msisensor/rescore/{sample}_somatic",
+        sweep = "msisensor/rescore/{sample}_sweep.tsv"
+    message:
+        "Re-scoring {wildcards.sample} out of stored distributions"
+    threads:
+        1
+    resources:
+        mem_mb = (
+            lambda wildcards, attempt: min(attempt * 2048, 8192)
+        ),
+        time_min = (
+            lambda wildcards, attempt: min(attempt * 15, 60)
+        )
+    log:
+        "logs/rescore/{sample}.logs"
+    benchmark:
+        "benchmarks/rescore/{sample}.tsv"
+    wildcard_constraints:
+        sample = r"[^/]+"
+    params:
+        extra = config["params"].get("rescore_extra", ""),
+        prefix = (lambda w: f"msisensor/rescore/{w.sample}")
+    conda:
+        "../envs/py3.yaml"
+    shell:
+        "python3 {workflow.basedir}/scripts/rescore.py"
+        " {input} {params.prefix} {params.extra} > {log} 2>&1"
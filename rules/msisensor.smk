@@ -7,7 +7,7 @@ rule msi_scan:
     input:
         fasta_path
     output:
-        temp("msisensor/scan/homopolymers_micosats.msi")
+        get_scan_output()
     message:
         "Scanning homopolymers and microsatellites"
     threads:
@@ -21,11 +21,128 @@ rule msi_scan:
         )
     log:
         "logs/msisensor/scan.logs"
+    benchmark:
+        "benchmarks/msi_scan/scan.tsv"
     params:
         extra = config["params"].get("msi_scan_extra", "")
     wrapper:
         f"{swv}/bio/msisensor/scan"
 
+
+if config.get("native_scan", False) is True:
+    """
+    This rule scans a fasta file and searches homopolymers and
+    microsatellites, with a pool of processes (one contig per process).
+    Its output has the same format as MSISensor scan.
+    """
+    rule msi_scan_native:
+        input:
+            fasta_path
+        output:
+            get_scan_output()
+        message:
+            "Scanning homopolymers and microsatellites (native scanner)"
+        threads:
+            config["threads"]
+        resources:
+            mem_mb = (
+                lambda wildcards, attempt: min(attempt * 2048, 10240)
+            ),
+            time_min = (
+                lambda wildcards, attempt: min(attempt * 30, 180)
+            )
+        log:
+            "logs/msisensor/scan.logs"
+        benchmark:
+            "benchmarks/msi_scan_native/scan.tsv"
+        params:
+            fai = (
+                f"--fai {config['fasta_index']}"
+                if config.get("fasta_index") else ""
+            ),
+            extra = config["params"].get("msi_scan_extra", "")
+        conda:
+            "../envs/py3.yaml"
+        shell:
+            "python3 {workflow.basedir}/scripts/msi_scan.py {input}"
+            " -o {output} -t {threads} {params.fai} {params.extra}"
+            " > {log} 2>&1"
+
+
+    ruleorder: msi_scan_native > msi_scan
+
+
+if config.get("regions"):
+    """
+    This rule restricts the homopolymers and microsatellites list to the
+    sites overlapping the targeted regions of a BED file (panel mode).
+    """
+    rule filter_regions:
+        input:
+            scan = scan_path,
+            regions = config["regions"]
+        output:
+            temp(sites_path)
+        message:
+            "Restricting homopolymers and microsatellites to targeted regions"
+        threads:
+            1
+        resources:
+            mem_mb = (
+                lambda wildcards, attempt: min(attempt * 512, 2048)
+            ),
+            time_min = (
+                lambda wildcards, attempt: min(attempt * 15, 60)
+            )
+        log:
+            "logs/msisensor/filter_regions.logs"
+        benchmark:
+            "benchmarks/filter_regions/regions.tsv"
+        conda:
+            "../envs/py3.yaml"
+        shell:
+            "python3 {workflow.basedir}/scripts/filter_regions.py"
+            " {input.scan} {input.regions} -o {output} > {log} 2>&1"
+
+if config.get("prune_depth", 0) > 0:
+    """
+    This rule removes the sites which can not reach the pruning depth in
+    the bam files of a sample (or in a shared normal bam), estimated from
+    their indexes without decompressing any read.
+    """
+    rule prune_sites:
+        input:
+            unpack(get_prune_inputs_w),
+            scan = sites_path
+        output:
+            temp("msisensor/sites/{name}.msi")
+        message:
+            "Pruning sites of {wildcards.name} on estimated depth"
+        threads:
+            1
+        resources:
+            mem_mb = (
+                lambda wildcards, attempt: min(attempt * 512, 2048)
+            ),
+            time_min = (
+                lambda wildcards, attempt: min(attempt * 15, 60)
+            )
+        log:
+            "logs/msisensor/prune_sites/{name}.logs"
+        benchmark:
+            "benchmarks/prune_sites/{name}.tsv"
+        wildcard_constraints:
+            name = r"[^/]+"
+        params:
+            depth = config.get("prune_depth", 0)
+        conda:
+            "../envs/py3.yaml"
+        shell:
+            "python3 {workflow.basedir}/scripts/prune_sites.py {input.scan}"
+            " -b {input.bams} -i {input.bais} -o {output}"
+            " -m {params.depth} > {log} 2>&1"
+
+
 """
 This rule scans both tumor and normal bam pairs in search for msi
 More information at: https://github.com/ding-lab/msisensor
@@ -34,7 +151,9 @@ rule msi:
     input:
         unpack(get_bam_pair_w),
         unpack(get_bam_index_pairs_w),
-        microsat = "msisensor/scan/homopolymers_micosats.msi"
+        unpack(get_design_stamp_w),
+        unpack(get_preflight_w),
+        microsat = lambda wildcards: get_sites(wildcards.sample)
     output:
         msi_scores = report(
             "msisensor/msi/{sample}",
@@ -65,13 +184,21 @@ rule msi:
         min(config["threads"], 8)
     resources:
         mem_mb = (
-            lambda wildcards, attempt: min(attempt * 8192, 20480)
+            lambda wildcards, attempt: get_resources(
+                "msi", wildcards.sample, attempt,
+                {"mem_mb": 20480, "time_min": 380}
+            )["mem_mb"]
         ),
         time_min = (
-            lambda wildcards, attempt: min(attempt * 40, 380)
+            lambda wildcards, attempt: get_resources(
+                "msi", wildcards.sample, attempt,
+                {"mem_mb": 20480, "time_min": 380}
+            )["time_min"]
         )
     log:
         "logs/msisensor/msi/{sample}.logs"
+    benchmark:
+        "benchmarks/msi/{sample}.tsv"
     wildcard_constraints:
         sample = r"[^/]+"
     params:
@@ -79,3 +206,273 @@ rule msi:
         prefix = (lambda w: f"msisensor/msi/{w.sample}")
     wrapper:
         f"{swv}/bio/msisensor/msi"
+
+
+if native_msi:
+    """
+    This rule counts repeat lengths in a normal bam file, once, reading only
+    the reads overlapping each site (through the bam index). The profile is
+    shared by all tumors of this normal. Cram files are decoded against the
+    reference fasta file.
+    """
+    rule msi_normal:
+        input:
+            unpack(get_preflight_w),
+            bam = lambda wildcards: get_staged_path(wildcards.normal),
+            bai = lambda wildcards: get_staged_index(wildcards.normal),
+            microsat = lambda wildcards: get_sites(wildcards.normal)
+        output:
+            "msisensor/normal/{normal}.profile"
+        message:
+            "Counting repeats of the normal sample {wildcards.normal}"
+        threads:
+            get_msi_threads("msi_native")
+        resources:
+            mem_mb = (
+                lambda wildcards, attempt: min(attempt * 2048, 20480)
+            ),
+            time_min = (
+                lambda wildcards, attempt: min(attempt * 60, 380)
+            )
+        log:
+            "logs/msisensor/normal/{normal}.logs"
+        benchmark:
+            "benchmarks/msi_normal/{normal}.tsv"
+        wildcard_constraints:
+            normal = r"[^/]+_N"
+        params:
+            reference = fasta_path,
+            extra = config["params"].get("msi_native_extra", "")
+        conda:
+            "../envs/py3.yaml"
+        shell:
+            "python3 {workflow.basedir}/scripts/msi_count.py"
+            " {input.microsat} {input.bam} -r {params.reference}"
+            " -o {output} -t {threads} {params.extra} > {log} 2>&1"
+
+
+    """
+    This rule counts repeat lengths in a tumor bam file, reading only the
+    reads overlapping each site (through the bam index), with a pool of
+    processes, and scores it against the profile of its normal. It scores
+    MSI as MSISensor msi does, and its outputs have the same format. It is
+    always used for cram files, which MSISensor msi can not read.
+    """
+    rule msi_native:
+        input:
+            unpack(get_native_pair_w),
+            unpack(get_design_stamp_w),
+            unpack(get_preflight_w),
+            microsat = lambda wildcards: get_sites(wildcards.sample)
+        output:
+            msi_scores = report(
+                "msisensor/msi/{sample}",
+                caption="../report/msi.rst",
+                category="MSI",
+                subcategory="Complete"
+            ),
+            read_count = report(
+                "msisensor/msi/{sample}_dis",
+                caption="../report/read_count.rst",
+                category="Read Count"
+            ),
+            somatic_sites = report(
+                "msisensor/msi/{sample}_somatic",
+                caption="../report/somatic.rst",
+                subcategory="Somatic",
+                category="MSI"
+            ),
+            germline_sites = report(
+                "msisensor/msi/{sample}_germline",
+                caption="../report/germline.rst",
+                subcategory="Germline",
+                category="MSI"
+            )
+        message:
+            "Counting repeats of {wildcards.sample} in search for MSI"
+            " (native engine)"
+        threads:
+            get_msi_threads("msi_native")
+        resources:
+            mem_mb = (
+                lambda wildcards, attempt: get_resources(
+                    "msi_native", wildcards.sample, attempt,
+                    {"mem_mb": 20480, "time_min": 380}
+                )["mem_mb"]
+            ),
+            time_min = (
+                lambda wildcards, attempt: get_resources(
+                    "msi_native", wildcards.sample, attempt,
+                    {"mem_mb": 20480, "time_min": 380}
+                )["time_min"]
+            )
+        log:
+            "logs/msisensor/msi/{sample}.logs"
+        benchmark:
+            "benchmarks/msi_native/{sample}.tsv"
+        wildcard_constraints:
+            sample = r"[^/]+"
+        params:
+            reference = fasta_path,
+            extra = config["params"].get("msi_native_extra", ""),
+            prefix = (lambda w: f"msisensor/msi/{w.sample}")
+        conda:
+            "../envs/py3.yaml"
+        shell:
+            "python3 {workflow.basedir}/scripts/msi_count.py"
+            " {input.microsat} {input.normal} {input.tumor}"
+            " -r {params.reference} -o {params.prefix} -t {threads}"
+            " {params.extra} > {log} 2>&1"
+
+
+    ruleorder: msi_native > msi
+
+
+if len(msi_shards) > 1:
+    """
+    This rule splits the homopolymers and microsatellites list into
+    contiguous region shards, in order to scatter msisensor msi.
+    """
+    rule split_scan:
+        input:
+            sites_path
+        output:
+            temp(expand(
+                "msisensor/scan/shards/{shard}.msi",
+                shard=msi_shards
+            ))
+        message:
+            "Splitting homopolymers and microsatellites in region shards"
+        threads:
+            1
+        resources:
+            mem_mb = (
+                lambda wildcards, attempt: min(attempt * 512, 2048)
+            ),
+            time_min = (
+                lambda wildcards, attempt: min(attempt * 15, 60)
+            )
+        log:
+            "logs/msisensor/split_scan.logs"
+        benchmark:
+            "benchmarks/split_scan/split.tsv"
+        conda:
+            "../envs/py3.yaml"
+        shell:
+            "python3 {workflow.basedir}/scripts/split_scan.py"
+            " {input} {output} > {log} 2>&1"
+
+
+    """
+    This rule scans both tumor and normal bam pairs in search for msi,
+    over a single region shard.
+    More information at: https://github.com/ding-lab/msisensor
+    """
+    rule msi_shard:
+        input:
+            unpack(get_bam_pair_w),
+            unpack(get_bam_index_pairs_w),
+            unpack(get_design_stamp_w),
+            unpack(get_preflight_w),
+            microsat = "msisensor/scan/shards/{shard}.msi"
+        output:
+            msi_scores = temp("msisensor/shards/{sample}/{shard}"),
+            read_count = temp("msisensor/shards/{sample}/{shard}_dis"),
+            somatic_sites = temp("msisensor/shards/{sample}/{shard}_somatic"),
+            germline_sites = temp(
+                "msisensor/shards/{sample}/{shard}_germline"
+            )
+        message:
+            "Scanning {wildcards.sample} (shard {wildcards.shard})"
+            " in search for MSI"
+        threads:
+            min(config["threads"], 8)
+        resources:
+            mem_mb = (
+                lambda wildcards, attempt: get_resources(
+                    "msi_shard", wildcards.sample, attempt,
+                    {"mem_mb": 20480, "time_min": 380}
+                )["mem_mb"]
+            ),
+            time_min = (
+                lambda wildcards, attempt: get_resources(
+                    "msi_shard", wildcards.sample, attempt,
+                    {"mem_mb": 20480, "time_min": 380}
+                )["time_min"]
+            )
+        log:
+            "logs/msisensor/msi/{sample}.{shard}.logs"
+        benchmark:
+            "benchmarks/msi_shard/{sample}.{shard}.tsv"
+        wildcard_constraints:
+            sample = r"[^/]+",
+            shard = r"\d+"
+        params:
+            extra = config["params"].get("msi_extra", ""),
+            prefix = (
+                lambda w: f"msisensor/shards/{w.sample}/{w.shard}"
+            )
+        wrapper:
+            f"{swv}/bio/msisensor/msi"
+
+
+    """
+    This rule gathers all msisensor msi region shards of a sample. Its
+    read count distributions are tested again, and corrected (FDR) once,
+    so that somatic sites and MSI score do not depend on the shards.
+    """
+    rule gather_msi:
+        input:
+            unpack(get_msi_shards_w)
+        output:
+            msi_scores = report(
+                "msisensor/msi/{sample}",
+                caption="../report/msi.rst",
+                category="MSI",
+                subcategory="Complete"
+            ),
+            read_count = report(
+                "msisensor/msi/{sample}_dis",
+                caption="../report/read_count.rst",
+                category="Read Count"
+            ),
+            somatic_sites = report(
+                "msisensor/msi/{sample}_somatic",
+                caption="../report/somatic.rst",
+                subcategory="Somatic",
+                category="MSI"
+            ),
+            germline_sites = report(
+                "msisensor/msi/{sample}_germline",
+                caption="../report/germline.rst",
+                subcategory="Germline",
+                category="MSI"
+            )
+        message:
+            "Gathering MSI shards of {wildcards.sample}"
+        threads:
+            1
+        resources:
+            mem_mb = (
+                lambda wildcards, attempt: min(attempt * 1024, 4096)
+            ),
+            time_min = (
+                lambda wildcards, attempt: min(attempt * 30, 120)
+            )
+        log:
+            "logs/msisensor/gather/{sample}.logs"
+        benchmark:
+            "benchmarks/gather_msi/{sample}.tsv"
+        wildcard_constraints:
+            sample = r"[^/]+"
+        params:
+            thresholds = get_msi_thresholds()
+        conda:
+            "../envs/py3.yaml"
+        shell:
+            "python3 {workflow.basedir}/scripts/gather_msi.py"
+            " msisensor/msi/{wildcards.sample} {input.msi_scores}"
+            " {params.thresholds} > {log} 2>&1"
+
+
+    ruleorder: gather_msi > msi
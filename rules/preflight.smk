@@ -0,0 +1,43 @@
+if config.get("preflight", False) is True:
+    """
+    This rule checks the bam files of the design once, before any msi job
+    (BGZF end-of-file marker, index dates, contigs against the fasta
+    index). Bam files shared by several samples are checked once. Bam files
+    and indexes are inputs of this rule: a replaced or re-indexed file is
+    checked again, and the msi jobs waiting for this report are run again.
+    """
+    localrules: preflight
+
+    rule preflight:
+        input:
+            design = config["design"],
+            fasta = fasta_path,
+            bams = list(bam_path_dict.values()),
+            bais = list(bai_path_dict.values())
+        output:
+            "msisensor/preflight.tsv"
+        message:
+            "Checking bam files of the design"
+        threads:
+            config["threads"]
+        resources:
+            mem_mb = (
+                lambda wildcards, attempt: min(attempt * 512, 2048)
+            ),
+            time_min = (
+                lambda wildcards, attempt: min(attempt * 15, 60)
+            )
+        log:
+            "logs/preflight.logs"
+        benchmark:
+            "benchmarks/preflight/preflight.tsv"
+        params:
+            contig_index = (
+                f"-c {get_contig_index()}" if get_contig_index() else ""
+            )
+        conda:
+            "../envs/py3.yaml"
+        shell:
+            "python3 {workflow.basedir}/scripts/preflight.py"
+            " {input.design} {input.fasta} -o {output} -t {threads}"
+            " {params.contig_index} > {log} 2>&1"
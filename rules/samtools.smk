@@ -12,6 +12,8 @@ rule index_bam:
         time_min = 35
     log:
         "logs/samtools/index.{sample}.log"
+    benchmark:
+        "benchmarks/index_bam/{sample}.tsv"
     params:
         ""
     wrapper:
@@ -0,0 +1,321 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script benchmarks the bam discovery of prepare_design.py on a
+synthetic deep directory tree.
+
+The tree contains, in each directory, a given number of bam files, their
+indexes and unrelated files. The former discovery (Path.iterdir, one stat
+per entry, one walk for bam files and another one for indexes) is compared
+to the single-pass os.scandir discovery, with several thread pool sizes.
+
+The result is a TSV file: method, threads, best time (seconds) and number
+of bam files found.
+
+You can test this script with:
+pytest -v ./benchmark_search_bam.py
+
+Usage example:
+# Benchmark on a tree of 4 levels, 6 sub-directories per level
+python3.7 ./benchmark_search_bam.py --depth 4 --width 6 --threads 1 8 32
+
+# Benchmark on an existing (network) directory
+python3.7 ./benchmark_search_bam.py --root /path/to/nfs/tree --threads 1 8
+"""
+
+import argparse           # Parse command line
+import logging            # Traces and loggings
+import shlex              # Lexical analysis
+import sys                # System related methods
+import tempfile           # Temporary directories
+import time               # Time related methods
+
+from pathlib import Path                          # Paths related methods
+from typing import Any, Callable, List, Tuple     # Type hints
+
+from common import *
+from prepare_design import discover_bam
+
+logger = setup_logging(logger="benchmark_search_bam.py")
+
+benchmark_header = "Method\tThreads\tSeconds\tBams\n"
+
+
+# Processing functions
+def make_tree(root: Path, depth: int, width: int, files: int) -> int:
+    """
+    Build a synthetic directory tree of empty bam files
+
+    Parameters:
+        root    Path    Path to the tree root
+        depth   int     Number of sub-directory levels
+        width   int     Number of sub-directories per directory
+        files   int     Number of bam files per directory
+
+    Return:
+                int     The number of bam files in the tree
+
+    Example:
+    >>> make_tree(Path("/tmp/tree"), depth=2, width=3, files=4)
+    52
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    for index in range(files):
+        for suffix in [".bam", ".bam.bai", ".log"]:
+            (root / f"sample{index}{suffix}").touch()
+
+    bams = files
+    if depth > 0:
+        for index in range(width):
+            bams += make_tree(root / f"dir{index}", depth - 1, width, files)
+    return bams
+
+
+def iterdir_search(bam_dir: Path) -> Tuple[List[Path], List[Path]]:
+    """
+    The former discovery: two recursive walks with Path.iterdir, one for
+    bam files and one for their indexes
+
+    Parameters:
+        bam_dir     Path    Path to the bam directory
+
+    Return:
+                    Tuple[List[Path], List[Path]]
+                            Sorted bam files and sorted bam indexes
+
+    Example:
+    >>> iterdir_search(Path("tests"))
+    ([PosixPath('tests/normal_data/example.normal.bam'), ...], [...])
+    """
+    def walk(directory: Path, ext: str) -> List[Path]:
+        found = []
+        for path in directory.iterdir():
+            if path.is_dir():
+                found += walk(path, ext)
+            elif path.name.endswith(ext):
+                found.append(path)
+        return found
+
+    return sorted(walk(bam_dir, ".bam")), sorted(walk(bam_dir, ".bai"))
+
+
+def best_time(function: Callable, repeats: int) -> Tuple[float, Any]:
+    """
+    Run a function several times, and return its best time
+
+    Parameters:
+        function    Callable            The function to time
+        repeats     int                 Number of runs
+
+    Return:
+                    Tuple[float, Any]   Best time (seconds), and the result
+                                        of the function
+
+    Example:
+    >>> best_time(lambda: sum(range(10)), 3)
+    (1.2e-06, 45)
+    """
+    best = float("inf")
+    for _ in range(max(repeats, 1)):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark(root: Path,
+              threads: List[int],
+              repeats: int = 3) -> List[Tuple[str, int, float, int]]:
+    """
+    Time the former and the current bam discovery on a directory tree
+
+    Parameters:
+        root        Path            Path to the tree root
+        threads     List[int]       Thread pool sizes to benchmark
+        repeats     int             Number of runs per method
+
+    Return:
+                    List[Tuple[str, int, float, int]]
+                                    Method, threads, best time and number
+                                    of bam files found
+
+    Example:
+    >>> benchmark(Path("/tmp/tree"), [1, 8])
+    [('iterdir', 1, 0.21, 15550), ('scandir', 1, 0.05, 15550),
+     ('scandir', 8, 0.02, 15550)]
+    """
+    seconds, (bams, _) = best_time(lambda: iterdir_search(root), repeats)
+    results = [("iterdir", 1, seconds, len(bams))]
+    logger.info(f"iterdir: {seconds:.4f}s, {len(bams)} bam files")
+
+    for count in threads:
+        seconds, (bams, _) = best_time(
+            lambda: discover_bam(root, recursive=True, threads=count),
+            repeats
+        )
+        results.append(("scandir", count, seconds, len(bams)))
+        logger.info(
+            f"scandir ({count} threads): {seconds:.4f}s, "
+            f"{len(bams)} bam files"
+        )
+    return results
+
+
+def test_benchmark(tmp_path: Path) -> None:
+    """
+    This function tests the make_tree, iterdir_search and benchmark
+    functions
+
+    Example:
+    >>> pytest -v benchmark_search_bam.py -k test_benchmark
+    """
+    assert make_tree(tmp_path, depth=2, width=3, files=2) == 26
+    assert iterdir_search(tmp_path) == discover_bam(
+        tmp_path, recursive=True, threads=4
+    )
+
+    results = benchmark(tmp_path, [1, 4], repeats=1)
+    assert [result[:2] for result in results] == [
+        ("iterdir", 1), ("scandir", 1), ("scandir", 4)
+    ]
+    assert all(result[3] == 26 for result in results)
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("--depth 2"))
+    Namespace(debug=False, depth=2, files=10, output=None, quiet=False,
+    repeats=3, root=None, threads=[1, 8], width=6)
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Optional arguments
+    main_parser.add_argument(
+        "--root",
+        help="Benchmark an existing directory instead of a synthetic tree",
+        type=str,
+        metavar="PATH",
+        default=None
+    )
+
+    main_parser.add_argument(
+        "--depth",
+        help="Number of sub-directory levels (default: %(default)s)",
+        type=int,
+        default=4
+    )
+
+    main_parser.add_argument(
+        "--width",
+        help="Number of sub-directories per directory "
+             "(default: %(default)s)",
+        type=int,
+        default=6
+    )
+
+    main_parser.add_argument(
+        "--files",
+        help="Number of bam files per directory (default: %(default)s)",
+        type=int,
+        default=10
+    )
+
+    main_parser.add_argument(
+        "--threads",
+        help="Thread pool sizes to benchmark (default: %(default)s)",
+        type=int,
+        nargs="+",
+        default=[1, 8]
+    )
+
+    main_parser.add_argument(
+        "--repeats",
+        help="Number of runs per method (default: %(default)s)",
+        type=int,
+        default=3
+    )
+
+    main_parser.add_argument(
+        "-o", "--output",
+        help="Path to the output TSV file (default: stdout)",
+        type=str,
+        default=None
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function builds the synthetic tree (if needed) and benchmarks
+    the bam discovery
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("--depth 2")))
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(args.root or tmp_dir)
+        if args.root is None:
+            bams = make_tree(root, args.depth, args.width, args.files)
+            logger.debug(f"Synthetic tree built with {bams} bam files")
+        results = benchmark(root, args.threads, args.repeats)
+
+    lines = [benchmark_header] + [
+        f"{method}\t{threads}\t{seconds:.6f}\t{bams}\n"
+        for method, threads, seconds, bams in results
+    ]
+    if args.output is None:
+        sys.stdout.write("".join(lines))
+    else:
+        Path(args.output).write_text("".join(lines))
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="benchmark_search_bam.py", args=args)
+
+    try:
+        logger.debug("Benchmarking bam discovery")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
@@ -0,0 +1,561 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script benchmarks the main stages of the pipeline on synthetic data
+(see synthetic_data.py), at several cohort sizes:
+
+    - inflate: decompression of a whole bam file, with one thread
+      (inflate) and with all threads (inflate_threaded),
+    - prepare_design: bam discovery, pairing and design writing,
+    - dry_run: pipeline startup, from parsing to the DAG of the whole
+      cohort (snakemake --dry-run),
+    - scan_native: the multiprocess native scan of the reference,
+    - scan_msisensor: MSIsensor scan of the reference,
+    - msi: MSIsensor msi on every normal/tumor pair, one after the other.
+
+The reference and the largest cohort are generated once, with a fixed
+seed; smaller cohorts are made of links to its first samples. Stages
+relying on tools missing from the PATH (msisensor, snakemake) are
+reported as skipped. Nothing is downloaded: the suite runs offline.
+
+Results are written as a TSV file: date, commit, stage, number of
+samples, best time (seconds) and status. Use --append to keep the results
+of successive runs in a single file, for trend tracking.
+
+You can test this script with:
+pytest -v ./benchmark_suite.py
+
+Usage example:
+# Benchmark 1, 10 and 100 samples, and keep the results
+python3.7 ./benchmark_suite.py --samples 1 10 100 -o suite.tsv --append
+"""
+
+import argparse           # Parse command line
+import datetime           # Dates related methods
+import logging            # Traces and loggings
+import os                 # OS related activities
+import shlex              # Lexical analysis
+import shutil             # High level file operations
+import subprocess         # Run external commands
+import sys                # System related methods
+import tempfile           # Temporary directories
+import time               # Time related methods
+
+from pathlib import Path                          # Paths related methods
+from typing import Any, List, Optional, Tuple     # Type hints
+
+from common import *
+from bgzf import BgzfReader
+from synthetic_data import make_bam_pair, make_reference
+
+logger = setup_logging(logger="benchmark_suite.py")
+
+suite_header = "Date\tCommit\tStage\tSamples\tSeconds\tStatus\n"
+scripts_dir = Path(__file__).absolute().parent
+snakefile = scripts_dir.parent / "Snakefile"
+
+
+# Processing functions
+def generate(root: Path,
+             samples: int,
+             length: int = 100000,
+             density: float = 1.0,
+             depth: int = 30,
+             seed: int = 0) -> Path:
+    """
+    Generate a synthetic reference and bam pairs
+
+    Parameters:
+        root        Path    Path to the data directory
+        samples     int     Number of normal/tumor pairs
+        length      int     Length of the reference
+        density     float   Number of microsatellites per kilobase
+        depth       int     Number of reads per microsatellite
+        seed        int     Seed of the pseudo-random generator
+
+    Return:
+                    Path    Path to the fasta file
+
+    Example:
+    >>> generate(Path("data"), 100)
+    PosixPath('data/genome.fa')
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    fasta = root / "genome.fa"
+    sequences, sites = make_reference(fasta, 1, length, density, seed)
+    for index in range(samples):
+        make_bam_pair(
+            root, f"sample{index:04d}", sequences, sites, depth,
+            seed=seed + index
+        )
+    return fasta
+
+
+def link_cohort(root: Path, samples: int) -> Path:
+    """
+    Build a cohort made of links to the first samples of the generated
+    data
+
+    Parameters:
+        root        Path    Path to the data directory
+        samples     int     Number of normal/tumor pairs
+
+    Return:
+                    Path    Path to the cohort directory
+
+    Example:
+    >>> link_cohort(Path("data"), 10)
+    PosixPath('data/cohorts/10')
+    """
+    cohort = root / "cohorts" / str(samples)
+    for kind in ["normal", "tumor"]:
+        (cohort / kind).mkdir(parents=True, exist_ok=True)
+        bams = sorted((root / kind).glob("*.bam"))[:samples]
+        for bam in bams:
+            for path in [bam, Path(f"{bam}.bai")]:
+                link = cohort / kind / path.name
+                if not link.exists():
+                    link.symlink_to(path.absolute())
+    return cohort
+
+
+def run_command(command: List[str], repeats: int = 1) -> Tuple[float, str]:
+    """
+    Run a command several times, and return its best time
+
+    Parameters:
+        command     List[str]           The command line
+        repeats     int                 Number of runs
+
+    Return:
+                    Tuple[float, str]   Best time (seconds), and status:
+                                        ok, failed, or skipped when the
+                                        tool is not installed
+
+    Example:
+    >>> run_command(["msisensor", "scan", "-d", "genome.fa", "-o", "s"])
+    (0.61, 'ok')
+    """
+    if shutil.which(command[0]) is None:
+        return 0.0, "skipped"
+
+    best = float("inf")
+    for _ in range(max(repeats, 1)):
+        start = time.perf_counter()
+        process = subprocess.run(
+            command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        if process.returncode != 0:
+            logger.error(
+                f"{' '.join(command)} failed: {process.stderr.decode()}"
+            )
+            return time.perf_counter() - start, "failed"
+        best = min(best, time.perf_counter() - start)
+    return best, "ok"
+
+
+def time_dry_run(fasta: Path,
+                 cohort: Path,
+                 repeats: int = 1) -> Tuple[float, str]:
+    """
+    Configure the pipeline on the design of a cohort, and time its startup
+    (snakemake --dry-run)
+
+    Parameters:
+        fasta       Path                Path to the fasta file
+        cohort      Path                Path to the cohort directory
+        repeats     int                 Number of runs
+
+    Return:
+                    Tuple[float, str]   Best time (seconds), and status
+
+    Example:
+    >>> time_dry_run(Path("data/genome.fa"), Path("data/cohorts/10"))
+    (1.84, 'ok')
+    """
+    design = cohort / "design.tsv"
+    if shutil.which("snakemake") is None or not design.exists():
+        return 0.0, "skipped"
+
+    workdir = cohort / "workdir"
+    workdir.mkdir(exist_ok=True)
+    seconds, status = run_command(
+        [sys.executable, str(scripts_dir / "prepare_config.py"), str(fasta),
+         "--design", str(design), "--workdir", str(workdir), "-q"]
+    )
+    if status != "ok":
+        return seconds, status
+    return run_command(
+        ["snakemake", "-n", "-q", "-s", str(snakefile),
+         "--directory", str(workdir),
+         "--configfile", str(workdir / "config.yaml")],
+        repeats
+    )
+
+
+def time_inflate(bam: Path,
+                 threads: int = 1,
+                 repeats: int = 1) -> Tuple[float, str]:
+    """
+    Time the decompression of every block of a bam file
+
+    Parameters:
+        bam         Path                Path to the bam file
+        threads     int                 Number of decompression threads
+        repeats     int                 Number of runs
+
+    Return:
+                    Tuple[float, str]   Best time (seconds), and status
+
+    Example:
+    >>> time_inflate(Path("data/tumor/sample0000.bam"), threads=4)
+    (0.012, 'ok')
+    """
+    best = float("inf")
+    for _ in range(max(repeats, 1)):
+        start = time.perf_counter()
+        with BgzfReader(bam, threads) as reader:
+            size = sum(
+                len(data)
+                for _, data in reader.blocks(reader.block_offsets())
+            )
+        best = min(best, time.perf_counter() - start)
+    logger.debug(
+        f"{bam}: {size / max(best, 1e-9) / 2**20:.1f} MB/s inflated"
+        f" with {threads} thread(s)"
+    )
+    return best, "ok"
+
+
+def run_suite(root: Path,
+              scales: List[int],
+              threads: int = 1,
+              repeats: int = 1,
+              **dataset: Any) -> List[Tuple[str, int, float, str]]:
+    """
+    Generate the synthetic data, and time every stage at every scale
+
+    Parameters:
+        root        Path            Path to the data directory
+        scales      List[int]       Numbers of samples to benchmark
+        threads     int             Number of threads of each stage
+        repeats     int             Number of runs per stage
+        dataset     Any             Arguments of the generate function
+
+    Return:
+                    List[Tuple[str, int, float, str]]
+                                    Stage, samples, best time and status
+
+    Example:
+    >>> run_suite(Path("data"), [1, 10])
+    [('generate', 10, 4.2, 'ok'), ('scan_native', 0, 0.3, 'ok'), ...]
+    """
+    results = []
+    start = time.perf_counter()
+    fasta = generate(root, max(scales), **dataset)
+    results.append(
+        ("generate", max(scales), time.perf_counter() - start, "ok")
+    )
+
+    python = sys.executable
+    scans = {
+        "scan_native": (
+            root / "native.msi",
+            [python, str(scripts_dir / "msi_scan.py"), str(fasta),
+             "-o", str(root / "native.msi"), "-t", str(threads), "-q"]
+        ),
+        "scan_msisensor": (
+            root / "msisensor.msi",
+            ["msisensor", "scan", "-d", str(fasta),
+             "-o", str(root / "msisensor.msi")]
+        )
+    }
+    for stage, (_, command) in scans.items():
+        results.append((stage, 0, *run_command(command, repeats)))
+
+    bam = root / "tumor" / f"sample{max(scales) - 1:04d}.bam"
+    results.append(("inflate", 0, *time_inflate(bam, 1, repeats)))
+    results.append(
+        ("inflate_threaded", 0, *time_inflate(bam, threads, repeats))
+    )
+    scan = next(
+        (path for path, _ in scans.values() if path.exists()), None
+    )
+
+    for samples in sorted(scales):
+        cohort = link_cohort(root, samples)
+        results.append(("prepare_design", samples, *run_command(
+            [python, str(scripts_dir / "prepare_design.py"),
+             str(cohort / "normal"), str(cohort / "tumor"), "--index",
+             "-o", str(cohort / "design.tsv"), "-t", str(threads), "-q"],
+            repeats
+        )))
+        results.append(
+            ("dry_run", samples, *time_dry_run(fasta, cohort, repeats))
+        )
+
+        if shutil.which("msisensor") is None or scan is None:
+            results.append(("msi", samples, 0.0, "skipped"))
+            continue
+        seconds, status = 0.0, "ok"
+        for bam in sorted((cohort / "normal").glob("*.bam")):
+            elapsed, status = run_command(
+                ["msisensor", "msi", "-d", str(scan), "-n", str(bam),
+                 "-t", str(cohort / "tumor" / bam.name),
+                 "-o", str(cohort / bam.stem), "-b", str(threads)],
+                repeats
+            )
+            seconds += elapsed
+            if status != "ok":
+                break
+        results.append(("msi", samples, seconds, status))
+
+    for stage, samples, seconds, status in results:
+        logger.info(f"{stage} ({samples} samples): {seconds:.3f}s {status}")
+    return results
+
+
+def test_run_suite(tmp_path: Path) -> None:
+    """
+    This function tests the generate, link_cohort, run_command and
+    run_suite functions
+
+    Example:
+    >>> pytest -v benchmark_suite.py -k test_run_suite
+    """
+    assert run_command(["this-tool-does-not-exist"]) == (0.0, "skipped")
+    assert run_command(["false"])[1] == "failed"
+
+    results = run_suite(tmp_path, [1, 2], length=5000, depth=5)
+    stages = {
+        (stage, samples): status for stage, samples, _, status in results
+    }
+    assert stages[("generate", 2)] == "ok"
+    assert stages[("scan_native", 0)] == "ok"
+    assert stages[("inflate", 0)] == "ok"
+    assert time_inflate(tmp_path / "tumor" / "sample0001.bam", 2)[1] == "ok"
+    assert stages[("prepare_design", 1)] == "ok"
+    assert stages[("prepare_design", 2)] == "ok"
+    assert stages[("dry_run", 2)] in ["ok", "skipped"]
+    assert len((tmp_path / "cohorts" / "2" / "design.tsv")
+               .read_text().splitlines()) == 3
+    assert sorted(path.name for path in
+                  (tmp_path / "cohorts" / "1" / "tumor").iterdir()) == [
+        "sample0000.bam", "sample0000.bam.bai"
+    ]
+
+
+def git_commit() -> str:
+    """
+    Return the short hash of the current commit of the pipeline, or "-"
+    outside of a git repository
+
+    Return:
+                str     The commit hash
+
+    Example:
+    >>> git_commit()
+    '968b53d'
+    """
+    try:
+        process = subprocess.run(
+            ["git", "-C", str(scripts_dir), "rev-parse", "--short", "HEAD"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+    except OSError:
+        return "-"
+    return process.stdout.decode().strip() or "-"
+
+
+def write_results(results: List[Tuple[str, int, float, str]],
+                  path: Optional[Path],
+                  append: bool = False) -> None:
+    """
+    Save the results of the suite, with the date and current commit
+
+    Parameters:
+        results     List[Tuple[str, int, float, str]]
+                                Stage, samples, best time and status
+        path        Path        Path to the output TSV file, or None for
+                                the standard output
+        append      bool        Append to an existing file
+
+    Example:
+    >>> write_results(results, Path("suite.tsv"), append=True)
+    """
+    date = datetime.datetime.now().isoformat(timespec="seconds")
+    commit = git_commit()
+    lines = [
+        f"{date}\t{commit}\t{stage}\t{samples}\t{seconds:.6f}\t{status}\n"
+        for stage, samples, seconds, status in results
+    ]
+    if path is None:
+        sys.stdout.write(suite_header + "".join(lines))
+        return
+    with_header = not (append and path.exists())
+    with path.open("a" if append else "w") as suite_stream:
+        suite_stream.write((suite_header if with_header else "")
+                           + "".join(lines))
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("--samples 1 10"))
+    Namespace(append=False, data=None, debug=False, density=1.0, depth=30,
+    length=100000, output=None, quiet=False, repeats=1, samples=[1, 10],
+    seed=0, threads=1)
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Optional arguments
+    main_parser.add_argument(
+        "--samples",
+        help="Numbers of samples to benchmark (default: %(default)s)",
+        type=int,
+        nargs="+",
+        default=[1, 10, 100]
+    )
+
+    main_parser.add_argument(
+        "--length",
+        help="Length of the reference (default: %(default)s)",
+        type=int,
+        default=100000
+    )
+
+    main_parser.add_argument(
+        "--density",
+        help="Number of microsatellites per kilobase "
+             "(default: %(default)s)",
+        type=float,
+        default=1.0
+    )
+
+    main_parser.add_argument(
+        "--depth",
+        help="Number of reads per microsatellite (default: %(default)s)",
+        type=int,
+        default=30
+    )
+
+    main_parser.add_argument(
+        "--seed",
+        help="Seed of the pseudo-random generator (default: %(default)s)",
+        type=int,
+        default=0
+    )
+
+    main_parser.add_argument(
+        "--threads",
+        help="Number of threads of each stage (default: %(default)s)",
+        type=int,
+        default=1
+    )
+
+    main_parser.add_argument(
+        "--repeats",
+        help="Number of runs per stage (default: %(default)s)",
+        type=int,
+        default=1
+    )
+
+    main_parser.add_argument(
+        "--data",
+        help="Keep the synthetic data in this directory "
+             "(default: a temporary directory)",
+        type=str,
+        metavar="PATH",
+        default=None
+    )
+
+    main_parser.add_argument(
+        "-o", "--output",
+        help="Path to the output TSV file (default: stdout)",
+        type=str,
+        default=None
+    )
+
+    main_parser.add_argument(
+        "--append",
+        help="Append results to the output file",
+        default=False,
+        action="store_true"
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function runs the benchmark suite
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("--samples 1 10")))
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = run_suite(
+            Path(args.data or tmp_dir),
+            args.samples,
+            threads=args.threads,
+            repeats=args.repeats,
+            length=args.length,
+            density=args.density,
+            depth=args.depth,
+            seed=args.seed
+        )
+    write_results(
+        results,
+        None if args.output is None else Path(args.output),
+        args.append
+    )
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="benchmark_suite.py", args=args)
+
+    try:
+        logger.debug("Running benchmark suite")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
@@ -0,0 +1,1082 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script reads and writes BGZF blocks (the blocked gzip format of bam
+files, described in the SAM/BAM specifications), and reads bam headers
+without decompressing the whole file.
+
+Only the first blocks of a bam file are decompressed to read its header:
+the header text, the read groups, and the reference sequences. Cram
+headers are read out of the first container of the file, and their
+reference sequences out of the @SQ lines of the header text.
+
+Bam files are memory-mapped, and their blocks are inflated by a pool of
+threads (zlib releases the GIL), ahead of the reader. Bam indexes (.bai)
+are read as well, for the estimation of the reads of each window (see
+prune_sites.py).
+
+You can test this script with:
+pytest -v ./bgzf.py
+
+Usage example:
+# Print the sample name(s) of a bam file
+python3.7 ./bgzf.py /path/to/sample.bam
+
+# Print the sample name(s) of a cram file
+python3.7 ./bgzf.py /path/to/sample.cram
+"""
+
+import argparse           # Parse command line
+import collections        # Container datatypes
+import logging            # Traces and loggings
+import mmap               # Memory-mapped files
+import shlex              # Lexical analysis
+import struct             # Binary data handling
+import sys                # System related methods
+import zlib               # Deflate compression
+
+from concurrent.futures import ThreadPoolExecutor        # Thread pools
+from pathlib import Path                                # Paths related
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List
+from typing import NamedTuple, Optional, Tuple
+
+from common import *
+
+logger = setup_logging(logger="bgzf.py")
+
+bgzf_magic = b"\x1f\x8b\x08\x04"
+bgzf_eof = bytes.fromhex(
+    "1f8b08040000000000ff0600424302001b0003000000000000000000"
+)
+bam_magic = b"BAM\x01"
+bai_magic = b"BAI\x01"
+cram_magic = b"CRAM"
+cram_eof = bytes.fromhex(
+    "0f000000ffffffff0fe0454f4600000000010005bdd94f00010006060100010001"
+    "00ee63014b"
+)
+max_block_data = 0xff00
+linear_shift = 14
+pseudo_bin = 37450
+
+
+class BamHeader(NamedTuple):
+    """
+    The header of a bam file: its SAM text and reference sequences
+    """
+    text: str
+    references: List[Tuple[str, int]]
+
+
+class BaiReference(NamedTuple):
+    """
+    The index of a reference sequence: the chunks (pairs of virtual
+    offsets) of each bin, and the linear index (smallest virtual offset of
+    the reads overlapping each 16kb window)
+    """
+    bins: Dict[int, List[Tuple[int, int]]]
+    linear: List[int]
+
+
+# Processing functions
+def read_block(stream: BinaryIO) -> Optional[bytes]:
+    """
+    Read and decompress the next BGZF block of a binary stream
+
+    Parameters:
+        stream  BinaryIO    The opened bgzf file
+
+    Return:
+                bytes       The decompressed block, or None at end of file
+
+    Example:
+    >>> with open("sample.bam", "rb") as bam_stream:
+    ...     read_block(bam_stream)[:4]
+    b'BAM\\x01'
+    """
+    header = stream.read(12)
+    if not header:
+        return None
+    if len(header) < 12 or header[:4] != bgzf_magic:
+        raise ValueError("Not a BGZF block")
+
+    xlen, = struct.unpack("<H", header[10:12])
+    extra = stream.read(xlen)
+    bsize = None
+    position = 0
+    while position + 4 <= len(extra):
+        slen, = struct.unpack("<H", extra[position + 2:position + 4])
+        if extra[position:position + 2] == b"BC":
+            bsize, = struct.unpack("<H", extra[position + 4:position + 6])
+        position += 4 + slen
+    if bsize is None:
+        raise ValueError("BGZF block without size field")
+
+    rest = stream.read(bsize - xlen - 11)
+    crc, isize = struct.unpack("<II", rest[-8:])
+    data = zlib.decompress(rest[:-8], -15)
+    if len(data) != isize or zlib.crc32(data) != crc:
+        raise ValueError("Corrupted BGZF block")
+    return data
+
+
+def write_block(stream: BinaryIO, data: bytes, level: int = 6) -> int:
+    """
+    Compress and write a BGZF block (at most 65280 bytes of data)
+
+    Parameters:
+        stream  BinaryIO    The opened output file
+        data    bytes       The data to compress
+        level   int         The compression level
+
+    Return:
+                int         The number of written (compressed) bytes
+
+    Example:
+    >>> with open("sample.bam", "wb") as bam_stream:
+    ...     write_block(bam_stream, b"BAM\\x01...")
+    56
+    """
+    if len(data) > max_block_data:
+        raise ValueError(f"BGZF blocks hold at most {max_block_data} bytes")
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    block = b"".join([
+        bgzf_magic,
+        b"\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00",
+        struct.pack("<H", len(cdata) + 25),
+        cdata,
+        struct.pack("<II", zlib.crc32(data), len(data))
+    ])
+    stream.write(block)
+    return len(block)
+
+
+def write_bgzf(stream: BinaryIO, data: bytes, level: int = 6) -> int:
+    """
+    Compress and write data as a series of BGZF blocks, followed by the
+    BGZF end-of-file marker
+
+    Parameters:
+        stream  BinaryIO    The opened output file
+        data    bytes       The data to compress
+        level   int         The compression level
+
+    Return:
+                int         The number of written (compressed) bytes
+
+    Example:
+    >>> with open("sample.bam", "wb") as bam_stream:
+    ...     write_bgzf(bam_stream, bam_content)
+    1234
+    """
+    written = 0
+    for start in range(0, len(data), max_block_data):
+        written += write_block(
+            stream, data[start:start + max_block_data], level
+        )
+    stream.write(bgzf_eof)
+    return written + len(bgzf_eof)
+
+
+class BgzfWriter:
+    """
+    A BGZF writer, which fills blocks up to their maximum size and keeps
+    track of the virtual offset (compressed offset of the block, and
+    offset within the block) of the data written so far, as required to
+    index bam files
+    """
+
+    def __init__(self, stream: BinaryIO, level: int = 6) -> None:
+        self.stream = stream
+        self.level = level
+        self.buffer = bytearray()
+        self.position = 0
+
+    def tell(self) -> int:
+        """
+        Return the virtual offset of the next written byte
+        """
+        return (self.position << 16) | len(self.buffer)
+
+    def write(self, data: bytes) -> None:
+        """
+        Buffer data, and write every full block
+        """
+        self.buffer.extend(data)
+        while len(self.buffer) >= max_block_data:
+            self.flush(max_block_data)
+
+    def flush(self, size: Optional[int] = None) -> None:
+        """
+        Write (at most size bytes of) the buffer as a single block
+        """
+        size = len(self.buffer) if size is None else size
+        if size > 0:
+            self.position += write_block(
+                self.stream, bytes(self.buffer[:size]), self.level
+            )
+            del self.buffer[:size]
+
+    def close(self) -> None:
+        """
+        Write the remaining data, and the BGZF end-of-file marker
+        """
+        self.flush()
+        self.stream.write(bgzf_eof)
+        self.position += len(bgzf_eof)
+
+
+def test_read_write_block(tmp_path: Path) -> None:
+    """
+    This function tests the read_block, write_block, write_bgzf functions
+    and the BgzfWriter class
+
+    Example:
+    >>> pytest -v bgzf.py -k test_read_write_block
+    """
+    import pytest
+
+    data = bytes(range(256)) * 300
+    path = tmp_path / "data.gz"
+    with path.open("wb") as stream:
+        write_bgzf(stream, data)
+    assert path.read_bytes().endswith(bgzf_eof)
+
+    blocks = []
+    with path.open("rb") as stream:
+        block = read_block(stream)
+        while block is not None:
+            blocks.append(block)
+            block = read_block(stream)
+    assert [len(block) for block in blocks] == [max_block_data, 11520, 0]
+    assert b"".join(blocks) == data
+
+    with path.open("wb") as stream:
+        writer = BgzfWriter(stream)
+        writer.write(b"a" * 100)
+        assert writer.tell() == 100
+        writer.write(data)
+        first = writer.position
+        remaining = (len(data) + 100) % max_block_data
+        assert writer.tell() == (first << 16) | remaining
+        writer.close()
+    with path.open("rb") as stream:
+        assert read_block(stream) == (b"a" * 100 + data)[:max_block_data]
+        stream.seek(first)
+        assert read_block(stream) == data[max_block_data - 100:]
+
+    path.write_bytes(b"not a bgzf file")
+    with pytest.raises(ValueError):
+        with path.open("rb") as stream:
+            read_block(stream)
+
+
+def block_size(buffer: bytes, offset: int) -> int:
+    """
+    Return the size of the (compressed) BGZF block starting at an offset,
+    from its header only
+
+    Parameters:
+        buffer  bytes       The content of the bgzf file
+        offset  int         The offset of the block
+
+    Return:
+                int         The size of the block
+
+    Example:
+    >>> block_size(bam_content, 0)
+    1234
+    """
+    if buffer[offset:offset + 4] != bgzf_magic:
+        raise ValueError(f"Not a BGZF block at offset {offset}")
+    xlen, = struct.unpack_from("<H", buffer, offset + 10)
+    position = offset + 12
+    while position + 4 <= offset + 12 + xlen:
+        slen, = struct.unpack_from("<H", buffer, position + 2)
+        if buffer[position:position + 2] == b"BC":
+            bsize, = struct.unpack_from("<H", buffer, position + 4)
+            return bsize + 1
+        position += 4 + slen
+    raise ValueError(f"BGZF block without size field at offset {offset}")
+
+
+def inflate_block(buffer: bytes, offset: int) -> bytes:
+    """
+    Decompress the BGZF block starting at an offset
+
+    Parameters:
+        buffer  bytes       The content of the bgzf file
+        offset  int         The offset of the block
+
+    Return:
+                bytes       The decompressed block
+
+    Example:
+    >>> inflate_block(bam_content, 0)[:4]
+    b'BAM\\x01'
+    """
+    end = offset + block_size(buffer, offset)
+    xlen, = struct.unpack_from("<H", buffer, offset + 10)
+    crc, isize = struct.unpack_from("<II", buffer, end - 8)
+    data = zlib.decompress(buffer[offset + 12 + xlen:end - 8], -15)
+    if len(data) != isize or zlib.crc32(data) != crc:
+        raise ValueError(f"Corrupted BGZF block at offset {offset}")
+    return data
+
+
+class BgzfReader:
+    """
+    A memory-mapped BGZF reader, which inflates blocks with a pool of
+    threads, a few blocks ahead of the consumer
+    """
+
+    def __init__(self,
+                 path: Path,
+                 threads: int = 1,
+                 read_ahead: int = 4) -> None:
+        self.path = path
+        self.threads = max(threads, 1)
+        self.window = self.threads * max(read_ahead, 1)
+        self.stream = path.open("rb")
+        try:
+            self.buffer = mmap.mmap(
+                self.stream.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        except ValueError:
+            # Empty files can not be mapped
+            self.buffer = b""
+        self.pool = None
+        if self.threads > 1:
+            self.pool = ThreadPoolExecutor(max_workers=self.threads)
+
+    def __enter__(self) -> "BgzfReader":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Stop the threads, and unmap the file
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.stream.close()
+
+    def has_eof(self) -> bool:
+        """
+        Tell whether the file ends with the BGZF end-of-file marker
+        """
+        return self.buffer[-len(bgzf_eof):] == bgzf_eof
+
+    def block_offsets(self,
+                      start: int = 0,
+                      end: Optional[int] = None) -> Iterator[int]:
+        """
+        Yield the offsets of the blocks from start up to end (included),
+        reading block headers only
+        """
+        end = len(self.buffer) - 1 if end is None else end
+        offset = start
+        while offset <= end and offset < len(self.buffer):
+            yield offset
+            offset += block_size(self.buffer, offset)
+
+    def blocks(self, offsets: Iterable[int]) -> Iterator[Tuple[int, bytes]]:
+        """
+        Yield the offset and decompressed content of each block, in order
+        """
+        if self.pool is None:
+            for offset in offsets:
+                yield offset, inflate_block(self.buffer, offset)
+            return
+
+        pending = collections.deque()
+        for offset in offsets:
+            pending.append((
+                offset, self.pool.submit(inflate_block, self.buffer, offset)
+            ))
+            if len(pending) >= self.window:
+                offset, future = pending.popleft()
+                yield offset, future.result()
+        while pending:
+            offset, future = pending.popleft()
+            yield offset, future.result()
+
+
+
+def test_bgzf_reader(tmp_path: Path) -> None:
+    """
+    This function tests the block_size and inflate_block functions, and
+    the BgzfReader class
+
+    Example:
+    >>> pytest -v bgzf.py -k test_bgzf_reader
+    """
+    import pytest
+
+    data = bytes(range(256)) * 1000
+    path = tmp_path / "data.gz"
+    with path.open("wb") as stream:
+        writer = BgzfWriter(stream)
+        writer.write(data[:100])
+        writer.flush()
+        writer.write(data[100:200000])
+        writer.close()
+
+    expected = []
+    with path.open("rb") as stream:
+        block = read_block(stream)
+        while block is not None:
+            expected.append(block)
+            block = read_block(stream)
+
+    for threads in [1, 4]:
+        with BgzfReader(path, threads, read_ahead=1) as reader:
+            offsets = list(reader.block_offsets())
+            assert len(offsets) == len(expected)
+            assert [
+                data for _, data in reader.blocks(offsets)
+            ] == expected
+            assert [
+                data for _, data in reader.blocks(offsets[1:])
+            ] == expected[1:]
+
+    path.write_bytes(b"")
+    with BgzfReader(path) as reader:
+        assert list(reader.block_offsets()) == []
+    path.write_bytes(b"not a bgzf file")
+    with pytest.raises(ValueError):
+        with BgzfReader(path) as reader:
+            list(reader.block_offsets())
+
+
+def encode_header(header: BamHeader) -> bytes:
+    """
+    Encode a bam header, as found at the beginning of a bam file
+
+    Parameters:
+        header  BamHeader   The header to encode
+
+    Return:
+                bytes       The (uncompressed) binary header
+
+    Example:
+    >>> encode_header(BamHeader("@HD\\tVN:1.6\\n", [("1", 1000)]))
+    b'BAM\\x01\\x0b\\x00\\x00\\x00@HD\\tVN:1.6\\n\\x01...'
+    """
+    text = header.text.encode()
+    content = [bam_magic, struct.pack("<i", len(text)), text]
+    content.append(struct.pack("<i", len(header.references)))
+    for name, length in header.references:
+        name = name.encode() + b"\x00"
+        content += [struct.pack("<i", len(name)), name]
+        content.append(struct.pack("<i", length))
+    return b"".join(content)
+
+
+def read_header(reader: BgzfReader) -> BamHeader:
+    """
+    Read the header of an opened bam file, decompressing only the blocks
+    it spans
+
+    Parameters:
+        reader  BgzfReader  The opened bam file
+
+    Return:
+                BamHeader   The header text and reference sequences
+
+    Example:
+    >>> with BgzfReader(Path("sample.bam")) as reader:
+    ...     read_header(reader)
+    BamHeader(text='@HD\\tVN:1.6...', references=[('1', 645211)])
+    """
+    blocks = reader.blocks(reader.block_offsets())
+    buffer = bytearray()
+    position = 0
+
+    def take(size: int) -> bytes:
+        nonlocal position
+        while len(buffer) < position + size:
+            _, block = next(blocks, (None, None))
+            if block is None:
+                raise ValueError(f"Truncated bam header in {reader.path}")
+            buffer.extend(block)
+        position += size
+        return bytes(buffer[position - size:position])
+
+    if take(4) != bam_magic:
+        raise ValueError(f"{reader.path} is not a bam file")
+    l_text, = struct.unpack("<i", take(4))
+    text = take(l_text).rstrip(b"\x00").decode()
+
+    references = []
+    n_ref, = struct.unpack("<i", take(4))
+    for _ in range(n_ref):
+        l_name, = struct.unpack("<i", take(4))
+        name = take(l_name).rstrip(b"\x00").decode()
+        l_ref, = struct.unpack("<i", take(4))
+        references.append((name, l_ref))
+
+    return BamHeader(text, references)
+
+
+def read_bam_header(path: Path) -> BamHeader:
+    """
+    Read the header of a bam file, or of a cram file (see
+    read_cram_header)
+
+    Parameters:
+        path    Path        Path to the bam or cram file
+
+    Return:
+                BamHeader   The header text and reference sequences
+
+    Example:
+    >>> read_bam_header(Path("sample.bam"))
+    BamHeader(text='@HD\\tVN:1.6...', references=[('1', 645211)])
+    """
+    if is_cram(path):
+        return read_cram_header(path)
+    with BgzfReader(path) as reader:
+        return read_header(reader)
+
+
+def sample_names(text: str, tag: str = "SM") -> List[str]:
+    """
+    Return the distinct values of a read group field, in header order
+
+    Parameters:
+        text    str         The SAM header text
+        tag     str         The read group field
+
+    Return:
+                List[str]   The distinct field values
+
+    Example:
+    >>> sample_names("@RG\\tID:1\\tSM:patient1\\n@RG\\tID:2\\tSM:patient1\\n")
+    ['patient1']
+    """
+    names = []
+    for line in text.splitlines():
+        if not line.startswith("@RG\t"):
+            continue
+        for field in line.split("\t")[1:]:
+            value = field[len(tag) + 1:]
+            if field.startswith(f"{tag}:") and value not in names:
+                names.append(value)
+    return names
+
+
+def test_read_bam_header(tmp_path: Path) -> None:
+    """
+    This function tests the encode_header, read_bam_header and
+    sample_names functions
+
+    Example:
+    >>> pytest -v bgzf.py -k test_read_bam_header
+    """
+    import pytest
+
+    header = BamHeader(
+        "@HD\tVN:1.6\n@RG\tID:a\tSM:patient1\tLB:lib1\n"
+        + "".join(f"@CO\tcomment {i}\n" for i in range(5000)),
+        [("1", 645211), ("chrUn_KI270302v1", 2274)]
+    )
+    path = tmp_path / "sample.bam"
+    with path.open("wb") as bam_stream:
+        write_bgzf(bam_stream, encode_header(header))
+
+    assert read_bam_header(path) == header
+    assert sample_names(header.text) == ["patient1"]
+    assert sample_names(header.text, "LB") == ["lib1"]
+    assert sample_names("@HD\tVN:1.6\n") == []
+
+    with path.open("wb") as bam_stream:
+        write_bgzf(bam_stream, encode_header(header)[:100])
+    with pytest.raises(ValueError):
+        read_bam_header(path)
+
+
+def is_cram(path: Path) -> bool:
+    """
+    Tell whether a mapping file is a cram file, from its name
+
+    Parameters:
+        path    Path    Path to the mapping file
+
+    Return:
+                bool    True for cram files
+
+    Example:
+    >>> is_cram(Path("sample.cram"))
+    True
+    """
+    return str(path).endswith(".cram")
+
+
+def index_suffix(path: Path) -> str:
+    """
+    Return the suffix of the index of a mapping file
+
+    Parameters:
+        path    Path    Path to the bam or cram file
+
+    Return:
+                str     The index suffix (.bai or .crai)
+
+    Example:
+    >>> f"sample.cram{index_suffix(Path('sample.cram'))}"
+    'sample.cram.crai'
+    """
+    return ".crai" if is_cram(path) else ".bai"
+
+
+def read_itf8(buffer: bytes, offset: int) -> Tuple[int, int]:
+    """
+    Decode an ITF8 integer (1 to 5 bytes) of a cram file
+
+    Parameters:
+        buffer  bytes   The cram content
+        offset  int     Position of the integer in the buffer
+
+    Return:
+                Tuple[int, int]     The integer, and the position of the
+                                    next field
+
+    Example:
+    >>> read_itf8(b"\\x80\\xa6", 0)
+    (166, 2)
+    """
+    first = buffer[offset]
+    size = 0
+    while size < 4 and first & (0x80 >> size):
+        size += 1
+    value = first & (0x0f if size == 4 else 0xff >> (size + 1))
+    for byte in buffer[offset + 1:offset + min(size, 3) + 1]:
+        value = value << 8 | byte
+    if size == 4:
+        value = value << 4 | buffer[offset + 4] & 0x0f
+    if value >= 1 << 31:
+        value -= 1 << 32
+    return value, offset + size + 1
+
+
+def read_ltf8(buffer: bytes, offset: int) -> Tuple[int, int]:
+    """
+    Decode an LTF8 integer (1 to 9 bytes) of a cram file
+
+    Parameters:
+        buffer  bytes   The cram content
+        offset  int     Position of the integer in the buffer
+
+    Return:
+                Tuple[int, int]     The integer, and the position of the
+                                    next field
+
+    Example:
+    >>> read_ltf8(b"\\x00", 0)
+    (0, 1)
+    """
+    first = buffer[offset]
+    size = 0
+    while size < 8 and first & (0x80 >> size):
+        size += 1
+    value = first & (0xff >> (size + 1))
+    for byte in buffer[offset + 1:offset + size + 1]:
+        value = value << 8 | byte
+    if value >= 1 << 63:
+        value -= 1 << 64
+    return value, offset + size + 1
+
+
+def encode_itf8(value: int) -> bytes:
+    """
+    Encode an ITF8 integer
+
+    Parameters:
+        value   int     The integer to encode
+
+    Return:
+                bytes   The encoded integer
+
+    Example:
+    >>> encode_itf8(166)
+    b'\\x80\\xa6'
+    """
+    value &= 0xffffffff
+    for size in range(4):
+        if value < 1 << (7 * (size + 1)):
+            prefix = (0xff00 >> size) & 0xff
+            return (value | prefix << (8 * size)).to_bytes(size + 1, "big")
+    return bytes([
+        0xf0 | value >> 28, value >> 20 & 0xff, value >> 12 & 0xff,
+        value >> 4 & 0xff, value & 0x0f
+    ])
+
+
+def sam_references(text: str) -> List[Tuple[str, int]]:
+    """
+    Return the reference sequences of a SAM header text (@SQ lines)
+
+    Parameters:
+        text    str                     The SAM header text
+
+    Return:
+                List[Tuple[str, int]]   Names and lengths of references
+
+    Example:
+    >>> sam_references("@SQ\\tSN:1\\tLN:645211\\n")
+    [('1', 645211)]
+    """
+    references = []
+    for line in text.splitlines():
+        if not line.startswith("@SQ\t"):
+            continue
+        fields = dict(
+            field.split(":", 1) for field in line.split("\t")[1:]
+            if ":" in field
+        )
+        references.append((fields["SN"], int(fields["LN"])))
+    return references
+
+
+def read_cram_header(path: Path) -> BamHeader:
+    """
+    Read the header of a cram file (versions 2.1 and 3.x): only the first
+    container is read, and its first block decompressed
+
+    Parameters:
+        path    Path        Path to the cram file
+
+    Return:
+                BamHeader   The header text and reference sequences
+
+    Example:
+    >>> read_cram_header(Path("sample.cram"))
+    BamHeader(text='@HD\\tVN:1.6...', references=[('1', 645211)])
+    """
+    with path.open("rb") as cram_stream:
+        definition = cram_stream.read(26)
+        if len(definition) < 26 or definition[:4] != cram_magic:
+            raise ValueError(f"{path} is not a cram file")
+        if definition[4] not in (2, 3):
+            raise ValueError(
+                f"Unsupported cram version {definition[4]}.{definition[5]}"
+                f" in {path}"
+            )
+
+        # The container header holds a few integers and landmarks, then its
+        # blocks follow
+        buffer = cram_stream.read(1024)
+        if len(buffer) < 4:
+            raise ValueError(f"Truncated cram header in {path}")
+        length, = struct.unpack("<i", buffer[:4])
+        offset = 4
+        for read_int in [read_itf8] * 4 + [read_ltf8] * 2 + [read_itf8]:
+            _, offset = read_int(buffer, offset)
+        landmarks, offset = read_itf8(buffer, offset)
+        for _ in range(landmarks):
+            _, offset = read_itf8(buffer, offset)
+        if definition[4] >= 3:
+            offset += 4     # Container CRC32
+        buffer += cram_stream.read(max(offset + length - len(buffer), 0))
+
+    method, content_type = buffer[offset], buffer[offset + 1]
+    if content_type != 0:
+        raise ValueError(f"No header block in the first container of {path}")
+    _, offset = read_itf8(buffer, offset + 2)
+    size, offset = read_itf8(buffer, offset)
+    _, offset = read_itf8(buffer, offset)
+    data = buffer[offset:offset + size]
+    if len(data) < size:
+        raise ValueError(f"Truncated cram header in {path}")
+    if method == 1:
+        data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    elif method != 0:
+        raise ValueError(f"Unsupported header compression in {path}")
+
+    l_text, = struct.unpack("<i", data[:4])
+    text = data[4:4 + l_text].rstrip(b"\x00").decode()
+    return BamHeader(text, sam_references(text))
+
+
+def write_cram(stream: BinaryIO, header: BamHeader) -> int:
+    """
+    Write a cram file (version 3.0) holding a header and no read: the file
+    definition, the header container, and the end-of-file container
+
+    Parameters:
+        stream  BinaryIO    The output binary stream
+        header  BamHeader   The header to write (its text only, references
+                            are expected in @SQ lines)
+
+    Return:
+                int         The number of written bytes
+
+    Example:
+    >>> with open("empty.cram", "wb") as cram_stream:
+    ...     write_cram(cram_stream, BamHeader("@HD\\tVN:1.6\\n", []))
+    162
+    """
+    text = header.text.encode()
+    data = struct.pack("<i", len(text)) + text
+    block = b"\x00\x00" + b"".join(
+        encode_itf8(value) for value in [0, len(data), len(data)]
+    ) + data
+    block += struct.pack("<I", zlib.crc32(block))
+
+    # Reference id, start, span, records, then record counter and bases
+    # (LTF8), blocks, and landmarks
+    container = struct.pack("<i", len(block)) + b"\x00" * 6 + b"\x01\x01\x00"
+    container += struct.pack("<I", zlib.crc32(container))
+
+    content = cram_magic + b"\x03\x00" + b"\x00" * 20 + container + block
+    return stream.write(content + cram_eof)
+
+
+def cram_has_eof(path: Path) -> bool:
+    """
+    Tell whether a cram file ends with the end-of-file container. Cram
+    files older than version 3.0 are not checked.
+
+    Parameters:
+        path    Path    Path to the cram file
+
+    Return:
+                bool    True if the file is not truncated
+
+    Example:
+    >>> cram_has_eof(Path("sample.cram"))
+    True
+    """
+    with path.open("rb") as cram_stream:
+        definition = cram_stream.read(6)
+        if len(definition) < 6 or definition[:4] != cram_magic:
+            return False
+        if definition[4] < 3:
+            return True
+        size = path.stat().st_size
+        if size < 26 + len(cram_eof):
+            return False
+        cram_stream.seek(size - len(cram_eof))
+        return cram_stream.read() == cram_eof
+
+
+def test_read_cram_header(tmp_path: Path) -> None:
+    """
+    This function tests the read_cram_header, write_cram and cram_has_eof
+    functions, against cram files written by htslib when pysam is
+    available
+
+    Example:
+    >>> pytest -v bgzf.py -k test_read_cram_header
+    """
+    import pytest
+
+    for value in [0, 127, 128, 166, 16383, 16384, 1 << 27, 1 << 30, -1]:
+        assert read_itf8(encode_itf8(value), 0) == (
+            value, len(encode_itf8(value))
+        )
+    assert read_ltf8(bytes([0xff] + [0] * 7 + [5]), 0) == (5, 9)
+
+    header = BamHeader(
+        "@HD\tVN:1.6\tSO:coordinate\n@SQ\tSN:1\tLN:1000\n"
+        "@SQ\tSN:2\tLN:500\n@RG\tID:a\tSM:patient1\n",
+        [("1", 1000), ("2", 500)]
+    )
+    path = tmp_path / "sample.cram"
+    with path.open("wb") as cram_stream:
+        write_cram(cram_stream, header)
+    assert read_bam_header(path) == header
+    assert cram_has_eof(path)
+
+    with path.open("r+b") as cram_stream:
+        cram_stream.truncate(path.stat().st_size - 1)
+    assert not cram_has_eof(path)
+    with path.open("wb") as cram_stream:
+        write_bgzf(cram_stream, encode_header(header))
+    with pytest.raises(ValueError, match="is not a cram file"):
+        read_cram_header(path)
+
+    pysam = pytest.importorskip("pysam")
+    fasta = tmp_path / "genome.fa"
+    fasta.write_text(">1\n" + "ACGT" * 250 + "\n>2\n" + "A" * 500 + "\n")
+    with path.open("wb") as cram_stream:
+        write_cram(cram_stream, header)
+    with pysam.AlignmentFile(str(path), reference_filename=str(fasta)) \
+            as cram:
+        assert cram.references == ("1", "2")
+        assert list(cram.fetch(until_eof=True)) == []
+        template = cram.header.to_dict()
+
+    with pysam.AlignmentFile(str(path), "wc", header=template,
+                             reference_filename=str(fasta)) as cram:
+        for index in range(5):
+            read = pysam.AlignedSegment(cram.header)
+            read.query_name = f"read{index}"
+            read.reference_id = 0
+            read.reference_start = index * 10
+            read.query_sequence = "ACGTACGTAC"
+            read.cigarstring = "10M"
+            cram.write(read)
+    got = read_cram_header(path)
+    assert got.references == header.references
+    assert sample_names(got.text) == ["patient1"]
+    assert cram_has_eof(path)
+
+
+def read_bai(path: Path) -> List[BaiReference]:
+    """
+    Read a bam index (.bai)
+
+    Parameters:
+        path    Path                The path to the bam index
+
+    Return:
+                List[BaiReference]  The index of each reference sequence
+
+    Example:
+    >>> read_bai(Path("sample.bam.bai"))[0].linear[:2]
+    [8192, 8192]
+    """
+    data = path.read_bytes()
+    if data[:4] != bai_magic:
+        raise ValueError(f"{path} is not a bam index")
+    n_ref, = struct.unpack_from("<i", data, 4)
+    position = 8
+    references = []
+    for _ in range(n_ref):
+        n_bin, = struct.unpack_from("<i", data, position)
+        position += 4
+        bins = {}
+        for _ in range(n_bin):
+            bin_id, n_chunk = struct.unpack_from("<Ii", data, position)
+            offsets = struct.unpack_from(
+                f"<{2 * n_chunk}Q", data, position + 8
+            )
+            bins[bin_id] = list(zip(offsets[::2], offsets[1::2]))
+            position += 8 + 16 * n_chunk
+        n_intv, = struct.unpack_from("<i", data, position)
+        linear = list(struct.unpack_from(f"<{n_intv}Q", data, position + 4))
+        position += 4 + 8 * n_intv
+        references.append(BaiReference(bins, linear))
+    return references
+
+
+def test_read_bai(tmp_path: Path) -> None:
+    """
+    This function tests the read_bai function
+
+    Example:
+    >>> pytest -v bgzf.py -k test_read_bai
+    """
+    import pytest
+
+    from synthetic_data import make_bam_pair, make_reference
+
+    sequences, sites = make_reference(tmp_path / "genome.fa", length=80000)
+    bam, _ = make_bam_pair(tmp_path, "patient1", sequences, sites, depth=20)
+    index = read_bai(Path(f"{bam}.bai"))
+    assert len(index) == 1 and len(index[0].linear) == 5
+    assert pseudo_bin in index[0].bins
+
+    with bam.open("rb") as bam_stream:
+        assert read_block(bam_stream) == encode_header(read_bam_header(bam))
+    with Path(f"{bam}.bai").open("r+b") as bai_stream:
+        bai_stream.write(b"BAM\x01")
+    with pytest.raises(ValueError, match="is not a bam index"):
+        read_bai(Path(f"{bam}.bai"))
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("sample.bam"))
+    Namespace(bam=['sample.bam'], debug=False, quiet=False, tag='SM')
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "bam",
+        help="Path to the bam (or cram) file(s)",
+        type=str,
+        nargs="+"
+    )
+
+    # Optional arguments
+    main_parser.add_argument(
+        "--tag",
+        help="Read group field to print (default: %(default)s)",
+        type=str,
+        default="SM"
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function prints the read group field of each bam file
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("sample.bam")))
+    sample.bam  patient1
+    """
+    for bam in args.bam:
+        header = read_bam_header(Path(bam))
+        print(bam, *sample_names(header.text, args.tag), sep="\t")
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="bgzf.py", args=args)
+
+    try:
+        logger.debug("Reading bam headers")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
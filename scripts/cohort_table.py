@@ -0,0 +1,331 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script aggregates MSISensor msi results of a whole cohort into
+single tables:
+
+    scores.tsv      One line per sample: its MSI score
+    sites.tsv       Somatic and germline sites of all samples, prefixed
+                    with the sample identifier and the site status. Every
+                    line has the columns of the somatic sites, followed
+                    by an "other" column: germline sites leave the
+                    somatic-only columns empty, and their own extra
+                    columns are joined (with commas) in the last one.
+    sites.tsv.idx   Sample index of sites.tsv: for each sample and status,
+                    the byte offset of its first line and its number of
+                    lines
+
+Files are read and written line by line, so memory usage does not grow
+with the cohort size.
+
+You can test this script with:
+pytest -v ./cohort_table.py
+
+Usage example:
+# Aggregate two samples
+python3.7 ./cohort_table.py msisensor/cohort msisensor/msi/sample1 \
+    msisensor/msi/sample2
+"""
+
+import argparse           # Parse command line
+import logging            # Traces and loggings
+import shlex              # Lexical analysis
+import sys                # System related methods
+
+from pathlib import Path                                  # Paths related
+from typing import Any, BinaryIO, Iterator, List, TextIO  # Type hints
+
+from common import *
+from gather_msi import read_score, somatic_header
+
+logger = setup_logging(logger="cohort_table.py")
+
+scores_header = (
+    "Sample_id\tTotal_Number_of_Sites\tNumber_of_Somatic_Sites\t%\n"
+)
+index_header = "Sample_id\tStatus\tOffset\tLines\n"
+site_statuses = ["somatic", "germline"]
+site_columns = somatic_header.rstrip("\n").split("\t") + ["other"]
+common_columns = 6
+
+
+# Processing functions
+def normalise_site(line: str, status: str) -> str:
+    """
+    Fit a site line to the columns of the cohort table: the somatic
+    columns, then the remaining fields joined in the "other" column
+
+    Parameters:
+        line    str     A line of a _somatic or _germline file
+        status  str     The site status (somatic or germline)
+
+    Return:
+                str     The site fields, one per cohort column
+
+    Example:
+    >>> normalise_site("1\t769\tGTAAA\t13\tT\tAGAGA\t3|5\n", "germline")
+    '1\t769\tGTAAA\t13\tT\tAGAGA\t\t\t\t\t3|5\n'
+    """
+    fields = line.rstrip("\n").split("\t")
+    width = len(site_columns) - 1
+    if status != "somatic":
+        # Germline sites share the first columns only
+        fields[common_columns:common_columns] = [""] * (width - common_columns)
+    fields += [""] * (width - len(fields))
+    return "\t".join(fields[:width] + [",".join(fields[width:])]) + "\n"
+
+
+def iter_sites(path: Path) -> Iterator[str]:
+    """
+    Iterate over the lines of a site file, without its header
+
+    Parameters:
+        path    Path            Path to a _somatic or _germline file
+
+    Return:
+                Iterator[str]   The site lines
+
+    Example:
+    >>> list(iter_sites(Path("tests/msisensor/msi/example._somatic")))
+    []
+    """
+    with path.open("r") as site_stream:
+        for line in site_stream:
+            if line.startswith("chromosome") or not line.strip():
+                continue
+            yield line if line.endswith("\n") else f"{line}\n"
+
+
+def append_sites(sample: str,
+                 status: str,
+                 path: Path,
+                 sites_stream: BinaryIO,
+                 index_stream: TextIO) -> int:
+    """
+    Append the sites of a sample to the cohort table, and index them
+
+    Parameters:
+        sample          str         The sample identifier
+        status          str         The site status (somatic or germline)
+        path            Path        Path to the sample site file
+        sites_stream    BinaryIO    The cohort site table
+        index_stream    TextIO      The cohort site index
+
+    Return:
+                        int         The number of appended sites
+    """
+    offset = sites_stream.tell()
+    lines = 0
+    for line in iter_sites(path):
+        site = normalise_site(line, status)
+        sites_stream.write(f"{sample}\t{status}\t{site}".encode())
+        lines += 1
+    index_stream.write(f"{sample}\t{status}\t{offset}\t{lines}\n")
+    return lines
+
+
+def cohort_table(prefixes: List[Path], outdir: Path) -> int:
+    """
+    Aggregate the results of all samples
+
+    Parameters:
+        prefixes    List[Path]  Prefixes of MSISensor msi results, named
+                                after the sample identifiers
+        outdir      Path        Path to the output directory
+
+    Return:
+                    int         The number of aggregated samples
+
+    Example:
+    >>> cohort_table([Path("msi/sample1"), Path("msi/sample2")],
+    ...              Path("cohort"))
+    2
+    """
+    outdir.mkdir(parents=True, exist_ok=True)
+    header = "\t".join(["Sample_id", "Status"] + site_columns)
+
+    with (outdir / "scores.tsv").open("w") as scores_stream, \
+            (outdir / "sites.tsv").open("wb") as sites_stream, \
+            (outdir / "sites.tsv.idx").open("w") as index_stream:
+        scores_stream.write(scores_header)
+        sites_stream.write(f"{header}\n".encode())
+        index_stream.write(index_header)
+
+        for prefix in prefixes:
+            sample = prefix.name
+            total, somatic = read_score(prefix)
+            percent = (100 * somatic / total) if total > 0 else 0
+            scores_stream.write(
+                f"{sample}\t{total}\t{somatic}\t{percent:.2f}\n"
+            )
+            for status in site_statuses:
+                append_sites(
+                    sample,
+                    status,
+                    Path(f"{prefix}_{status}"),
+                    sites_stream,
+                    index_stream
+                )
+            logger.debug(f"{sample} aggregated")
+
+    return len(prefixes)
+
+
+def load_sample_sites(outdir: Path, sample: str, status: str) -> List[str]:
+    """
+    Read the sites of a single sample out of the cohort table, using
+    the index to seek directly to them
+
+    Parameters:
+        outdir      Path        Path to the cohort directory
+        sample      str         The sample identifier
+        status      str         The site status (somatic or germline)
+
+    Return:
+                    List[str]   The site lines of this sample
+
+    Example:
+    >>> load_sample_sites(Path("cohort"), "sample1", "somatic")
+    ['sample1\tsomatic\t1\t604\tGACAA\t14\tT\tGTAAC\t0.8...\t\n']
+    """
+    with (outdir / "sites.tsv.idx").open("r") as index_stream:
+        index_stream.readline()
+        for line in index_stream:
+            name, kind, offset, lines = line.rstrip("\n").split("\t")
+            if name == sample and kind == status:
+                break
+        else:
+            raise KeyError(f"{sample} ({status}) not found in cohort index")
+
+    with (outdir / "sites.tsv").open("rb") as sites_stream:
+        sites_stream.seek(int(offset))
+        return [sites_stream.readline().decode() for _ in range(int(lines))]
+
+
+def test_cohort_table(tmp_path: Path) -> None:
+    """
+    This function tests the cohort_table and load_sample_sites functions
+
+    Example:
+    >>> pytest -v cohort_table.py -k test_cohort_table
+    """
+    import pytest
+
+    example = Path(__file__).parent.parent / "tests" / "msisensor" / "msi"
+    sample = tmp_path / "sample2"
+    sample.write_text(
+        "Total_Number_of_Sites\tNumber_of_Somatic_Sites\t%\n200\t1\t0.50\n"
+    )
+    Path(f"{sample}_somatic").write_text(
+        somatic_header + "1\t604\tGACAA\t14\tT\tGTAAC\t0.8\t1e-05\t0.01\t1\n"
+    )
+    Path(f"{sample}_germline").write_text(
+        "1\t769\tGTAAA\t13\tT\tAGAGA\t3|5\t0.9\n"
+    )
+
+    outdir = tmp_path / "cohort"
+    assert cohort_table([example / "example.", sample], outdir) == 2
+    assert (outdir / "scores.tsv").read_text().splitlines()[1:] == [
+        "example.\t0\t0\t0.00", "sample2\t200\t1\t0.50"
+    ]
+    assert load_sample_sites(outdir, "example.", "somatic") == []
+    assert load_sample_sites(outdir, "sample2", "germline") == [
+        "sample2\tgermline\t1\t769\tGTAAA\t13\tT\tAGAGA\t\t\t\t\t3|5,0.9\n"
+    ]
+
+    # Every line has the columns of the header
+    lines = (outdir / "sites.tsv").read_text().splitlines()
+    assert len(lines) == 3
+    assert {len(line.split("\t")) for line in lines} == {13}
+    with pytest.raises(KeyError):
+        load_sample_sites(outdir, "sample3", "somatic")
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("cohort msi/sample1 msi/sample2"))
+    Namespace(debug=False, outdir='cohort',
+    prefixes=['msi/sample1', 'msi/sample2'], quiet=False)
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "outdir",
+        help="Path to the output directory",
+        type=str
+    )
+
+    main_parser.add_argument(
+        "prefixes",
+        help="Prefixes of MSISensor msi results, named after the samples",
+        type=str,
+        nargs="+"
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function performs the whole aggregation sequence
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("cohort msi/sample1 msi/sample2")))
+    """
+    samples = cohort_table(
+        [Path(prefix) for prefix in args.prefixes],
+        Path(args.outdir)
+    )
+    logger.debug(f"{samples} samples aggregated in {args.outdir}")
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="cohort_table.py", args=args)
+
+    try:
+        logger.debug("Aggregating cohort")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
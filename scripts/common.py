@@ -37,10 +37,14 @@ def setup_logging(logger: str,
     else:
         logger.setLevel(logging.DEBUG or logging.INFO)
 
+    # Handlers are attached to this logger only, and not to the root one,
+    # since these scripts may also be imported within Snakemake
+    logger.handlers = []
+    logger.propagate = False
     if (args is None) or (args.quiet is False):
         ch = logging.StreamHandler()
         ch.setFormatter(logging.Formatter(
             "%(levelname)s [%(name)s]: %(message)s"
         ))
-        root.addHandler(ch)
+        logger.addHandler(ch)
     return logger
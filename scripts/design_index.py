@@ -0,0 +1,345 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script loads the design file of the pipeline without pandas, and
+keeps a pickled copy of it, in order to make the DAG startup cheap on
+large cohorts.
+
+The design is read column by column with the csv module, and validated
+as a whole: required columns, missing values and duplicated sample
+identifiers are checked once per column instead of once per line. The
+pickled index is stored next to the design file, and reused as long as
+the design path, size and modification time do not change.
+
+You can test this script with:
+pytest -v ./design_index.py
+
+Usage example:
+# Validate a design file and build its index
+python3.7 ./design_index.py design.tsv
+"""
+
+import argparse           # Parse command line
+import csv                # Read TSV files
+import logging            # Traces and loggings
+import os                 # OS related activities
+import pickle             # Serialize python objects
+import shlex              # Lexical analysis
+import sys                # System related methods
+
+from collections import Counter                 # Count hashable objects
+from pathlib import Path                        # Paths related methods
+from typing import Any, Dict, List, Optional    # Type hints
+
+from common import *
+
+logger = setup_logging(logger="design_index.py")
+
+required_columns = ["Sample_id", "Normal_Bam", "Tumor_Bam"]
+index_version = 1
+
+
+# Processing functions
+def read_design(path: Path) -> Dict[str, List[str]]:
+    """
+    Load a design file, column by column. Missing values are empty strings.
+
+    Parameters:
+        path    Path                    Path to the design file
+
+    Return:
+                Dict[str, List[str]]    The values of each column
+
+    Example:
+    >>> read_design(Path("design.tsv"))
+    {'Sample_id': ['sample1', ...], 'Normal_Bam': ['/path/to/N1.bam', ...],
+    'Tumor_Bam': ['/path/to/T1.bam', ...]}
+    """
+    with path.open("r", newline="") as design_stream:
+        reader = csv.reader(design_stream, delimiter="\t")
+        header = next(reader, [])
+        rows = [
+            row + [""] * (len(header) - len(row))
+            for row in reader if any(row)
+        ]
+    columns = list(zip(*rows)) if rows else [()] * len(header)
+    return {
+        name: list(values)
+        for name, values in zip(header, columns)
+    }
+
+
+def validate_design(design: Dict[str, List[str]],
+                    required: List[str] = required_columns) -> None:
+    """
+    Check that required columns exist and are filled, and that sample
+    identifiers are unique. Raise a ValueError otherwise.
+
+    Parameters:
+        design      Dict[str, List[str]]    The values of each column
+        required    List[str]               Names of the required columns,
+                                            e.g. the required list of
+                                            schemas/design.schemas.yaml
+
+    Example:
+    >>> validate_design(read_design(Path("design.tsv")))
+    """
+    missing = [name for name in required if name not in design]
+    if missing:
+        raise ValueError(f"Missing design columns: {', '.join(missing)}")
+
+    for name in required:
+        if not all(design[name]):
+            line = design[name].index("") + 2
+            raise ValueError(f"Empty {name} in design, line {line}")
+
+    duplicated = [
+        sample for sample, count in Counter(design["Sample_id"]).items()
+        if count > 1
+    ]
+    if duplicated:
+        raise ValueError(f"Duplicated Sample_id: {', '.join(duplicated)}")
+
+
+def test_read_design(tmp_path: Path) -> None:
+    """
+    This function tests the read_design and validate_design functions
+
+    Example:
+    >>> pytest -v design_index.py -k test_read_design
+    """
+    import pytest
+
+    design = tmp_path / "design.tsv"
+    design.write_text(
+        "Sample_id\tNormal_Bam\tTumor_Bam\tNormal_Index\n"
+        "s1\tn1.bam\tt1.bam\tn1.bai\n"
+        "s2\tn2.bam\tt2.bam\n\n"
+    )
+    columns = read_design(design)
+    assert columns == {
+        "Sample_id": ["s1", "s2"],
+        "Normal_Bam": ["n1.bam", "n2.bam"],
+        "Tumor_Bam": ["t1.bam", "t2.bam"],
+        "Normal_Index": ["n1.bai", ""]
+    }
+    validate_design(columns)
+
+    with pytest.raises(ValueError, match="Missing design columns: Tumor"):
+        validate_design({"Sample_id": [], "Normal_Bam": []})
+    with pytest.raises(ValueError, match="Empty Tumor_Bam in design, line 3"):
+        validate_design({**columns, "Tumor_Bam": ["t1.bam", ""]})
+    with pytest.raises(ValueError, match="Duplicated Sample_id: s1"):
+        validate_design({**columns, "Sample_id": ["s1", "s1"]})
+    with pytest.raises(ValueError, match="Missing design columns: Tumor_I"):
+        validate_design(columns, required_columns + ["Tumor_Index"])
+    with pytest.raises(ValueError, match="Empty Normal_Index in design"):
+        validate_design(columns, required_columns + ["Normal_Index"])
+
+    design.write_text("Sample_id\tNormal_Bam\tTumor_Bam\n")
+    assert read_design(design) == {
+        "Sample_id": [], "Normal_Bam": [], "Tumor_Bam": []
+    }
+
+
+def design_records(design: Dict[str, List[str]]) -> List[Dict[str, str]]:
+    """
+    Return the lines of a design, as dictionnaries
+
+    Parameters:
+        design  Dict[str, List[str]]    The values of each column
+
+    Return:
+                List[Dict[str, str]]    Design lines, by column name
+
+    Example:
+    >>> design_records(read_design(Path("design.tsv")))
+    [{'Sample_id': 'sample1', 'Normal_Bam': '/path/to/N1.bam', ...}]
+    """
+    return [dict(zip(design, values)) for values in zip(*design.values())]
+
+
+def load_design(path: Path,
+                index: Optional[Path] = None,
+                required: List[str] = required_columns
+                ) -> Dict[str, List[str]]:
+    """
+    Load and validate a design file, or its pickled index if the design
+    did not change since the index was built
+
+    Parameters:
+        path        Path                    Path to the design file
+        index       Path                    Path to the pickled index
+                                            (default: next to the design)
+        required    List[str]               Names of the required columns
+
+    Return:
+                Dict[str, List[str]]    The values of each column
+
+    Example:
+    >>> load_design(Path("design.tsv"))
+    {'Sample_id': ['sample1', ...], 'Normal_Bam': ['/path/to/N1.bam', ...],
+    'Tumor_Bam': ['/path/to/T1.bam', ...]}
+    """
+    index = index or Path(f"{path}.index")
+    stat = path.stat()
+    key = (
+        index_version, str(path.absolute()), stat.st_size, stat.st_mtime_ns,
+        tuple(required)
+    )
+
+    if index.exists():
+        try:
+            with index.open("rb") as index_stream:
+                cached = pickle.load(index_stream)
+            if cached["key"] == key:
+                return cached["design"]
+        except Exception as error:
+            logger.debug(f"Unreadable design index {index}: {error}")
+
+    design = read_design(path)
+    validate_design(design, required)
+    logger.debug(f"Indexing {len(design['Sample_id'])} samples of {path}")
+
+    # Written in a temporary file then moved, since several pipelines may
+    # start at once on the same design
+    tmp = index.parent / f".{index.name}.{os.getpid()}"
+    try:
+        with tmp.open("wb") as index_stream:
+            pickle.dump(
+                {"key": key, "design": design}, index_stream,
+                protocol=pickle.HIGHEST_PROTOCOL
+            )
+        os.replace(tmp, index)
+    except OSError as error:
+        logger.warning(f"Could not save the design index {index}: {error}")
+    return design
+
+
+def test_load_design(tmp_path: Path) -> None:
+    """
+    This function tests the load_design and design_records functions
+
+    Example:
+    >>> pytest -v design_index.py -k test_load_design
+    """
+    import pytest
+
+    design = tmp_path / "design.tsv"
+    design.write_text(
+        "Sample_id\tNormal_Bam\tTumor_Bam\ns1\tn1\tt1\ns2\tn2\tt2\n"
+    )
+    columns = load_design(design)
+    assert columns["Sample_id"] == ["s1", "s2"]
+    assert (tmp_path / "design.tsv.index").exists()
+
+    # The index is used as long as the design does not change
+    with (tmp_path / "design.tsv.index").open("rb") as index_stream:
+        cached = pickle.load(index_stream)
+    cached["design"]["Sample_id"] = ["cached", "cached"]
+    with (tmp_path / "design.tsv.index").open("wb") as index_stream:
+        pickle.dump(cached, index_stream)
+    assert load_design(design)["Sample_id"] == ["cached", "cached"]
+
+    # ... and as long as the required columns do not change
+    with pytest.raises(ValueError, match="Missing design columns: Tumor_I"):
+        load_design(design, required=required_columns + ["Tumor_Index"])
+
+    design.write_text(
+        "Sample_id\tNormal_Bam\tTumor_Bam\ns3\tn3\tt3\n"
+    )
+    assert load_design(design)["Sample_id"] == ["s3"]
+
+    assert design_records(columns) == [
+        {"Sample_id": "s1", "Normal_Bam": "n1", "Tumor_Bam": "t1"},
+        {"Sample_id": "s2", "Normal_Bam": "n2", "Tumor_Bam": "t2"}
+    ]
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("design.tsv"))
+    Namespace(debug=False, design='design.tsv', index=None, quiet=False)
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "design",
+        help="Path to the design file",
+        type=str
+    )
+
+    # Optional arguments
+    main_parser.add_argument(
+        "-i", "--index",
+        help="Path to the pickled index (default: next to the design file)",
+        type=str,
+        default=None
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function validates a design file and builds its index
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("design.tsv")))
+    """
+    design = load_design(
+        Path(args.design), Path(args.index) if args.index else None
+    )
+    logger.info(f"{len(design['Sample_id'])} samples in {args.design}")
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="design_index.py", args=args)
+
+    try:
+        logger.debug("Indexing design")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
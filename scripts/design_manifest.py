@@ -0,0 +1,365 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script keeps track of the bam files listed in a design file, in order
+to process only new or modified samples.
+
+The manifest is a directory next to the design file, with one TSV file per
+sample: the path, size, modification time and (optionally) checksum of
+each of its bam and bai files. A sample manifest is rewritten only when
+one of its files changed, so its modification time can be used by
+Snakemake to re-run this sample only.
+
+The diff file lists the status of each sample since the previous run:
+new, modified, unchanged or removed.
+
+You can test this script with:
+pytest -v ./design_manifest.py
+
+Usage example:
+# Update the manifest of a design file, and print the diff
+python3.7 ./design_manifest.py design.tsv
+"""
+
+import argparse           # Parse command line
+import logging            # Traces and loggings
+import os                 # OS related activities
+import shlex              # Lexical analysis
+import sys                # System related methods
+
+from pathlib import Path                        # Paths related methods
+from typing import Any, Dict, List              # Type hints
+
+from common import *
+from scan_cache import file_checksum
+
+logger = setup_logging(logger="design_manifest.py")
+
+manifest_header = "Kind\tPath\tSize\tMtime_ns\tChecksum\n"
+diff_header = "Sample_id\tStatus\n"
+file_kinds = ["Normal_Bam", "Normal_Index", "Tumor_Bam", "Tumor_Index"]
+
+
+# Processing functions
+def read_sample_manifest(path: Path) -> Dict[str, List[str]]:
+    """
+    Load the manifest of a single sample
+
+    Parameters:
+        path    Path                    Path to the sample manifest
+
+    Return:
+                Dict[str, List[str]]    Path, size, modification time and
+                                        checksum, by file kind
+
+    Example:
+    >>> read_sample_manifest(Path("design.tsv.manifest/example..tsv"))
+    {'Normal_Bam': ['tests/normal_data/example.normal.bam', '123', ...]}
+    """
+    entries = {}
+    if not path.exists():
+        return entries
+    with path.open("r") as manifest_stream:
+        manifest_stream.readline()
+        for line in manifest_stream:
+            kind, *fields = line.rstrip("\n").split("\t")
+            entries[kind] = fields
+    return entries
+
+
+def sample_manifest(sample: Dict[str, Any],
+                    previous: Dict[str, List[str]],
+                    checksum: bool = False) -> Dict[str, List[str]]:
+    """
+    Describe the files of a sample. Checksums of files whose size and
+    modification time did not change are not computed again.
+
+    Parameters:
+        sample      Dict[str, Any]          A design line, by column name
+        previous    Dict[str, List[str]]    The previous sample manifest
+        checksum    bool                    Compute files checksums
+
+    Return:
+                    Dict[str, List[str]]    The sample manifest
+
+    Example:
+    >>> sample_manifest({"Normal_Bam": "normal.bam"}, {})
+    {'Normal_Bam': ['normal.bam', '123', '1589271515000000000', '']}
+    """
+    entries = {}
+    for kind in file_kinds:
+        if not sample.get(kind):
+            continue
+        path = str(sample[kind])
+        stat = Path(path).stat()
+        fields = [path, str(stat.st_size), str(stat.st_mtime_ns), ""]
+        if checksum is True:
+            old = previous.get(kind, [])
+            if old[:3] == fields[:3] and len(old) > 3 and old[3]:
+                fields[3] = old[3]
+            else:
+                fields[3] = file_checksum(Path(path))
+        entries[kind] = fields
+    return entries
+
+
+def same_files(previous: Dict[str, List[str]],
+               current: Dict[str, List[str]]) -> bool:
+    """
+    Compare two manifests of a sample. When both have checksums, files
+    with the same path and content are considered unchanged, whatever
+    their modification time.
+
+    Parameters:
+        previous    Dict[str, List[str]]    The previous sample manifest
+        current     Dict[str, List[str]]    The current sample manifest
+
+    Return:
+                    bool                    True if files did not change
+
+    Example:
+    >>> same_files({"Normal_Bam": ["a.bam", "1", "2", ""]},
+    ...            {"Normal_Bam": ["a.bam", "1", "3", ""]})
+    False
+    """
+    if previous.keys() != current.keys():
+        return False
+    for kind, fields in current.items():
+        old = previous[kind]
+        if len(old) > 3 and old[3] and fields[3]:
+            if (old[0], old[3]) != (fields[0], fields[3]):
+                return False
+        elif old[:3] != fields[:3]:
+            return False
+    return True
+
+
+def test_same_files() -> None:
+    """
+    This function tests the same_files function
+
+    Example:
+    >>> pytest -v design_manifest.py -k test_same_files
+    """
+    old = {"Normal_Bam": ["a.bam", "1", "2", ""]}
+    assert same_files(old, {"Normal_Bam": ["a.bam", "1", "2", ""]})
+    assert not same_files(old, {"Normal_Bam": ["a.bam", "1", "3", ""]})
+    assert not same_files(old, {"Tumor_Bam": ["a.bam", "1", "2", ""]})
+    assert same_files(
+        {"Normal_Bam": ["a.bam", "1", "2", "abc"]},
+        {"Normal_Bam": ["a.bam", "1", "3", "abc"]}
+    )
+
+
+def update_manifest(bam_dict: Dict[str, Dict[str, Any]],
+                    manifest_dir: Path,
+                    checksum: bool = False) -> Dict[str, str]:
+    """
+    Update the manifest of a design, and return the status of each sample.
+    Manifests of unchanged samples keep their modification time.
+
+    Parameters:
+        bam_dict        Dict[str, Dict[str, Any]]   Design lines, by sample
+        manifest_dir    Path                        Path to the manifest
+        checksum        bool                        Compute files checksums
+
+    Return:
+                        Dict[str, str]              Status of each sample
+
+    Example:
+    >>> update_manifest(bam_dict, Path("design.tsv.manifest"))
+    {'example.': 'unchanged'}
+    """
+    manifest_dir.mkdir(parents=True, exist_ok=True)
+    statuses = {}
+    for sample, files in bam_dict.items():
+        path = manifest_dir / f"{sample}.tsv"
+        previous = read_sample_manifest(path)
+        current = sample_manifest(files, previous, checksum)
+
+        stat = None
+        if not previous:
+            statuses[sample] = "new"
+        elif same_files(previous, current):
+            statuses[sample] = "unchanged"
+            if previous == current:
+                continue
+            stat = path.stat()
+        else:
+            statuses[sample] = "modified"
+
+        with path.open("w") as manifest_stream:
+            manifest_stream.write(manifest_header)
+            for kind, fields in current.items():
+                manifest_stream.write("\t".join([kind, *fields]) + "\n")
+        if stat is not None:
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    for path in sorted(manifest_dir.glob("*.tsv")):
+        sample = path.name[:-len(".tsv")]
+        if sample not in bam_dict:
+            path.unlink()
+            statuses[sample] = "removed"
+
+    logger.debug(
+        "Samples status: "
+        + ", ".join(
+            f"{sum(s == status for s in statuses.values())} {status}"
+            for status in ["new", "modified", "unchanged", "removed"]
+        )
+    )
+    return statuses
+
+
+def write_diff(statuses: Dict[str, str], path: Path) -> None:
+    """
+    Save the status of each sample
+
+    Parameters:
+        statuses    Dict[str, str]  Status of each sample
+        path        Path            Path to the diff file
+
+    Example:
+    >>> write_diff({"example.": "new"}, Path("design.tsv.diff"))
+    """
+    with path.open("w") as diff_stream:
+        diff_stream.write(diff_header)
+        for sample, status in statuses.items():
+            diff_stream.write(f"{sample}\t{status}\n")
+
+
+def test_update_manifest(tmp_path: Path) -> None:
+    """
+    This function tests the update_manifest and write_diff functions
+
+    Example:
+    >>> pytest -v design_manifest.py -k test_update_manifest
+    """
+    for name in ["a_N.bam", "a_T.bam", "b_N.bam", "b_T.bam"]:
+        (tmp_path / name).write_text(name)
+    bam_dict = {
+        sample: {
+            "Sample_id": sample,
+            "Normal_Bam": tmp_path / f"{sample}_N.bam",
+            "Tumor_Bam": tmp_path / f"{sample}_T.bam"
+        }
+        for sample in ["a", "b"]
+    }
+    manifest = tmp_path / "design.tsv.manifest"
+    assert update_manifest(bam_dict, manifest, checksum=True) == {
+        "a": "new", "b": "new"
+    }
+    mtime = (manifest / "a.tsv").stat().st_mtime_ns
+    assert update_manifest(bam_dict, manifest) == {
+        "a": "unchanged", "b": "unchanged"
+    }
+    assert (manifest / "a.tsv").stat().st_mtime_ns == mtime
+
+    (tmp_path / "a_T.bam").write_text("modified")
+    del bam_dict["b"]
+    statuses = update_manifest(bam_dict, manifest, checksum=True)
+    assert statuses == {"a": "modified", "b": "removed"}
+    assert not (manifest / "b.tsv").exists()
+
+    write_diff(statuses, tmp_path / "design.tsv.diff")
+    assert (tmp_path / "design.tsv.diff").read_text() == (
+        diff_header + "a\tmodified\nb\tremoved\n"
+    )
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("design.tsv"))
+    Namespace(checksum=False, debug=False, design='design.tsv', quiet=False)
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "design",
+        help="Path to the design file",
+        type=str
+    )
+
+    # Optional arguments
+    main_parser.add_argument(
+        "--checksum",
+        help="Compare files checksums, not only their modification time",
+        default=False,
+        action="store_true"
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function updates the manifest of a design file
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("design.tsv")))
+    """
+    bam_dict = {}
+    with open(args.design, "r") as design_stream:
+        columns = design_stream.readline().rstrip("\n").split("\t")
+        for line in design_stream:
+            sample = dict(zip(columns, line.rstrip("\n").split("\t")))
+            bam_dict[sample["Sample_id"]] = sample
+
+    statuses = update_manifest(
+        bam_dict, Path(f"{args.design}.manifest"), args.checksum
+    )
+    write_diff(statuses, Path(f"{args.design}.diff"))
+    for sample, status in statuses.items():
+        print(f"{sample}\t{status}")
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="design_manifest.py", args=args)
+
+    try:
+        logger.debug("Updating design manifest")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
@@ -0,0 +1,341 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script converts the read count distributions written by MSISensor msi
+(the _dis file) into a compact columnar store, and loads it back as
+memory-mapped arrays.
+
+The _dis file is read as a stream, site by site, in two passes: the first
+one sizes the arrays, the second one fills them. The store is a directory
+of NumPy (.npy) files:
+
+    contigs.txt         Contig names, one per line
+    contig.npy          Contig index of each site (in contigs.txt)
+    location.npy        Location of each site
+    repeat_times.npy    Number of repeats of each site
+    repeat_unit.npy     Repeat unit of each site
+    left_flank.npy      Left flanking bases of each site
+    right_flank.npy     Right flanking bases of each site
+    normal.npy          Normal read count distributions (sites x lengths)
+    tumor.npy           Tumor read count distributions (sites x lengths)
+
+You can test this script with:
+pytest -v ./dis_store.py
+
+Usage example:
+# Convert the read count distributions of sample1
+python3.7 ./dis_store.py msisensor/msi/sample1_dis msisensor/store/sample1
+"""
+
+import argparse           # Parse command line
+import logging            # Traces and loggings
+import numpy              # Numeric arrays
+import shlex              # Lexical analysis
+import sys                # System related methods
+
+from pathlib import Path                                  # Paths related
+from typing import Any, Dict, Iterator, List, NamedTuple  # Type hints
+
+from common import *
+
+logger = setup_logging(logger="dis_store.py")
+
+site_columns = [
+    "contig", "location", "repeat_times",
+    "repeat_unit", "left_flank", "right_flank"
+]
+
+
+class DisSite(NamedTuple):
+    """
+    A site of a MSISensor read count distribution file
+    """
+    chromosome: str
+    location: int
+    left_flank: str
+    repeat_times: int
+    repeat_unit: str
+    right_flank: str
+    normal: List[int]
+    tumor: List[int]
+
+
+# Processing functions
+def iter_dis(path: Path) -> Iterator[DisSite]:
+    """
+    Iterate over the sites of a _dis file, without loading it in memory
+
+    Parameters:
+        path    Path                Path to the _dis file
+
+    Return:
+                Iterator[DisSite]   The sites, in file order
+
+    Example:
+    >>> next(iter_dis(Path("tests/msisensor/msi/example._dis")))
+    DisSite(chromosome='1', location=604, left_flank='GACAA',
+    repeat_times=14, repeat_unit='T', right_flank='GTAAC',
+    normal=[0, 0, ...], tumor=[0, 0, ...])
+    """
+    with path.open("r") as dis_stream:
+        for site in dis_stream:
+            normal = dis_stream.readline()
+            tumor = dis_stream.readline()
+            if not (normal.startswith("N:") and tumor.startswith("T:")):
+                raise ValueError(f"Malformed site in {path}: {site.strip()}")
+
+            chromosome, location, left, repeat, right = site.split()
+            times, unit = repeat.rstrip("]").split("[")
+            yield DisSite(
+                chromosome, int(location), left, int(times), unit, right,
+                list(map(int, normal.split()[1:])),
+                list(map(int, tumor.split()[1:]))
+            )
+
+
+def test_iter_dis() -> None:
+    """
+    This function tests the iter_dis function
+
+    Example:
+    >>> pytest -v dis_store.py -k test_iter_dis
+    """
+    path = Path(__file__).parent.parent / "tests" / "msisensor" / "msi"
+    sites = list(iter_dis(path / "example._dis"))
+    assert len(sites) == 458
+    assert sites[3][:6] == ("1", 1932, "TTTCT", 5, "TCC", "TCTTT")
+    assert len(sites[3].normal) == len(sites[3].tumor) == 100
+
+
+def count_dtype(max_count: int) -> Any:
+    """
+    Return the smallest unsigned integer type holding read counts
+
+    Parameters:
+        max_count   int     The highest read count
+
+    Return:
+                    dtype   numpy.uint16 or numpy.uint32
+
+    Example:
+    >>> count_dtype(1000)
+    <class 'numpy.uint16'>
+    """
+    if max_count <= numpy.iinfo(numpy.uint16).max:
+        return numpy.uint16
+    return numpy.uint32
+
+
+def test_count_dtype() -> None:
+    """
+    This function tests the count_dtype function
+
+    Example:
+    >>> pytest -v dis_store.py -k test_count_dtype
+    """
+    assert count_dtype(65535) is numpy.uint16
+    assert count_dtype(65536) is numpy.uint32
+
+
+def write_store(dis: Path, store: Path) -> int:
+    """
+    Convert a _dis file into a columnar store, with a constant memory usage
+
+    Parameters:
+        dis     Path    Path to the _dis file
+        store   Path    Path to the store directory
+
+    Return:
+                int     The number of sites
+
+    Example:
+    >>> write_store(Path("sample1_dis"), Path("store/sample1"))
+    458
+    """
+    # First pass: size the arrays
+    sites = width = max_count = 0
+    unit_len = flank_len = 1
+    contigs = {}
+    for site in iter_dis(dis):
+        sites += 1
+        width = max(width, len(site.normal), len(site.tumor))
+        max_count = max(max_count, *site.normal, *site.tumor)
+        unit_len = max(unit_len, len(site.repeat_unit))
+        flank_len = max(
+            flank_len, len(site.left_flank), len(site.right_flank)
+        )
+        contigs.setdefault(site.chromosome, len(contigs))
+    logger.debug(f"{sites} sites, {width} lengths, max count: {max_count}")
+
+    store.mkdir(parents=True, exist_ok=True)
+    (store / "contigs.txt").write_text("".join(f"{c}\n" for c in contigs))
+
+    dtypes = {
+        "contig": numpy.uint32,
+        "location": numpy.uint32,
+        "repeat_times": numpy.uint16,
+        "repeat_unit": f"S{unit_len}",
+        "left_flank": f"S{flank_len}",
+        "right_flank": f"S{flank_len}"
+    }
+    arrays = {
+        column: numpy.lib.format.open_memmap(
+            store / f"{column}.npy", mode="w+", dtype=dtype, shape=(sites,)
+        )
+        for column, dtype in dtypes.items()
+    }
+    for column in ["normal", "tumor"]:
+        arrays[column] = numpy.lib.format.open_memmap(
+            store / f"{column}.npy",
+            mode="w+",
+            dtype=count_dtype(max_count),
+            shape=(sites, width)
+        )
+
+    # Second pass: fill the memory-mapped arrays
+    for index, site in enumerate(iter_dis(dis)):
+        arrays["contig"][index] = contigs[site.chromosome]
+        arrays["location"][index] = site.location
+        arrays["repeat_times"][index] = site.repeat_times
+        arrays["repeat_unit"][index] = site.repeat_unit
+        arrays["left_flank"][index] = site.left_flank
+        arrays["right_flank"][index] = site.right_flank
+        arrays["normal"][index, :len(site.normal)] = site.normal
+        arrays["tumor"][index, :len(site.tumor)] = site.tumor
+
+    for array in arrays.values():
+        array.flush()
+    return sites
+
+
+def load_store(store: Path) -> Dict[str, Any]:
+    """
+    Load a columnar store as memory-mapped (read-only) arrays
+
+    Parameters:
+        store   Path            Path to the store directory
+
+    Return:
+                Dict[str, Any]  The arrays, by column name, and the list of
+                                contig names (under 'contigs')
+
+    Example:
+    >>> load_store(Path("store/sample1"))["normal"].shape
+    (458, 100)
+    """
+    columns = {
+        column: numpy.load(store / f"{column}.npy", mmap_mode="r")
+        for column in site_columns + ["normal", "tumor"]
+    }
+    columns["contigs"] = (store / "contigs.txt").read_text().splitlines()
+    return columns
+
+
+def test_write_load_store(tmp_path: Path) -> None:
+    """
+    This function tests the write_store and load_store functions
+
+    Example:
+    >>> pytest -v dis_store.py -k test_write_load_store
+    """
+    dis = tmp_path / "sample_dis"
+    dis.write_text(
+        "1 604 GACAA 14[T] GTAAC\nN: 0 2 70000\nT: 1 0 3\n"
+        "X 10 ACACA 5[TG] TTTTT\nN: 0 0 0\nT: 4 0 0\n"
+    )
+    assert write_store(dis, tmp_path / "store") == 2
+
+    store = load_store(tmp_path / "store")
+    assert store["contigs"] == ["1", "X"]
+    assert store["contig"].tolist() == [0, 1]
+    assert store["location"].tolist() == [604, 10]
+    assert store["repeat_unit"].tolist() == [b"T", b"TG"]
+    assert store["normal"].dtype == numpy.uint32
+    assert store["normal"].tolist() == [[0, 2, 70000], [0, 0, 0]]
+    assert store["tumor"].tolist() == [[1, 0, 3], [4, 0, 0]]
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("sample1_dis store/sample1"))
+    Namespace(debug=False, dis='sample1_dis', quiet=False,
+    store='store/sample1')
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "dis",
+        help="Path to the MSISensor read count distribution file (_dis)",
+        type=str
+    )
+
+    main_parser.add_argument(
+        "store",
+        help="Path to the output store directory",
+        type=str
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function performs the whole conversion sequence
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("sample1_dis store/sample1")))
+    """
+    sites = write_store(Path(args.dis), Path(args.store))
+    logger.debug(f"{sites} sites saved in {args.store}")
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="dis_store.py", args=args)
+
+    try:
+        logger.debug("Converting read count distributions")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
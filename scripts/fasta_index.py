@@ -0,0 +1,476 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script builds and reads samtools-like fasta indexes (.fai), and
+extracts contig sequences out of a memory-mapped fasta file.
+
+At configuration time, the reference is indexed once: an up-to-date .fai
+next to the fasta file is reused, otherwise it is built next to the fasta
+file, or in a shared cache directory when the fasta file is read-only.
+A compact contig index (names and lengths) is saved along with it.
+
+You can test this script with:
+pytest -v ./fasta_index.py
+
+Usage example:
+# Build the index of a fasta file, next to it
+python3.7 ./fasta_index.py /path/to/genome.fa
+
+# Build or reuse the indexes of a read-only fasta file
+python3.7 ./fasta_index.py /path/to/genome.fa -c /path/to/cache
+"""
+
+import argparse           # Parse command line
+import hashlib            # Checksums
+import logging            # Traces and loggings
+import mmap               # Memory-mapped files
+import os                 # OS related activities
+import shlex              # Lexical analysis
+import sys                # System related methods
+
+from pathlib import Path                          # Paths related methods
+from typing import Any, Dict, List, NamedTuple    # Type hints
+from typing import Optional, Tuple, Union         # Type hints
+
+from common import *
+
+logger = setup_logging(logger="fasta_index.py")
+
+
+class FaiEntry(NamedTuple):
+    """
+    A line of a fasta index, as described in samtools faidx documentation
+    """
+    name: str
+    length: int
+    offset: int
+    linebases: int
+    linewidth: int
+
+
+# Processing functions
+def build_fai(fasta: Path) -> List[FaiEntry]:
+    """
+    Read a fasta file line by line and index its contigs
+
+    Parameters:
+        fasta   Path            Path to the fasta file
+
+    Return:
+                List[FaiEntry]  The index entries, in fasta order
+
+    Example:
+    >>> build_fai(Path("tests/example.fa"))
+    [FaiEntry(name='1', length=645211, offset=3, linebases=60,
+    linewidth=61)]
+    """
+    entries = []
+    name = None
+    with fasta.open("rb") as fasta_stream:
+        position = 0
+        for line in fasta_stream:
+            if line.startswith(b">"):
+                if name is not None:
+                    entries.append(
+                        FaiEntry(name, length, offset, linebases, linewidth)
+                    )
+                name = line[1:].split()[0].decode()
+                length = linebases = linewidth = 0
+                offset = position + len(line)
+            elif name is not None:
+                bases = len(line.rstrip(b"\r\n"))
+                if linebases == 0:
+                    linebases, linewidth = bases, len(line)
+                length += bases
+            position += len(line)
+
+    if name is not None:
+        entries.append(FaiEntry(name, length, offset, linebases, linewidth))
+    return entries
+
+
+def test_build_fai(tmp_path: Path) -> None:
+    """
+    This function tests the build_fai function
+
+    Example:
+    >>> pytest -v fasta_index.py -k test_build_fai
+    """
+    fasta = tmp_path / "genome.fa"
+    fasta.write_text(">chr1 first\nACGT\nAC\n>chr2\nGGGG\nGG\n")
+    assert build_fai(fasta) == [
+        FaiEntry("chr1", 6, 12, 4, 5),
+        FaiEntry("chr2", 6, 26, 4, 5)
+    ]
+
+
+def write_fai(entries: List[FaiEntry], path: Path) -> None:
+    """
+    Save index entries in a samtools-like .fai file
+
+    Parameters:
+        entries     List[FaiEntry]  The index entries
+        path        Path            Path to the .fai file
+
+    Example:
+    >>> write_fai(build_fai(Path("genome.fa")), Path("genome.fa.fai"))
+    """
+    with path.open("w") as fai_stream:
+        for entry in entries:
+            fai_stream.write("\t".join(map(str, entry)) + "\n")
+
+
+def read_fai(path: Path) -> List[FaiEntry]:
+    """
+    Load a samtools-like .fai file
+
+    Parameters:
+        path    Path            Path to the .fai file
+
+    Return:
+                List[FaiEntry]  The index entries, in fasta order
+
+    Example:
+    >>> read_fai(Path("genome.fa.fai"))
+    [FaiEntry(name='1', length=645211, offset=3, linebases=60,
+    linewidth=61)]
+    """
+    entries = []
+    with path.open("r") as fai_stream:
+        for line in fai_stream:
+            name, *fields = line.rstrip("\n").split("\t")[:5]
+            entries.append(FaiEntry(name, *map(int, fields)))
+    return entries
+
+
+def load_fai(fasta: Path, fai: Optional[Path] = None) -> List[FaiEntry]:
+    """
+    Load the index of a fasta file, or build it if missing
+
+    Parameters:
+        fasta   Path            Path to the fasta file
+        fai     Path            Path to the index, when it is not stored
+                                next to the fasta file
+
+    Return:
+                List[FaiEntry]  The index entries, in fasta order
+
+    Example:
+    >>> load_fai(Path("genome.fa"))
+    [FaiEntry(name='1', length=645211, offset=3, linebases=60,
+    linewidth=61)]
+    """
+    fai = fai or Path(f"{fasta}.fai")
+    if fai.exists():
+        return read_fai(fai)
+    logger.debug(f"No index found for {fasta}, building it in memory")
+    return build_fai(fasta)
+
+
+def test_write_read_fai(tmp_path: Path) -> None:
+    """
+    This function tests the write_fai, read_fai and load_fai functions
+
+    Example:
+    >>> pytest -v fasta_index.py -k test_write_read_fai
+    """
+    fasta = tmp_path / "genome.fa"
+    fasta.write_text(">chr1\nACGT\nAC\n")
+    entries = load_fai(fasta)
+    write_fai(entries, tmp_path / "genome.fa.fai")
+    assert (tmp_path / "genome.fa.fai").read_text() == "chr1\t6\t6\t4\t5\n"
+    assert load_fai(fasta) == entries
+
+
+def write_contigs(entries: List[FaiEntry], path: Path) -> None:
+    """
+    Save the contig index: one line per contig, with its name and length,
+    in fasta order
+
+    Parameters:
+        entries     List[FaiEntry]  The fasta index entries
+        path        Path            Path to the contig index
+
+    Example:
+    >>> write_contigs(load_fai(Path("genome.fa")), Path("genome.contigs"))
+    """
+    with path.open("w") as contigs_stream:
+        contigs_stream.write("Name\tLength\n")
+        for entry in entries:
+            contigs_stream.write(f"{entry.name}\t{entry.length}\n")
+
+
+def read_contigs(path: Path) -> Dict[str, int]:
+    """
+    Load a contig index
+
+    Parameters:
+        path    Path            Path to the contig index
+
+    Return:
+                Dict[str, int]  The contig lengths, in fasta order
+
+    Example:
+    >>> read_contigs(Path("genome.contigs"))
+    {'1': 645211}
+    """
+    with path.open("r") as contigs_stream:
+        contigs_stream.readline()
+        return {
+            name: int(length)
+            for name, length in (
+                line.rstrip("\n").split("\t")[:2] for line in contigs_stream
+            )
+        }
+
+
+def is_fresh(path: Path, source: Path) -> bool:
+    """
+    Tell whether a file derived from a source exists and is up to date
+
+    Parameters:
+        path    Path    Path to the derived file
+        source  Path    Path to the source file
+
+    Return:
+                bool    True if the file is as recent as its source
+
+    Example:
+    >>> is_fresh(Path("genome.fa.fai"), Path("genome.fa"))
+    True
+    """
+    return (
+        path.exists()
+        and path.stat().st_mtime_ns >= source.stat().st_mtime_ns
+    )
+
+
+def index_reference(fasta: Path, cache_dir: Path) -> Tuple[Path, Path]:
+    """
+    Build, or reuse, the .fai and the contig index of a fasta file. An up
+    to date .fai next to the fasta file is used as is. Missing indexes are
+    written next to the fasta file, or in the cache directory when the
+    fasta file directory is read-only. Cached indexes are keyed on the
+    fasta path, size and modification time.
+
+    Parameters:
+        fasta       Path                Path to the fasta file
+        cache_dir   Path                Path to the cache directory
+
+    Return:
+                    Tuple[Path, Path]   Paths to the .fai and contig index
+
+    Example:
+    >>> index_reference(Path("/data/genome.fa"), Path("/path/to/cache"))
+    (PosixPath('/data/genome.fa.fai'), PosixPath('/data/genome.contigs'))
+    """
+    fasta = fasta.absolute()
+    directory = fasta.parent
+    if not os.access(directory, os.W_OK):
+        stat = fasta.stat()
+        key = hashlib.sha256(
+            f"{fasta}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+        ).hexdigest()[:16]
+        directory = cache_dir.absolute() / key
+        directory.mkdir(parents=True, exist_ok=True)
+
+    fai = Path(f"{fasta}.fai")
+    if not is_fresh(fai, fasta):
+        fai = directory / f"{fasta.name}.fai"
+    entries = None
+    if not is_fresh(fai, fasta):
+        logger.info(f"Indexing {fasta} in {directory}")
+        entries = build_fai(fasta)
+        # Written in a temporary file then moved, since the cache is shared
+        tmp = directory / f".{fai.name}.{os.getpid()}"
+        write_fai(entries, tmp)
+        os.replace(tmp, fai)
+
+    contigs = directory / f"{fasta.stem}.contigs"
+    if not is_fresh(contigs, fai):
+        tmp = directory / f".{contigs.name}.{os.getpid()}"
+        write_contigs(entries or read_fai(fai), tmp)
+        os.replace(tmp, contigs)
+    return fai, contigs
+
+
+def test_index_reference(tmp_path: Path, monkeypatch: Any) -> None:
+    """
+    This function tests the index_reference, write_contigs and read_contigs
+    functions
+
+    Example:
+    >>> pytest -v fasta_index.py -k test_index_reference
+    """
+    reference = tmp_path / "reference"
+    reference.mkdir()
+    fasta = reference / "genome.fa"
+    fasta.write_text(">chr1\nACGT\nAC\n>chr2\nGGGG\n")
+    cache_dir = tmp_path / "cache"
+
+    fai, contigs = index_reference(fasta, cache_dir)
+    assert (fai, contigs) == (
+        reference / "genome.fa.fai", reference / "genome.contigs"
+    )
+    assert read_fai(fai) == build_fai(fasta)
+    assert read_contigs(contigs) == {"chr1": 6, "chr2": 4}
+
+    # Up to date indexes are not written again
+    mtime = fai.stat().st_mtime_ns
+    assert index_reference(fasta, cache_dir) == (fai, contigs)
+    assert fai.stat().st_mtime_ns == mtime
+
+    # Read-only references are indexed in the cache
+    fai.unlink()
+    contigs.unlink()
+    monkeypatch.setattr(os, "access", lambda path, mode: False)
+    fai, contigs = index_reference(fasta, cache_dir)
+    assert fai.parent.parent == cache_dir
+    assert contigs.parent == fai.parent
+    assert read_contigs(contigs) == {"chr1": 6, "chr2": 4}
+    assert index_reference(fasta, cache_dir) == (fai, contigs)
+    assert not (reference / "genome.fa.fai").exists()
+
+
+def fetch(fasta_map: Union[bytes, mmap.mmap], entry: FaiEntry) -> bytes:
+    """
+    Extract the upper-cased sequence of a contig out of a (memory-mapped)
+    fasta file content
+
+    Parameters:
+        fasta_map   mmap        The memory-mapped fasta file
+        entry       FaiEntry    The index entry of the contig
+
+    Return:
+                    bytes       The contig sequence, without line breaks
+
+    Example:
+    >>> with Path("genome.fa").open("rb") as fasta_stream:
+    ...     fasta_map = mmap.mmap(
+    ...         fasta_stream.fileno(), 0, access=mmap.ACCESS_READ
+    ...     )
+    ...     fetch(fasta_map, load_fai(Path("genome.fa"))[0])
+    b'AGCCCACTGACCC...'
+    """
+    if entry.linebases == 0:
+        return b""
+    lines, rest = divmod(entry.length, entry.linebases)
+    stop = entry.offset + lines * entry.linewidth + rest
+    return fasta_map[entry.offset:stop].translate(None, b"\r\n").upper()
+
+
+def test_fetch(tmp_path: Path) -> None:
+    """
+    This function tests the fetch function
+
+    Example:
+    >>> pytest -v fasta_index.py -k test_fetch
+    """
+    fasta = tmp_path / "genome.fa"
+    fasta.write_text(">chr1\nACGT\nac\n>chr2\nGGGG\n")
+    content = fasta.read_bytes()
+    assert [fetch(content, entry) for entry in load_fai(fasta)] == [
+        b"ACGTAC", b"GGGG"
+    ]
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("genome.fa"))
+    Namespace(cache_dir=None, debug=False, fasta='genome.fa', output=None,
+    quiet=False)
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "fasta",
+        help="Path to the fasta file",
+        type=str
+    )
+
+    # Optional arguments
+    main_parser.add_argument(
+        "-o", "--output",
+        help="Path to the output index (default: next to the fasta file)",
+        type=str,
+        default=None
+    )
+
+    main_parser.add_argument(
+        "-c", "--cache-dir",
+        help="Build, or reuse, the .fai and the contig index, in this "
+             "directory when the fasta file directory is read-only",
+        type=str,
+        metavar="PATH",
+        default=None
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function builds and saves the fasta index
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("genome.fa")))
+    """
+    if args.cache_dir is not None:
+        for path in index_reference(Path(args.fasta), Path(args.cache_dir)):
+            print(path)
+        return
+
+    output = Path(args.output or f"{args.fasta}.fai")
+    write_fai(build_fai(Path(args.fasta)), output)
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="fasta_index.py", args=args)
+
+    try:
+        logger.debug("Indexing fasta")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
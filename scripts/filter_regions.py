@@ -0,0 +1,308 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script restricts the homopolymers and microsatellites list produced
+by MSISensor scan to the regions of a BED file (e.g. a capture panel).
+
+Regions are merged, and indexed by contig as sorted, non-overlapping
+intervals: finding whether a site overlaps a region is a binary search.
+The scan file is streamed, so whole-genome scans are filtered without
+being loaded in memory. The output keeps the original header line, so
+that it can be given to MSISensor msi as a regular scan file.
+
+You can test this script with:
+pytest -v ./filter_regions.py
+
+Usage example:
+# Keep the sites of a capture panel
+python3.7 ./filter_regions.py homopolymers_micosats.msi panel.bed \
+    -o panel.msi
+"""
+
+import argparse           # Parse command line
+import bisect             # Binary search in sorted lists
+import logging            # Traces and loggings
+import shlex              # Lexical analysis
+import sys                # System related methods
+
+from pathlib import Path                            # Paths related methods
+from typing import Any, Dict, List, Tuple           # Type hints
+
+from common import *
+
+logger = setup_logging(logger="filter_regions.py")
+
+bed_skipped = ("#", "track", "browser")
+
+
+# Processing functions
+def read_bed(path: Path) -> Dict[str, Tuple[List[int], List[int]]]:
+    """
+    Load a BED file as an interval index: for each contig, the sorted
+    starts and ends of its merged regions
+
+    Parameters:
+        path    Path    Path to the BED file
+
+    Return:
+                Dict[str, Tuple[List[int], List[int]]]
+                        Starts and ends of merged regions, by contig
+
+    Example:
+    >>> read_bed(Path("panel.bed"))
+    {'chr1': ([1000, 5000], [1200, 5300]), ...}
+    """
+    intervals = {}
+    with path.open("r") as bed_stream:
+        for line in bed_stream:
+            if not line.strip() or line.startswith(bed_skipped):
+                continue
+            contig, start, end = line.rstrip("\r\n").split("\t")[:3]
+            intervals.setdefault(contig, []).append((int(start), int(end)))
+
+    index = {}
+    for contig, regions in intervals.items():
+        starts, ends = [], []
+        for start, end in sorted(regions):
+            if starts and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        index[contig] = (starts, ends)
+    logger.debug(
+        f"{sum(len(starts) for starts, _ in index.values())} merged regions"
+        f" over {len(index)} contigs"
+    )
+    return index
+
+
+def overlaps(index: Dict[str, Tuple[List[int], List[int]]],
+             contig: str,
+             start: int,
+             end: int) -> bool:
+    """
+    Tell whether a 0-based, half-open, interval overlaps a region
+
+    Parameters:
+        index   Dict[str, Tuple[List[int], List[int]]]
+                        The interval index
+        contig  str     The contig of the interval
+        start   int     The start of the interval
+        end     int     The end of the interval (excluded)
+
+    Return:
+                bool    True if the interval overlaps a region
+
+    Example:
+    >>> overlaps({"1": ([10], [20])}, "1", 15, 30)
+    True
+    """
+    if contig not in index:
+        return False
+    starts, ends = index[contig]
+    position = bisect.bisect_left(starts, end) - 1
+    return position >= 0 and ends[position] > start
+
+
+def regions_span(index: Dict[str, Tuple[List[int], List[int]]]) -> int:
+    """
+    Return the number of bases covered by the regions
+
+    Parameters:
+        index   Dict[str, Tuple[List[int], List[int]]]
+                        The interval index
+
+    Return:
+                int     The number of covered bases
+
+    Example:
+    >>> regions_span({"1": ([10, 50], [20, 55])})
+    15
+    """
+    return sum(
+        end - start
+        for starts, ends in index.values()
+        for start, end in zip(starts, ends)
+    )
+
+
+def test_read_bed(tmp_path: Path) -> None:
+    """
+    This function tests the read_bed, overlaps and regions_span functions
+
+    Example:
+    >>> pytest -v filter_regions.py -k test_read_bed
+    """
+    bed = tmp_path / "panel.bed"
+    bed.write_text(
+        "track name=panel\n# comment\n"
+        "1\t100\t200\tgene1\n1\t150\t250\n1\t10\t20\n2\t0\t5\n\n"
+    )
+    index = read_bed(bed)
+    assert index == {"1": ([10, 100], [20, 250]), "2": ([0], [5])}
+    assert regions_span(index) == 165
+
+    assert overlaps(index, "1", 15, 16)
+    assert overlaps(index, "1", 5, 11)
+    assert overlaps(index, "1", 249, 300)
+    assert not overlaps(index, "1", 20, 100)
+    assert not overlaps(index, "1", 250, 260)
+    assert not overlaps(index, "1", 0, 10)
+    assert not overlaps(index, "3", 0, 10)
+
+
+def filter_scan(scan: Path,
+                index: Dict[str, Tuple[List[int], List[int]]],
+                output: Path) -> Tuple[int, int]:
+    """
+    Stream a scan file, and keep the sites overlapping a region
+
+    Parameters:
+        scan    Path    Path to the MSISensor scan file
+        index   Dict[str, Tuple[List[int], List[int]]]
+                        The interval index
+        output  Path    Path to the filtered scan file
+
+    Return:
+                Tuple[int, int]     Number of kept sites, and of sites
+
+    Example:
+    >>> filter_scan(Path("scan.msi"), read_bed(Path("panel.bed")),
+    ...             Path("panel.msi"))
+    (2104, 33112780)
+    """
+    kept = total = 0
+    with scan.open("r") as scan_stream, output.open("w") as output_stream:
+        output_stream.write(scan_stream.readline())
+        for line in scan_stream:
+            total += 1
+            contig, location, unit_length, _, times = line.split("\t", 5)[:5]
+            start = int(location)
+            end = start + int(unit_length) * int(times)
+            if overlaps(index, contig, start, end):
+                output_stream.write(line)
+                kept += 1
+    logger.info(f"{kept}/{total} sites overlap the regions")
+    return kept, total
+
+
+def test_filter_scan(tmp_path: Path) -> None:
+    """
+    This function tests the filter_scan function
+
+    Example:
+    >>> pytest -v filter_regions.py -k test_filter_scan
+    """
+    header = "chromosome\tlocation\trepeat_unit_length\t...\n"
+    sites = [
+        "1\t95\t1\t1\t5\t0\t0\tA\tCCCCC\tGGGGG\n",
+        "1\t96\t2\t3\t5\t0\t0\tAT\tCCCCC\tGGGGG\n",
+        "1\t300\t1\t1\t10\t0\t0\tA\tCCCCC\tGGGGG\n",
+        "2\t0\t1\t1\t10\t0\t0\tA\tCCCCC\tGGGGG\n"
+    ]
+    scan = tmp_path / "scan.msi"
+    scan.write_text(header + "".join(sites))
+    bed = tmp_path / "panel.bed"
+    bed.write_text("1\t100\t200\n2\t50\t60\n")
+
+    output = tmp_path / "panel.msi"
+    assert filter_scan(scan, read_bed(bed), output) == (1, 4)
+    assert output.read_text() == header + sites[1]
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("scan.msi panel.bed"))
+    Namespace(debug=False, output='regions.msi', quiet=False,
+    regions='panel.bed', scan='scan.msi')
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "scan",
+        help="Path to the MSISensor scan file",
+        type=str
+    )
+
+    main_parser.add_argument(
+        "regions",
+        help="Path to the BED file of targeted regions",
+        type=str
+    )
+
+    # Optional arguments
+    main_parser.add_argument(
+        "-o", "--output",
+        help="Path to the filtered scan file (default: %(default)s)",
+        type=str,
+        default="regions.msi"
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function filters a scan file on the regions of a BED file
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("scan.msi panel.bed")))
+    """
+    kept, _ = filter_scan(
+        Path(args.scan), read_bed(Path(args.regions)), Path(args.output)
+    )
+    if kept == 0:
+        logger.warning(f"No site overlaps the regions of {args.regions}")
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="filter_regions.py", args=args)
+
+    try:
+        logger.debug("Filtering sites on regions")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
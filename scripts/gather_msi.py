@@ -0,0 +1,351 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script gathers the MSISensor msi results of all region shards
+of a given sample into one single set of result files.
+
+The read count distributions (_dis) and the germline sites (_germline)
+are concatenated in genome order. MSISensor corrects p-values (FDR)
+within each run, so the somatic sites of the shards can not be merged:
+the gathered distributions are tested again, and corrected once, with
+the engine of rescore.py. The somatic sites (_somatic) and the summary
+score file are written from this single correction, so that a scattered
+run calls the same sites as an unscattered one.
+
+You can test this script with:
+pytest -v ./gather_msi.py
+
+Usage example:
+# Gather two shards of sample1
+python3.7 ./gather_msi.py msisensor/msi/sample1 \
+    msisensor/shards/sample1/0 msisensor/shards/sample1/1
+
+# Gather with the thresholds given to MSISensor msi
+python3.7 ./gather_msi.py msisensor/msi/sample1 \
+    msisensor/shards/sample1/0 msisensor/shards/sample1/1 -c 15 -f 0.01
+"""
+
+import argparse           # Parse command line
+import logging            # Traces and loggings
+import shlex              # Lexical analysis
+import sys                # System related methods
+import tempfile           # Temporary directories
+
+from pathlib import Path                    # Paths related methods
+from typing import Any, List, Tuple         # Type hints
+
+from common import *
+
+logger = setup_logging(logger="gather_msi.py")
+
+score_header = "Total_Number_of_Sites\tNumber_of_Somatic_Sites\t%\n"
+somatic_header = (
+    "chromosome\tlocation\tleft_flank\trepeat_times\trepeat_unit_bases\t"
+    "right_flank\tdifference\tP_value\tFDR\trank\n"
+)
+site_suffixes = ["_dis", "_germline"]
+
+
+# Processing functions
+def read_score(path: Path) -> Tuple[int, int]:
+    """
+    Return the total number of sites and the number of somatic sites
+    from a MSISensor summary score file
+
+    Parameters:
+        path    Path            Path to the MSISensor score file
+
+    Return:
+                Tuple[int, int] Total number of sites, number of somatic sites
+
+    Example:
+    >>> read_score(Path("tests/msisensor/msi/example."))
+    (0, 0)
+    """
+    with path.open("r") as score_stream:
+        score_stream.readline()
+        total, somatic, *_ = score_stream.readline().split("\t")
+    return int(total), int(somatic)
+
+
+def test_read_score() -> None:
+    """
+    This function tests the read_score function
+
+    Example:
+    >>> pytest -v gather_msi.py -k test_read_score
+    """
+    path = Path(__file__).parent.parent / "tests" / "msisensor" / "msi"
+    assert read_score(path / "example.") == (0, 0)
+
+
+def format_score(total: int, somatic: int) -> str:
+    """
+    Build a MSISensor summary score file content
+
+    Parameters:
+        total       int     Total number of sites
+        somatic     int     Number of somatic sites
+
+    Return:
+                    str     The content of the score file
+
+    Example:
+    >>> format_score(200, 3)
+    'Total_Number_of_Sites\tNumber_of_Somatic_Sites\t%\n200\t3\t1.50\n'
+    """
+    percent = (100 * somatic / total) if total > 0 else 0
+    return f"{score_header}{total}\t{somatic}\t{percent:.2f}\n"
+
+
+def test_format_score() -> None:
+    """
+    This function tests the format_score function
+
+    Example:
+    >>> pytest -v gather_msi.py -k test_format_score
+    """
+    expected = "Total_Number_of_Sites\tNumber_of_Somatic_Sites\t%\n"
+    assert format_score(200, 3) == expected + "200\t3\t1.50\n"
+    assert format_score(0, 0) == expected + "0\t0\t0.00\n"
+
+
+def concatenate(shards: List[Path], output: Path) -> None:
+    """
+    Concatenate text files in the given order. When shards start with
+    a header line (starting with 'chromosome'), it is written only once.
+
+    Parameters:
+        shards      List[Path]  Paths to the shard files, in genome order
+        output      Path        Path to the gathered file
+
+    Example:
+    >>> concatenate([Path("0_somatic"), Path("1_somatic")], Path("_somatic"))
+    """
+    header_written = False
+    with output.open("w") as out_stream:
+        for shard in shards:
+            with shard.open("r") as shard_stream:
+                first_line = shard_stream.readline()
+                if first_line.startswith("chromosome"):
+                    if header_written is False:
+                        out_stream.write(first_line)
+                        header_written = True
+                else:
+                    out_stream.write(first_line)
+
+                for line in shard_stream:
+                    out_stream.write(line)
+
+
+def test_concatenate(tmp_path: Path) -> None:
+    """
+    This function tests the concatenate function
+
+    Example:
+    >>> pytest -v gather_msi.py -k test_concatenate
+    """
+    header = "chromosome\tlocation\n"
+    shards = [tmp_path / "0", tmp_path / "1", tmp_path / "2"]
+    shards[0].write_text(header + "1\t10\n")
+    shards[1].write_text("")
+    shards[2].write_text(header + "2\t20\n2\t30\n")
+
+    concatenate(shards, tmp_path / "out")
+    expected = header + "1\t10\n2\t20\n2\t30\n"
+    assert (tmp_path / "out").read_text() == expected
+
+
+def gather_msi(shards: List[Path],
+               prefix: Path,
+               coverage: int = 20,
+               fdr: float = 0.05) -> Tuple[int, int]:
+    """
+    Gather all MSISensor msi results of a sample, and score the gathered
+    read count distributions
+
+    Parameters:
+        shards      List[Path]  Prefixes of the shard results, in genome order
+        prefix      Path        Prefix of the gathered results
+        coverage    int         Minimal coverage in both samples
+        fdr         float       FDR threshold for somatic sites
+
+    Return:
+                    Tuple[int, int] Total number of sites, number of
+                                    somatic sites
+
+    Example:
+    >>> gather_msi([Path("shards/0"), Path("shards/1")], Path("msi/sample"))
+    (6149, 12)
+    """
+    # Imported here, since rescore.py imports the headers of this script
+    from dis_store import load_store, write_store
+    from rescore import score, write_somatic
+
+    for suffix in site_suffixes:
+        logger.debug(f"Gathering {suffix} files")
+        concatenate(
+            [Path(f"{shard}{suffix}") for shard in shards],
+            Path(f"{prefix}{suffix}")
+        )
+
+    with tempfile.TemporaryDirectory(dir=prefix.parent) as tmp:
+        write_store(Path(f"{prefix}_dis"), Path(tmp))
+        store = load_store(Path(tmp))
+        scores = score(store, coverage, fdr)
+        write_somatic(store, scores, Path(f"{prefix}_somatic"))
+        del store
+    total, somatic = len(scores["sites"]), int(scores["somatic"].sum())
+
+    logger.debug(f"{somatic} somatic sites out of {total}")
+    prefix.write_text(format_score(total, somatic))
+    return total, somatic
+
+
+def test_gather_msi(tmp_path: Path) -> None:
+    """
+    This function tests the gather_msi function
+
+    Example:
+    >>> pytest -v gather_msi.py -k test_gather_msi
+    """
+    def site(location: int, normal: str, tumor: str) -> str:
+        return f"1 {location} GACAA 14[T] GTAAC\nN: {normal} \nT: {tumor} \n"
+
+    # A weak site is somatic within its own shard, but not once corrected
+    # with all the sites of the sample
+    distributions = [
+        site(604, "0 30 0", "0 0 30") + "".join(
+            site(1000 + 100 * i, "0 30 0", "0 30 0") for i in range(8)
+        ),
+        site(5000, "0 25 5", "0 17 13")
+    ]
+    shards = [tmp_path / "0", tmp_path / "1"]
+    for shard, dis in zip(shards, distributions):
+        Path(f"{shard}_dis").write_text(dis)
+        Path(f"{shard}_germline").write_text(f"{shard.name}_germline\n")
+    assert gather_msi(shards[1:], tmp_path / "alone") == (1, 1)
+
+    prefix = tmp_path / "sample"
+    assert gather_msi(shards, prefix) == (10, 1)
+    assert prefix.read_text() == format_score(10, 1)
+    assert Path(f"{prefix}_dis").read_text() == "".join(distributions)
+    assert Path(f"{prefix}_germline").read_text() == (
+        "0_germline\n1_germline\n"
+    )
+    somatic = Path(f"{prefix}_somatic").read_text().splitlines()
+    assert somatic[0] == somatic_header.rstrip("\n")
+    assert [line.split("\t")[1] for line in somatic[1:]] == ["604"]
+
+    # Scattered and unscattered runs call the same sites
+    whole = tmp_path / "whole"
+    Path(f"{whole}_dis").write_text("".join(distributions))
+    Path(f"{whole}_germline").write_text("")
+    assert gather_msi([whole], tmp_path / "unscattered") == (10, 1)
+    assert Path(f"{tmp_path}/unscattered_somatic").read_text() == (
+        Path(f"{prefix}_somatic").read_text()
+    )
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("msi/sample shards/0 shards/1"))
+    Namespace(coverage=20, debug=False, fdr=0.05, prefix='msi/sample',
+    quiet=False, shards=['shards/0', 'shards/1'])
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "prefix",
+        help="Prefix of the gathered MSISensor msi results",
+        type=str
+    )
+
+    main_parser.add_argument(
+        "shards",
+        help="Prefixes of the MSISensor msi shard results, in genome order",
+        type=str,
+        nargs="+"
+    )
+
+    # Optional arguments
+    main_parser.add_argument(
+        "-c", "--coverage",
+        help="Minimal coverage in both samples (default: %(default)s)",
+        type=int,
+        default=20
+    )
+
+    main_parser.add_argument(
+        "-f", "--fdr",
+        help="FDR threshold for somatic sites (default: %(default)s)",
+        type=float,
+        default=0.05
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function performs the whole gathering sequence
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("msi/sample shards/0 shards/1")))
+    """
+    gather_msi(
+        [Path(shard) for shard in args.shards], Path(args.prefix),
+        args.coverage, args.fdr
+    )
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="gather_msi.py", args=args)
+
+    try:
+        logger.debug("Gathering shards")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
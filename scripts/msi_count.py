@@ -0,0 +1,821 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script counts the repeat lengths of homopolymers and microsatellites
+in a pair of normal/tumor bam files, and scores microsatellite
+instability, as MSISensor msi does, in a single python process pool.
+
+For each site of the scan file (see msi_scan.py), only the reads
+overlapping the site are read, through the bam index. In each read, the
+left flanking bases are searched, the repeat units following them are
+counted, and the right flanking bases are expected right after. The
+number of repeat units is added to the read count distribution of the
+sample. Unmapped, secondary, supplementary, duplicated and QC-failed
+reads are ignored.
+
+Sites are processed by batches, distributed across a pool of processes;
+each process opens both bam files once. Outputs have the same format as
+MSISensor msi:
+
+    - PREFIX_dis: read count distributions (N: normal, T: tumor), the
+      k-th number (starting at 0) counting reads with k repeat units,
+    - PREFIX: the MSI score,
+    - PREFIX_somatic: somatic sites (see rescore.py),
+    - PREFIX_germline: germline sites (empty, as without a germline scan).
+
+When a normal sample is shared by several tumors, its distributions can
+be counted once, and saved as a profile: give the normal bam file alone
+(no tumor). The profile can then be given instead of the normal bam file,
+and only the tumor bam file is read.
+
+Cram files are read as bam files are, their reads being decoded against
+the reference fasta file given with --reference.
+
+You can test this script with:
+pytest -v ./msi_count.py
+
+Usage example:
+# Score a pair of bam files, with 16 processes
+python3.7 ./msi_count.py homopolymers_micosats.msi normal.bam tumor.bam \
+    -o msisensor/msi/sample1 -t 16
+
+# Count the normal distributions once, then score tumors against them
+python3.7 ./msi_count.py homopolymers_micosats.msi normal.bam \
+    -o normal.profile -t 16
+python3.7 ./msi_count.py homopolymers_micosats.msi normal.profile \
+    tumor1.bam -o msisensor/msi/sample1 -t 16
+
+# Score a pair of cram files
+python3.7 ./msi_count.py homopolymers_micosats.msi normal.cram tumor.cram \
+    -o msisensor/msi/sample1 -t 16 -r genome.fa
+"""
+
+import argparse           # Parse command line
+import itertools          # Iterators building blocks
+import logging            # Traces and loggings
+import multiprocessing    # Process pools
+import os                 # OS related activities
+import shlex              # Lexical analysis
+import sys                # System related methods
+import tempfile           # Temporary directories
+
+from pathlib import Path                                    # Paths
+from typing import Any, Iterator, List, NamedTuple, Optional, Tuple
+
+from common import *
+from dis_store import iter_dis, load_store, write_store
+from gather_msi import format_score
+from rescore import score, write_somatic
+
+logger = setup_logging(logger="msi_count.py")
+
+# Unmapped, secondary, QC-failed, duplicated and supplementary reads
+excluded_flags = 0x4 | 0x100 | 0x200 | 0x400 | 0x800
+profile_header = "# msi_count normal profile\n"
+_worker_bams = None
+
+
+class Site(NamedTuple):
+    """
+    A homopolymer or microsatellite of a scan file
+    """
+    chromosome: str
+    location: int
+    unit: str
+    times: int
+    left: str
+    right: str
+
+
+# Processing functions
+def read_sites(scan: Path) -> Iterator[Site]:
+    """
+    Iterate over the sites of a MSISensor scan file, without loading it in
+    memory
+
+    Parameters:
+        scan    Path            Path to the scan file
+
+    Return:
+                Iterator[Site]  The sites, in file order
+
+    Example:
+    >>> next(read_sites(Path("homopolymers_micosats.msi")))
+    Site(chromosome='1', location=604, unit='T', times=14, left='GACAA',
+    right='GTAAC')
+    """
+    with scan.open("r") as scan_stream:
+        scan_stream.readline()
+        for line in scan_stream:
+            fields = line.split()
+            yield Site(
+                fields[0], int(fields[1]), fields[7], int(fields[4]),
+                fields[8], fields[9]
+            )
+
+
+def count_repeats(sequence: str, site: Site) -> Optional[int]:
+    """
+    Count the repeat units of a site in a read sequence, between its left
+    and right flanking bases
+
+    Parameters:
+        sequence    str     The read sequence
+        site        Site    The homopolymer or microsatellite
+
+    Return:
+                    int     The number of repeat units, or None when the
+                            read does not hold the whole site
+
+    Example:
+    >>> count_repeats("GACAATTTTGTAAC", Site("1", 5, "T", 6, "GACAA",
+    ...               "GTAAC"))
+    4
+    """
+    unit_length = len(site.unit)
+    position = sequence.find(site.left)
+    while position >= 0:
+        cursor = position + len(site.left)
+        times = 0
+        while sequence.startswith(site.unit, cursor):
+            cursor += unit_length
+            times += 1
+        if sequence.startswith(site.right, cursor):
+            return times
+        position = sequence.find(site.left, position + 1)
+    return None
+
+
+def test_count_repeats() -> None:
+    """
+    This function tests the count_repeats function
+
+    Example:
+    >>> pytest -v msi_count.py -k test_count_repeats
+    """
+    homopolymer = Site("1", 5, "T", 6, "GACAA", "GTAAC")
+    assert count_repeats("CGACAATTTTTTGTAACC", homopolymer) == 6
+    assert count_repeats("GACAATTTTGTAAC", homopolymer) == 4
+    assert count_repeats("GACAAGTAAC", homopolymer) == 0
+    assert count_repeats("GACAATTTTTTGTAA", homopolymer) is None
+    assert count_repeats("ACAATTTTTTGTAAC", homopolymer) is None
+
+    microsatellite = Site("1", 5, "CA", 5, "TTGAC", "CTGAA")
+    assert count_repeats("GACTGTTGACCACACACACTGAA", microsatellite) == 4
+
+
+def distribution(bam: Any,
+                 site: Site,
+                 width: int = 100,
+                 min_mapq: int = 0) -> List[int]:
+    """
+    Build the read count distribution of a site, out of the reads
+    overlapping it
+
+    Parameters:
+        bam         AlignmentFile   The opened, indexed, bam file
+        site        Site            The homopolymer or microsatellite
+        width       int             Length of the distribution
+        min_mapq    int             Minimal mapping quality of the reads
+
+    Return:
+                    List[int]       The number of reads with k repeat
+                                    units, for each k
+
+    Example:
+    >>> distribution(pysam.AlignmentFile("normal.bam"), site)
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 31, 0, ...]
+    """
+    counts = [0] * width
+    start = max(site.location - len(site.left), 0)
+    end = site.location + len(site.unit) * site.times + len(site.right)
+    for read in bam.fetch(site.chromosome, start, end):
+        if read.flag & excluded_flags or read.mapping_quality < min_mapq:
+            continue
+        times = count_repeats(read.query_sequence or "", site)
+        if times is not None:
+            counts[min(times, width - 1)] += 1
+    return counts
+
+
+def site_line(site: Site) -> str:
+    """
+    Return the line describing a site in _dis files
+
+    Parameters:
+        site    Site    The homopolymer or microsatellite
+
+    Return:
+                str     The site line
+
+    Example:
+    >>> site_line(Site("1", 604, "T", 14, "GACAA", "GTAAC"))
+    '1 604 GACAA 14[T] GTAAC\\n'
+    """
+    return (
+        f"{site.chromosome} {site.location} {site.left} "
+        f"{site.times}[{site.unit}] {site.right}\n"
+    )
+
+
+def init_worker(reference: Optional[str], *bams: Tuple[str, str]) -> None:
+    """
+    Open the bam files once per process of the pool
+
+    Parameters:
+        reference   str                 Path to the reference fasta file,
+                                        used to decode cram files
+        bams        Tuple[str, str]     The label (N or T) and path of
+                                        each bam file
+    """
+    import pysam          # Read bam files
+
+    global _worker_bams
+    _worker_bams = [
+        (label, pysam.AlignmentFile(path, reference_filename=reference))
+        for label, path in bams
+    ]
+
+
+def count_batch(task: Tuple[List[Site], int, int, List[str]]) -> str:
+    """
+    Build the read count distributions of a batch of sites, in the bam
+    files opened by the current process
+
+    Parameters:
+        task    Tuple[List[Site], int, int, List[str]]
+                        The sites, the length of distributions, the
+                        minimal mapping quality, and the cached normal
+                        distributions of the sites (if any)
+
+    Return:
+                str     The _dis lines of the batch
+    """
+    sites, width, min_mapq, cached = task
+    lines = []
+    for index, site in enumerate(sites):
+        lines.append(site_line(site))
+        if cached:
+            lines.append(cached[index])
+        for label, bam in _worker_bams:
+            counts = distribution(bam, site, width, min_mapq)
+            lines.append(f"{label}: {' '.join(map(str, counts))} \n")
+    return "".join(lines)
+
+
+def is_profile(path: Path) -> bool:
+    """
+    Tell whether a file is a normal profile, rather than a bam file
+
+    Parameters:
+        path    Path    Path to the file
+
+    Return:
+                bool    True for normal profiles
+
+    Example:
+    >>> is_profile(Path("normal.bam"))
+    False
+    """
+    with path.open("rb") as stream:
+        return stream.read(len(profile_header)) == profile_header.encode()
+
+
+def read_profile(profile: Path) -> Iterator[Tuple[str, str]]:
+    """
+    Iterate over the cached normal distributions of a profile
+
+    Parameters:
+        profile Path        Path to the normal profile
+
+    Return:
+                Iterator[Tuple[str, str]]   Site line and normal
+                                            distribution line
+
+    Example:
+    >>> next(read_profile(Path("normal.profile")))
+    ('1 604 GACAA 14[T] GTAAC\\n', 'N: 0 0 0 ... \\n')
+    """
+    with profile.open("r") as profile_stream:
+        if profile_stream.readline() != profile_header:
+            raise ValueError(f"{profile} is not a normal profile")
+        for line in profile_stream:
+            yield line, profile_stream.readline()
+
+
+def count_lines(scan: Path,
+                bams: List[Tuple[str, str]],
+                output: Path,
+                threads: int = 1,
+                batch_size: int = 1000,
+                width: int = 100,
+                min_mapq: int = 0,
+                profile: Optional[Path] = None,
+                header: str = "",
+                reference: Optional[Path] = None) -> int:
+    """
+    Build the read count distributions of all sites of a scan file, in
+    some bam files, with a pool of processes, and save them in file order
+
+    Parameters:
+        scan        Path    Path to the scan file
+        bams        List[Tuple[str, str]]
+                            The label (N or T) and path of each bam file
+        output      Path    Path to the output file
+        threads     int     Maximum number of processes
+        batch_size  int     Number of sites given to a process at once
+        width       int     Length of the distributions
+        min_mapq    int     Minimal mapping quality of the reads
+        profile     Path    Path to a normal profile, which distributions
+                            are written before those of the bam files.
+                            Its sites must include those of the scan
+                            file, in the same order.
+        header      str     First line of the output file
+        reference   Path    Path to the reference fasta file (cram files)
+
+    Return:
+                    int     The number of sites
+
+    Example:
+    >>> count_lines(Path("scan.msi"), [("T", "tumor.bam")],
+    ...             Path("sample1_dis"), profile=Path("normal.profile"))
+    33112780
+    """
+    sites = read_sites(scan)
+    batches = iter(lambda: list(itertools.islice(sites, batch_size)), [])
+    cached = read_profile(profile) if profile is not None else None
+
+    def tasks() -> Iterator[Tuple[List[Site], int, int, List[str]]]:
+        for batch in batches:
+            lines = []
+            for site in batch if cached is not None else []:
+                # Profile sites absent from the scan (e.g. pruned) are
+                # skipped
+                expected = site_line(site)
+                line, counts = next(cached, ("", ""))
+                while line and line != expected:
+                    line, counts = next(cached, ("", ""))
+                if not line:
+                    raise ValueError(
+                        f"{profile} does not match the sites of {scan}"
+                    )
+                lines.append(counts)
+            yield batch, width, min_mapq, lines
+
+    counted = 0
+    initargs = (reference and str(reference), *bams)
+    with output.open("w") as output_stream:
+        output_stream.write(header)
+        if threads <= 1:
+            init_worker(*initargs)
+            for task in tasks():
+                output_stream.write(count_batch(task))
+                counted += len(task[0])
+            return counted
+
+        with multiprocessing.Pool(threads,
+                                  initializer=init_worker,
+                                  initargs=initargs) as pool:
+            for lines in pool.imap(count_batch, tasks()):
+                output_stream.write(lines)
+                counted += lines.count("\nN: ")
+    return counted
+
+
+def count_profile(scan: Path,
+                  normal: Path,
+                  output: Path,
+                  threads: int = 1,
+                  batch_size: int = 1000,
+                  width: int = 100,
+                  min_mapq: int = 0,
+                  reference: Optional[Path] = None) -> int:
+    """
+    Build the read count distributions of all sites of a scan file, in a
+    normal bam file, and save them as a profile, to be shared by tumors
+
+    Parameters:
+        scan        Path    Path to the scan file
+        normal      Path    Path to the normal bam file
+        output      Path    Path to the normal profile
+        threads     int     Maximum number of processes
+        batch_size  int     Number of sites given to a process at once
+        width       int     Length of the distributions
+        min_mapq    int     Minimal mapping quality of the reads
+        reference   Path    Path to the reference fasta file (cram files)
+
+    Return:
+                    int     The number of sites
+
+    Example:
+    >>> count_profile(Path("scan.msi"), Path("normal.bam"),
+    ...               Path("normal.profile"), threads=16)
+    33112780
+    """
+    # Written in a temporary file then moved: tumors never read a
+    # partial profile
+    tmp = output.parent / f".{output.name}.{os.getpid()}"
+    counted = count_lines(
+        scan, [("N", str(normal))], tmp, threads, batch_size, width,
+        min_mapq, header=profile_header, reference=reference
+    )
+    os.replace(tmp, output)
+    return counted
+
+
+def count_sites(scan: Path,
+                normal: Path,
+                tumor: Path,
+                output: Path,
+                threads: int = 1,
+                batch_size: int = 1000,
+                width: int = 100,
+                min_mapq: int = 0,
+                reference: Optional[Path] = None) -> int:
+    """
+    Build the read count distributions of all sites of a scan file, in
+    both samples, with a pool of processes, and save them in file order.
+    When the normal sample is a profile, only the tumor bam file is read.
+
+    Parameters:
+        scan        Path    Path to the scan file
+        normal      Path    Path to the normal bam file, or profile
+        tumor       Path    Path to the tumor bam file
+        output      Path    Path to the _dis file
+        threads     int     Maximum number of processes
+        batch_size  int     Number of sites given to a process at once
+        width       int     Length of the distributions
+        min_mapq    int     Minimal mapping quality of the reads
+        reference   Path    Path to the reference fasta file (cram files)
+
+    Return:
+                    int     The number of sites
+
+    Example:
+    >>> count_sites(Path("scan.msi"), Path("normal.bam"),
+    ...             Path("tumor.bam"), Path("sample1_dis"), threads=16)
+    33112780
+    """
+    if is_profile(normal):
+        return count_lines(
+            scan, [("T", str(tumor))], output, threads, batch_size, width,
+            min_mapq, normal, reference=reference
+        )
+    return count_lines(
+        scan, [("N", str(normal)), ("T", str(tumor))], output, threads,
+        batch_size, width, min_mapq, reference=reference
+    )
+
+
+def test_count_sites(tmp_path: Path) -> None:
+    """
+    This function counts the repeats of synthetic microsatellites: normal
+    reads hold the repeat of the reference, tumor reads a shifted one
+
+    Example:
+    >>> pytest -v msi_count.py -k test_count_sites
+    """
+    import pytest
+    from msi_scan import scan_fasta
+    from synthetic_data import make_bam_pair, make_reference
+
+    pytest.importorskip("pysam")
+    fasta = tmp_path / "genome.fa"
+    sequences, sites = make_reference(fasta, contigs=2, length=5000)
+    make_bam_pair(tmp_path, "s1", sequences, sites, depth=20, shift=1.0)
+    scan = tmp_path / "scan.msi"
+    scan_fasta(fasta, scan)
+
+    outputs = []
+    for threads in [1, 3]:
+        outputs.append(tmp_path / f"{threads}_dis")
+        assert count_sites(
+            scan, tmp_path / "normal" / "s1.bam",
+            tmp_path / "tumor" / "s1.bam", outputs[-1],
+            threads=threads, batch_size=7
+        ) == len(list(read_sites(scan)))
+    assert outputs[0].read_text() == outputs[1].read_text()
+
+    covered = [
+        site for site in iter_dis(outputs[0]) if sum(site.normal) > 0
+    ]
+    assert all(
+        site.normal[site.repeat_times] == sum(site.normal)
+        for site in covered
+    )
+    shifted = [site for site in covered if site.tumor[site.repeat_times] == 0]
+    assert len(shifted) == len(sites)
+
+
+def test_count_profile(tmp_path: Path) -> None:
+    """
+    This function tests the count_profile function, and the scoring of a
+    tumor against a normal profile
+
+    Example:
+    >>> pytest -v msi_count.py -k test_count_profile
+    """
+    import pytest
+    from msi_scan import scan_fasta
+    from synthetic_data import make_bam_pair, make_reference
+
+    pytest.importorskip("pysam")
+    fasta = tmp_path / "genome.fa"
+    sequences, sites = make_reference(fasta, contigs=1, length=5000)
+    normal, tumor = make_bam_pair(tmp_path, "s1", sequences, sites, depth=5)
+    scan = tmp_path / "scan.msi"
+    scan_fasta(fasta, scan)
+    total = len(list(read_sites(scan)))
+
+    profile = tmp_path / "normal.profile"
+    assert count_profile(scan, normal, profile, batch_size=3) == total
+    assert is_profile(profile) and not is_profile(normal)
+    assert profile.read_text().count("\nN: ") == total
+
+    expected = tmp_path / "pair_dis"
+    count_sites(scan, normal, tumor, expected)
+    for threads in [1, 2]:
+        output = tmp_path / f"{threads}_dis"
+        assert count_sites(
+            scan, profile, tumor, output, threads=threads, batch_size=2
+        ) == total
+        assert output.read_text() == expected.read_text()
+
+    # Sites missing from the scan file (e.g. pruned) are skipped
+    lines = scan.read_text().splitlines(True)
+    pruned = tmp_path / "pruned.msi"
+    pruned.write_text("".join(lines[::2]))
+    count_sites(pruned, profile, tumor, tmp_path / "pruned_dis")
+    count_sites(pruned, normal, tumor, expected)
+    assert (tmp_path / "pruned_dis").read_text() == expected.read_text()
+
+    # A profile only matches sites it was counted on, in the same order
+    other = tmp_path / "other.msi"
+    other.write_text("".join(lines[:1] + lines[:0:-1]))
+    with pytest.raises(ValueError, match="does not match the sites"):
+        count_sites(other, profile, tumor, tmp_path / "other_dis")
+
+
+def test_count_cram(tmp_path: Path) -> None:
+    """
+    This function counts the repeats of the same reads, stored in bam and
+    in cram files
+
+    Example:
+    >>> pytest -v msi_count.py -k test_count_cram
+    """
+    import pytest
+    from msi_scan import scan_fasta
+    from synthetic_data import make_bam_pair, make_reference
+
+    pysam = pytest.importorskip("pysam")
+    fasta = tmp_path / "genome.fa"
+    sequences, sites = make_reference(fasta, contigs=1, length=5000)
+    bams = make_bam_pair(tmp_path, "s1", sequences, sites, depth=5)
+    scan = tmp_path / "scan.msi"
+    scan_fasta(fasta, scan)
+
+    crams = []
+    for bam in bams:
+        crams.append(bam.with_suffix(".cram"))
+        pysam.view(
+            "-C", "-T", str(fasta), "-o", str(crams[-1]), str(bam),
+            catch_stdout=False
+        )
+        pysam.index(str(crams[-1]))
+
+    expected = tmp_path / "bam_dis"
+    count_sites(scan, *bams, expected)
+    for threads in [1, 2]:
+        output = tmp_path / f"{threads}_dis"
+        count_sites(scan, *crams, output, threads, reference=fasta)
+        assert output.read_text() == expected.read_text()
+
+    profile = tmp_path / "normal.profile"
+    count_profile(scan, crams[0], profile, reference=fasta)
+    count_sites(scan, profile, crams[1], output, reference=fasta)
+    assert output.read_text() == expected.read_text()
+
+
+def score_dis(dis: Path,
+              prefix: Path,
+              coverage: int = 20,
+              fdr: float = 0.05) -> Tuple[int, int]:
+    """
+    Score a _dis file, and save the MSI score, somatic and germline sites
+    as MSISensor msi does
+
+    Parameters:
+        dis         Path    Path to the _dis file
+        prefix      Path    Prefix of the output files
+        coverage    int     Minimal coverage in both samples
+        fdr         float   FDR threshold for somatic sites
+
+    Return:
+                    Tuple[int, int]     Number of tested and somatic sites
+
+    Example:
+    >>> score_dis(Path("msi/sample1_dis"), Path("msi/sample1"))
+    (1003, 3)
+    """
+    with tempfile.TemporaryDirectory(dir=prefix.parent) as tmp:
+        write_store(dis, Path(tmp))
+        store = load_store(Path(tmp))
+        scores = score(store, coverage, fdr)
+        write_somatic(store, scores, Path(f"{prefix}_somatic"))
+        del store
+    total, somatic = len(scores["sites"]), int(scores["somatic"].sum())
+    prefix.write_text(format_score(total, somatic))
+    Path(f"{prefix}_germline").write_text("")
+    return total, somatic
+
+
+def test_score_dis(tmp_path: Path) -> None:
+    """
+    This function tests the score_dis function
+
+    Example:
+    >>> pytest -v msi_count.py -k test_score_dis
+    """
+    dis = tmp_path / "sample_dis"
+    dis.write_text(
+        "1 604 GACAA 14[T] GTAAC\nN: 0 30 0 \nT: 0 0 30 \n"
+        "1 900 ACCTC 14[T] GAGAC\nN: 0 30 0 \nT: 0 30 0 \n"
+        "1 990 ACCTC 14[T] GAGAC\nN: 0 3 0 \nT: 0 0 3 \n"
+    )
+    prefix = tmp_path / "sample"
+    assert score_dis(dis, prefix) == (2, 1)
+    assert prefix.read_text().splitlines()[1] == "2\t1\t50.00"
+    assert Path(f"{prefix}_somatic").read_text().splitlines()[1].startswith(
+        "1\t604\tGACAA\t14\tT\tGTAAC\t1.00000\t"
+    )
+    assert Path(f"{prefix}_germline").read_text() == ""
+    assert [path.name for path in tmp_path.iterdir() if path.is_dir()] == []
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("scan.msi normal.bam tumor.bam -o sample1"))
+    Namespace(batch_size=1000, coverage=20, debug=False, fdr=0.05,
+    min_mapq=0, normal='normal.bam', output='sample1', quiet=False,
+    reference=None, scan='scan.msi', threads=1, tumor='tumor.bam')
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "scan",
+        help="Path to the homopolymers and microsatellites file",
+        type=str
+    )
+
+    main_parser.add_argument(
+        "normal",
+        help="Path to the normal bam file (indexed), or to its profile",
+        type=str
+    )
+
+    main_parser.add_argument(
+        "tumor",
+        help="Path to the tumor bam file (indexed). Without tumor, the "
+             "normal profile is written",
+        type=str,
+        nargs="?",
+        default=None
+    )
+
+    main_parser.add_argument(
+        "-o", "--output",
+        help="Prefix of the output files, or path to the normal profile",
+        type=str,
+        required=True
+    )
+
+    # Optional arguments
+    main_parser.add_argument(
+        "-t", "--threads",
+        help="Maximum number of processes (default: %(default)s)",
+        type=int,
+        default=1
+    )
+
+    main_parser.add_argument(
+        "-b", "--batch-size",
+        help="Number of sites given to a process at once "
+             "(default: %(default)s)",
+        type=int,
+        default=1000
+    )
+
+    main_parser.add_argument(
+        "-c", "--coverage",
+        help="Minimal coverage in both samples (default: %(default)s)",
+        type=int,
+        default=20
+    )
+
+    main_parser.add_argument(
+        "-f", "--fdr",
+        help="FDR threshold for somatic sites (default: %(default)s)",
+        type=float,
+        default=0.05
+    )
+
+    main_parser.add_argument(
+        "-m", "--min-mapq",
+        help="Minimal mapping quality of the reads (default: %(default)s)",
+        type=int,
+        default=0
+    )
+
+    main_parser.add_argument(
+        "-r", "--reference",
+        help="Path to the reference fasta file, used to decode cram files",
+        type=str,
+        default=None
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function counts repeats in both samples, then scores MSI. Without
+    tumor, it only counts repeats in the normal sample, and saves them as
+    a profile.
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("scan.msi normal.bam tumor.bam -o s1")))
+    """
+    prefix = Path(args.output)
+    prefix.parent.mkdir(parents=True, exist_ok=True)
+    reference = Path(args.reference) if args.reference else None
+    if args.tumor is None:
+        sites = count_profile(
+            Path(args.scan), Path(args.normal), prefix, args.threads,
+            args.batch_size, min_mapq=args.min_mapq, reference=reference
+        )
+        logger.info(f"{sites} sites counted in {args.normal}")
+        return
+
+    sites = count_sites(
+        Path(args.scan), Path(args.normal), Path(args.tumor),
+        Path(f"{prefix}_dis"), args.threads, args.batch_size,
+        min_mapq=args.min_mapq, reference=reference
+    )
+    logger.debug(f"{sites} sites counted")
+    total, somatic = score_dis(
+        Path(f"{prefix}_dis"), prefix, args.coverage, args.fdr
+    )
+    logger.info(f"{somatic} somatic sites out of {total}")
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="msi_count.py", args=args)
+
+    try:
+        logger.debug("Counting repeats and scoring MSI")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
@@ -0,0 +1,445 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script scans a fasta-formatted reference in search for homopolymers
+and microsatellites, and writes them in the same format as MSISensor scan.
+
+The reference is memory-mapped and read through its index (.fai, built in
+memory if missing). Contigs are scanned in parallel, in a pool of processes,
+and written in fasta order.
+
+Options are named after MSISensor scan ones, so that the same extra
+parameters can be used with both tools.
+
+You can test this script with:
+pytest -v ./msi_scan.py
+
+Usage example:
+# Scan a genome with 8 processes
+python3.7 ./msi_scan.py /path/to/genome.fa -o homopolymers_micosats.msi -t 8
+"""
+
+import argparse           # Parse command line
+import logging            # Traces and loggings
+import mmap               # Memory-mapped files
+import multiprocessing    # Process pools
+import re                 # Regular expressions
+import shlex              # Lexical analysis
+import sys                # System related methods
+
+from pathlib import Path                          # Paths related methods
+from typing import Any, Iterator, Optional        # Type hints
+
+from common import *
+from fasta_index import fetch, load_fai
+
+logger = setup_logging(logger="msi_scan.py")
+
+scan_header = (
+    "chromosome\tlocation\trepeat_unit_length\trepeat_unit_binary\t"
+    "repeat_times\tleft_flank_binary\tright_flank_binary\t"
+    "repeat_unit_bases\tleft_flank_bases\tright_flank_bases\n"
+)
+base_codes = {ord("A"): 0, ord("C"): 1, ord("G"): 2, ord("T"): 3}
+acgt = re.compile(rb"[ACGT]*")
+
+# Each process of the pool works on its own view of the reference
+_worker_fasta = None
+
+
+# Processing functions
+def repeat_pattern(min_homopolymer: int = 5,
+                   max_unit: int = 5,
+                   min_repeats: int = 3,
+                   homopolymers_only: bool = False) -> "re.Pattern":
+    """
+    Build the regular expression matching homopolymers and microsatellites.
+
+    At each position, shorter repeat units are tried first, and the scan
+    resumes after the end of the matched repeat, as MSISensor scan does.
+
+    Parameters:
+        min_homopolymer     int     Minimal homopolymer size
+        max_unit            int     Maximal length of microsatellite unit
+        min_repeats         int     Minimal repeat times of microsatellites
+        homopolymers_only   bool    Only search for homopolymers
+
+    Return:
+                            Pattern The compiled regular expression
+
+    Example:
+    >>> repeat_pattern(5, 3, 3).pattern
+    b'([ACGT])\\1{4,}|([ACGT]{2})\\2{2,}|([ACGT]{3})\\3{2,}'
+    """
+    alternatives = [rb"([ACGT])\1{%d,}" % (min_homopolymer - 1)]
+    if homopolymers_only is False:
+        alternatives += [
+            rb"([ACGT]{%d})\%d{%d,}" % (unit, unit, min_repeats - 1)
+            for unit in range(2, max_unit + 1)
+        ]
+    return re.compile(b"|".join(alternatives))
+
+
+def encode(bases: bytes) -> int:
+    """
+    Return the 2-bits per base binary encoding of a sequence, as used
+    by MSISensor (A=0, C=1, G=2, T=3)
+
+    Parameters:
+        bases   bytes   A nucleic sequence
+
+    Return:
+                int     The encoded sequence
+
+    Example:
+    >>> encode(b"GCCC")
+    149
+    """
+    code = 0
+    for base in bases:
+        code = (code << 2) | base_codes[base]
+    return code
+
+
+def test_encode() -> None:
+    """
+    This function tests the encode function against MSISensor documentation
+
+    Example:
+    >>> pytest -v msi_scan.py -k test_encode
+    """
+    assert [encode(b"GCCC"), encode(b"AGCCG"), encode(b"GGGTC")] == [
+        149, 150, 685
+    ]
+
+
+def scan_sequence(name: str,
+                  sequence: bytes,
+                  min_homopolymer: int = 5,
+                  max_homopolymer: int = 50,
+                  context: int = 5,
+                  max_unit: int = 5,
+                  min_repeats: int = 3,
+                  homopolymers_only: bool = False) -> Iterator[str]:
+    """
+    Search homopolymers and microsatellites in a sequence
+
+    Parameters:
+        name                str     Name of the contig
+        sequence            bytes   Upper-cased sequence of the contig
+        min_homopolymer     int     Minimal homopolymer size
+        max_homopolymer     int     Maximal homopolymer size
+        context             int     Length of the flanking regions
+        max_unit            int     Maximal length of microsatellite unit
+        min_repeats         int     Minimal repeat times of microsatellites
+        homopolymers_only   bool    Only search for homopolymers
+
+    Return:
+                            Iterator[str]   Scan lines, without header
+
+    Example:
+    >>> list(scan_sequence("1", b"AGCCGGCCCGCCCGCCCGGGTC"))
+    ['1\t5\t4\t149\t3\t150\t685\tGCCC\tAGCCG\tGGGTC\n']
+    """
+    pattern = repeat_pattern(
+        min_homopolymer, max_unit, min_repeats, homopolymers_only
+    )
+    for match in pattern.finditer(sequence, context):
+        unit = match.group(match.lastindex)
+        start, stop = match.span()
+        times = (stop - start) // len(unit)
+
+        if len(unit) == 1 and times > max_homopolymer:
+            continue
+
+        left = sequence[start - context:start]
+        right = sequence[stop:stop + context]
+        if len(right) < context:
+            break
+        if acgt.fullmatch(left) is None or acgt.fullmatch(right) is None:
+            continue
+
+        yield (
+            f"{name}\t{start}\t{len(unit)}\t{encode(unit)}\t{times}\t"
+            f"{encode(left)}\t{encode(right)}\t{unit.decode()}\t"
+            f"{left.decode()}\t{right.decode()}\n"
+        )
+
+
+def test_scan_sequence() -> None:
+    """
+    This function tests the scan_sequence function
+
+    Example:
+    >>> pytest -v msi_scan.py -k test_scan_sequence
+    """
+    expected = ["1\t5\t4\t149\t3\t150\t685\tGCCC\tAGCCG\tGGGTC\n"]
+    assert list(scan_sequence("1", b"AGCCGGCCCGCCCGCCCGGGTC")) == expected
+
+    # Flanks must not contain unknown bases, homopolymers must be long enough
+    assert list(scan_sequence("1", b"ANCCGGCCCGCCCGCCCGGGTC")) == []
+    assert list(scan_sequence("1", b"CCGCGAAAAGCGCG")) == []
+    assert len(list(scan_sequence("1", b"CCGCGAAAAAGCGCG"))) == 1
+
+
+def init_worker(fasta: str) -> None:
+    """
+    Memory-map the reference once per process of the pool
+
+    Parameters:
+        fasta   str     Path to the fasta file
+    """
+    global _worker_fasta
+    with open(fasta, "rb") as fasta_stream:
+        _worker_fasta = mmap.mmap(
+            fasta_stream.fileno(), 0, access=mmap.ACCESS_READ
+        )
+
+
+def scan_contig(task: Any) -> str:
+    """
+    Scan a contig of the memory-mapped reference
+
+    Parameters:
+        task    Tuple[FaiEntry, Dict[str, Any]]     The contig index entry,
+                                                    and the scan options
+
+    Return:
+                str     Scan lines of the whole contig
+    """
+    entry, options = task
+    sequence = fetch(_worker_fasta, entry)
+    logger.debug(f"Scanning {entry.name} ({entry.length} bases)")
+    return "".join(scan_sequence(entry.name, sequence, **options))
+
+
+def scan_fasta(fasta: Path,
+               output: Path,
+               threads: int = 1,
+               fai: Optional[Path] = None,
+               **options: Any) -> None:
+    """
+    Scan all contigs of a fasta file, in parallel, and save the results
+    in fasta order
+
+    Parameters:
+        fasta       Path    Path to the fasta file
+        output      Path    Path to the output scan file
+        threads     int     Maximum number of processes
+        fai         Path    Path to the fasta index (default: next to
+                            the fasta file)
+        options     Any     Options given to scan_sequence
+
+    Example:
+    >>> scan_fasta(Path("genome.fa"), Path("scan.msi"), threads=4)
+    """
+    entries = load_fai(fasta, fai)
+    tasks = [(entry, options) for entry in entries]
+    threads = max(1, min(threads, len(entries)))
+    logger.debug(f"Scanning {len(entries)} contigs with {threads} processes")
+
+    with output.open("w") as scan_stream:
+        scan_stream.write(scan_header)
+        if threads == 1:
+            init_worker(str(fasta))
+            for task in tasks:
+                scan_stream.write(scan_contig(task))
+            return
+
+        with multiprocessing.Pool(threads,
+                                  initializer=init_worker,
+                                  initargs=(str(fasta),)) as pool:
+            for lines in pool.imap(scan_contig, tasks):
+                scan_stream.write(lines)
+
+
+def test_scan_fasta(tmp_path: Path) -> None:
+    """
+    This function checks the scan of tests/example.fa against the sites
+    listed by MSISensor msi in tests/msisensor/msi/example._dis. MSISensor
+    msi keeps homopolymers of 10 to 50 bases, and microsatellites repeated
+    5 to 40 times (default distribution analysis thresholds).
+
+    Example:
+    >>> pytest -v msi_scan.py -k test_scan_fasta
+    """
+    prefix = Path(__file__).parent.parent / "tests"
+    expected = []
+    with (prefix / "msisensor" / "msi" / "example._dis").open("r") as dis:
+        for line in dis:
+            if not line.startswith(("N:", "T:")):
+                expected.append(tuple(line.split()))
+
+    output = tmp_path / "scan.msi"
+    scan_fasta(prefix / "example.fa", output, threads=2)
+    got = []
+    with output.open("r") as scan:
+        assert scan.readline() == scan_header
+        for line in scan:
+            chrom, loc, unit_len, _, times, _, _, unit, left, right = \
+                line.split()
+            if int(unit_len) == 1 and not 10 <= int(times) <= 50:
+                continue
+            if int(unit_len) > 1 and not 5 <= int(times) <= 40:
+                continue
+            got.append((chrom, loc, left, f"{times}[{unit}]", right))
+
+    assert got == expected
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("genome.fa -o scan.msi"))
+    Namespace(context=5, debug=False, fai=None, fasta='genome.fa',
+    max_homopolymer=50, max_unit=5, min_homopolymer=5, min_repeats=3,
+    homopolymers_only=0, output='scan.msi', quiet=False, threads=1)
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "fasta",
+        help="Path to the fasta-formatted reference",
+        type=str
+    )
+
+    main_parser.add_argument(
+        "-o", "--output",
+        help="Path to the output homopolymers and microsatellites file",
+        type=str,
+        required=True
+    )
+
+    # Optional arguments, named after MSISensor scan ones
+    main_parser.add_argument(
+        "-l", "--min-homopolymer",
+        help="Minimal homopolymer size (default: %(default)s)",
+        type=int,
+        default=5
+    )
+
+    main_parser.add_argument(
+        "-c", "--context",
+        help="Context length (default: %(default)s)",
+        type=int,
+        default=5
+    )
+
+    main_parser.add_argument(
+        "-m", "--max-homopolymer",
+        help="Maximal homopolymer size (default: %(default)s)",
+        type=int,
+        default=50
+    )
+
+    main_parser.add_argument(
+        "-s", "--max-unit",
+        help="Maximal length of microsatellite (default: %(default)s)",
+        type=int,
+        default=5
+    )
+
+    main_parser.add_argument(
+        "-r", "--min-repeats",
+        help="Minimal repeat times of microsatellite (default: %(default)s)",
+        type=int,
+        default=3
+    )
+
+    main_parser.add_argument(
+        "-p", "--homopolymers-only",
+        help="Output homopolymers only, 0: no; 1: yes "
+             "(default: %(default)s)",
+        type=int,
+        choices=[0, 1],
+        default=0
+    )
+
+    main_parser.add_argument(
+        "-t", "--threads",
+        help="Maximum number of processes (default: %(default)s)",
+        type=int,
+        default=1
+    )
+
+    main_parser.add_argument(
+        "--fai",
+        help="Path to the fasta index (default: next to the fasta file)",
+        type=str,
+        metavar="PATH",
+        default=None
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function performs the whole scan sequence
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("genome.fa -o scan.msi")))
+    """
+    scan_fasta(
+        Path(args.fasta),
+        Path(args.output),
+        threads=args.threads,
+        fai=Path(args.fai) if args.fai else None,
+        min_homopolymer=args.min_homopolymer,
+        max_homopolymer=args.max_homopolymer,
+        context=args.context,
+        max_unit=args.max_unit,
+        min_repeats=args.min_repeats,
+        homopolymers_only=bool(args.homopolymers_only)
+    )
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="msi_scan.py", args=args)
+
+    try:
+        logger.debug("Scanning reference")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
@@ -0,0 +1,334 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script aggregates the Snakemake benchmark files of the pipeline into
+performance tables.
+
+Benchmark files are expected in one directory per rule:
+benchmarks/{rule}/{name}.tsv, where name is the sample (or the sample and
+shard) of the job. Two tables are written:
+
+    - one line per job: runtime, peak memory, bytes read and written,
+    - one line per rule: number of jobs, median and 95th percentile of the
+      runtime, peak memory and total bytes read.
+
+You can test this script with:
+pytest -v ./performance_report.py
+
+Usage example:
+# Aggregate the benchmarks of a working directory
+python3.7 ./performance_report.py benchmarks -r rules.tsv -j jobs.tsv
+"""
+
+import argparse           # Parse command line
+import logging            # Traces and loggings
+import shlex              # Lexical analysis
+import sys                # System related methods
+
+from pathlib import Path                        # Paths related methods
+from typing import Any, Dict, List, Optional    # Type hints
+
+from common import *
+
+logger = setup_logging(logger="performance_report.py")
+
+jobs_header = "Rule\tName\tSeconds\tMax_rss_mb\tRead_mb\tWritten_mb\n"
+rules_header = (
+    "Rule\tJobs\tRuntime_p50_s\tRuntime_p95_s\tMax_rss_mb\tRead_mb\n"
+)
+measure_columns = {
+    "s": "seconds",
+    "max_rss": "max_rss_mb",
+    "io_in": "read_mb",
+    "io_out": "written_mb"
+}
+
+
+# Processing functions
+def read_measures(path: Path) -> Optional[Dict[str, float]]:
+    """
+    Read the measures of a Snakemake benchmark file. When the job was
+    benchmarked several times, the worst value of each measure is kept.
+    Missing values ("-" or "NA") count for nothing.
+
+    Parameters:
+        path    Path                Path to the benchmark file
+
+    Return:
+                Dict[str, float]    Seconds, max RSS, MB read and written,
+                                    or None for an empty benchmark
+
+    Example:
+    >>> read_measures(Path("benchmarks/msi/sample1.tsv"))
+    {'seconds': 1534.25, 'max_rss_mb': 6120.5, 'read_mb': 10240.2, ...}
+    """
+    measures = None
+    with path.open("r") as benchmark_stream:
+        columns = benchmark_stream.readline().rstrip("\n").split("\t")
+        for line in benchmark_stream:
+            fields = dict(zip(columns, line.rstrip("\n").split("\t")))
+            if measures is None:
+                measures = dict.fromkeys(measure_columns.values(), 0.0)
+            for column, measure in measure_columns.items():
+                try:
+                    value = float(fields.get(column, "-"))
+                except ValueError:
+                    continue
+                measures[measure] = max(measures[measure], value)
+    return measures
+
+
+def collect_jobs(root: Path) -> List[Dict[str, Any]]:
+    """
+    Read all benchmark files of a benchmarks directory
+
+    Parameters:
+        root    Path                    Path to the benchmarks directory
+
+    Return:
+                List[Dict[str, Any]]    Measures of each job, with its rule
+                                        and name, sorted by rule and name
+
+    Example:
+    >>> collect_jobs(Path("benchmarks"))
+    [{'rule': 'cohort', 'name': 'cohort', 'seconds': 12.5, ...}, ...]
+    """
+    jobs = []
+    for path in sorted(root.glob("*/*.tsv")):
+        measures = read_measures(path)
+        if measures is None:
+            logger.warning(f"Empty benchmark file: {path}")
+            continue
+        jobs.append({
+            "rule": path.parent.name,
+            "name": path.name[:-len(".tsv")],
+            **measures
+        })
+    logger.debug(f"{len(jobs)} benchmark files read in {root}")
+    return jobs
+
+
+def percentile(values: List[float], quantile: float) -> float:
+    """
+    Return a percentile of a list of values, with linear interpolation
+    between the closest ranks
+
+    Parameters:
+        values      List[float]     The values
+        quantile    float           The percentile, between 0 and 100
+
+    Return:
+                    float           The percentile of the values
+
+    Example:
+    >>> percentile([1, 2, 3, 4], 50)
+    2.5
+    """
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * quantile / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize(jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Aggregate the measures of all jobs of each rule
+
+    Parameters:
+        jobs    List[Dict[str, Any]]    Measures of each job
+
+    Return:
+                List[Dict[str, Any]]    Aggregated measures of each rule
+
+    Example:
+    >>> summarize(collect_jobs(Path("benchmarks")))
+    [{'rule': 'msi', 'jobs': 12, 'runtime_p50': 900.1, ...}, ...]
+    """
+    by_rule = {}
+    for job in jobs:
+        by_rule.setdefault(job["rule"], []).append(job)
+
+    summary = []
+    for rule, rule_jobs in by_rule.items():
+        runtimes = [job["seconds"] for job in rule_jobs]
+        summary.append({
+            "rule": rule,
+            "jobs": len(rule_jobs),
+            "runtime_p50": percentile(runtimes, 50),
+            "runtime_p95": percentile(runtimes, 95),
+            "max_rss_mb": max(job["max_rss_mb"] for job in rule_jobs),
+            "read_mb": sum(job["read_mb"] for job in rule_jobs)
+        })
+    return summary
+
+
+def test_summarize(tmp_path: Path) -> None:
+    """
+    This function tests the read_measures, collect_jobs, percentile and
+    summarize functions
+
+    Example:
+    >>> pytest -v performance_report.py -k test_summarize
+    """
+    assert percentile([4, 1, 3, 2], 50) == 2.5
+    assert percentile([5], 95) == 5
+    assert percentile(list(range(101)), 95) == 95
+
+    header = "s\th:m:s\tmax_rss\tmax_vms\tmax_uss\tmax_pss\tio_in\tio_out\n"
+    (tmp_path / "msi").mkdir()
+    for index, seconds in enumerate([10, 20, 30]):
+        (tmp_path / "msi" / f"s{index}.tsv").write_text(
+            f"{header}{seconds}\t-\t{seconds * 10}\t1\t1\t1\t5\t1\n"
+        )
+    (tmp_path / "cohort").mkdir()
+    (tmp_path / "cohort" / "cohort.tsv").write_text(
+        f"{header}1\t-\t-\t-\t-\t-\tNA\tNA\n2\t-\t64\t-\t-\t-\tNA\tNA\n"
+    )
+    (tmp_path / "cohort" / "empty.tsv").write_text(header)
+    (tmp_path / "resources.tsv").write_text("Rule\tName\n")
+
+    jobs = collect_jobs(tmp_path)
+    assert [(job["rule"], job["name"]) for job in jobs] == [
+        ("cohort", "cohort"), ("msi", "s0"), ("msi", "s1"), ("msi", "s2")
+    ]
+    assert jobs[0] == {
+        "rule": "cohort", "name": "cohort", "seconds": 2.0,
+        "max_rss_mb": 64.0, "read_mb": 0.0, "written_mb": 0.0
+    }
+
+    summary = summarize(jobs)
+    assert summary[1] == {
+        "rule": "msi", "jobs": 3, "runtime_p50": 20.0, "runtime_p95": 29.0,
+        "max_rss_mb": 300.0, "read_mb": 15.0
+    }
+
+
+def write_tables(jobs: List[Dict[str, Any]],
+                 summary: List[Dict[str, Any]],
+                 rules_path: Path,
+                 jobs_path: Path) -> None:
+    """
+    Save the per-rule and per-job performance tables
+
+    Parameters:
+        jobs        List[Dict[str, Any]]    Measures of each job
+        summary     List[Dict[str, Any]]    Aggregated measures of each rule
+        rules_path  Path                    Path to the per-rule table
+        jobs_path   Path                    Path to the per-job table
+
+    Example:
+    >>> write_tables(jobs, summary, Path("rules.tsv"), Path("jobs.tsv"))
+    """
+    with rules_path.open("w") as rules_stream:
+        rules_stream.write(rules_header)
+        for line in summary:
+            rules_stream.write(
+                f"{line['rule']}\t{line['jobs']}\t"
+                f"{line['runtime_p50']:.2f}\t{line['runtime_p95']:.2f}\t"
+                f"{line['max_rss_mb']:.2f}\t{line['read_mb']:.2f}\n"
+            )
+
+    with jobs_path.open("w") as jobs_stream:
+        jobs_stream.write(jobs_header)
+        for job in jobs:
+            jobs_stream.write(
+                f"{job['rule']}\t{job['name']}\t{job['seconds']:.2f}\t"
+                f"{job['max_rss_mb']:.2f}\t{job['read_mb']:.2f}\t"
+                f"{job['written_mb']:.2f}\n"
+            )
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("benchmarks"))
+    Namespace(benchmarks='benchmarks', debug=False, jobs='jobs.tsv',
+    quiet=False, rules='rules.tsv')
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "benchmarks",
+        help="Path to the benchmarks directory",
+        type=str
+    )
+
+    # Optional arguments
+    main_parser.add_argument(
+        "-r", "--rules",
+        help="Path to the per-rule table (default: %(default)s)",
+        type=str,
+        default="rules.tsv"
+    )
+
+    main_parser.add_argument(
+        "-j", "--jobs",
+        help="Path to the per-job table (default: %(default)s)",
+        type=str,
+        default="jobs.tsv"
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function aggregates the benchmark files into performance tables
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("benchmarks")))
+    """
+    jobs = collect_jobs(Path(args.benchmarks))
+    write_tables(jobs, summarize(jobs), Path(args.rules), Path(args.jobs))
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="performance_report.py", args=args)
+
+    try:
+        logger.debug("Aggregating benchmarks")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
@@ -0,0 +1,511 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script checks the bam files of a design before any analysis:
+
+    - each bam file ends with the BGZF end-of-file marker (each cram file
+      with the end-of-file container), not being truncated,
+    - each bam index exists and is newer than its bam file,
+    - each contig of the bam headers exists in the fasta index (.fai),
+      with the same length.
+
+Samples are checked in parallel, with a pool of threads, and a summary is
+written as a TSV file: one line per sample, with its status and problems.
+
+You can test this script with:
+pytest -v ./preflight.py
+
+Usage example:
+# Check the samples of a design file
+python3.7 ./preflight.py design.tsv /path/to/genome.fa -o preflight.tsv
+"""
+
+import argparse           # Parse command line
+import logging            # Traces and loggings
+import os                 # OS related activities
+import shlex              # Lexical analysis
+import sys                # System related methods
+
+from concurrent.futures import ThreadPoolExecutor    # Thread pools
+from pathlib import Path                             # Paths related methods
+from typing import Any, Dict, List, Optional, Tuple  # Type hints
+
+from common import *
+from bgzf import BamHeader, BgzfReader, cram_has_eof, encode_header
+from bgzf import index_suffix, is_cram, read_cram_header, read_header
+from bgzf import write_bgzf, write_cram
+from design_index import design_records, read_design
+from fasta_index import load_fai, read_contigs
+
+logger = setup_logging(logger="preflight.py")
+
+report_header = "Sample_id\tStatus\tProblems\n"
+bam_kinds = {"Normal_Bam": "Normal_Index", "Tumor_Bam": "Tumor_Index"}
+
+
+# Processing functions
+def check_eof(reader: BgzfReader) -> Optional[str]:
+    """
+    Check that a bam file ends with the BGZF end-of-file marker
+
+    Parameters:
+        reader  BgzfReader  The opened bam file
+
+    Return:
+                str         A description of the problem, or None
+
+    Example:
+    >>> with BgzfReader(Path("truncated.bam")) as reader:
+    ...     check_eof(reader)
+    'truncated.bam is truncated (no BGZF end-of-file marker)'
+    """
+    if reader.has_eof():
+        return None
+    return f"{reader.path} is truncated (no BGZF end-of-file marker)"
+
+
+def check_cram_eof(cram: Path) -> Optional[str]:
+    """
+    Check that a cram file ends with the end-of-file container
+
+    Parameters:
+        cram    Path    Path to the cram file
+
+    Return:
+                str     A description of the problem, or None
+
+    Example:
+    >>> check_cram_eof(Path("truncated.cram"))
+    'truncated.cram is truncated (no cram end-of-file container)'
+    """
+    if cram_has_eof(cram):
+        return None
+    return f"{cram} is truncated (no cram end-of-file container)"
+
+
+def check_index(bam: Path, bai: Path) -> Optional[str]:
+    """
+    Check that a bam index exists, and is newer than its bam file
+
+    Parameters:
+        bam     Path    Path to the bam file
+        bai     Path    Path to the bam index
+
+    Return:
+                str     A description of the problem, or None
+
+    Example:
+    >>> check_index(Path("sample.bam"), Path("sample.bam.bai"))
+    'sample.bam.bai is older than sample.bam'
+    """
+    if not bai.exists():
+        return f"{bai} does not exist"
+    if bai.stat().st_mtime < bam.stat().st_mtime:
+        return f"{bai} is older than {bam}"
+    return None
+
+
+def check_contigs(bam: Path,
+                  header: BamHeader,
+                  contigs: Dict[str, int]) -> Optional[str]:
+    """
+    Check that the contigs of a bam header exist in the reference, with the
+    same lengths
+
+    Parameters:
+        bam         Path            Path to the bam file
+        header      BamHeader       The header of the bam file
+        contigs     Dict[str, int]  Reference contig lengths, by name
+
+    Return:
+                    str             A description of the problem, or None
+
+    Example:
+    >>> check_contigs(Path("a.bam"), BamHeader("", [("2", 5)]), {"1": 5})
+    'a.bam contigs are missing from the reference: 2'
+    """
+    missing = [name for name, _ in header.references if name not in contigs]
+    if missing:
+        return (
+            f"{bam} contigs are missing from the reference: "
+            + ", ".join(missing[:5]) + (", ..." if len(missing) > 5 else "")
+        )
+
+    different = [
+        name for name, length in header.references
+        if contigs[name] != length
+    ]
+    if different:
+        return (
+            f"{bam} contigs lengths differ from the reference: "
+            + ", ".join(different[:5])
+            + (", ..." if len(different) > 5 else "")
+        )
+    return None
+
+
+def sample_files(sample: Dict[str, str]) -> List[Tuple[str, str]]:
+    """
+    Return the bam files of a design line, with their index (given in the
+    design, or expected next to the bam file)
+
+    Parameters:
+        sample      Dict[str, str]          A design line, by column name
+
+    Return:
+                    List[Tuple[str, str]]   Bam file and index paths
+
+    Example:
+    >>> sample_files({"Normal_Bam": "a.bam", "Tumor_Bam": "b.cram"})
+    [('a.bam', 'a.bam.bai'), ('b.cram', 'b.cram.crai')]
+    """
+    return [
+        (
+            sample[bam_kind],
+            sample.get(index_kind)
+            or f"{sample[bam_kind]}{index_suffix(sample[bam_kind])}"
+        )
+        for bam_kind, index_kind in bam_kinds.items()
+    ]
+
+
+def check_bam(bam: Path, bai: Path, contigs: Dict[str, int]) -> List[str]:
+    """
+    Run all checks on a bam (or cram) file
+
+    Parameters:
+        bam         Path            Path to the bam file
+        bai         Path            Path to the bam index
+        contigs     Dict[str, int]  Reference contig lengths, by name
+
+    Return:
+                    List[str]       Descriptions of the problems found
+
+    Example:
+    >>> check_bam(Path("a.bam"), Path("a.bam.bai"), {})
+    []
+    """
+    if not bam.exists():
+        return [f"{bam} does not exist"]
+
+    if is_cram(bam):
+        problem = check_cram_eof(bam)
+        header = read_cram_header(bam) if problem is None else None
+    else:
+        # The bam file is mapped once, for all checks
+        with BgzfReader(bam) as reader:
+            problem = check_eof(reader)
+            header = read_header(reader) if problem is None else None
+    if problem is not None:
+        return [problem]
+
+    return [
+        problem
+        for problem in [
+            check_index(bam, bai),
+            check_contigs(bam, header, contigs)
+        ]
+        if problem is not None
+    ]
+
+
+def check_sample(sample: Dict[str, str],
+                 contigs: Dict[str, int]) -> List[str]:
+    """
+    Run all checks on the bam files of a design line
+
+    Parameters:
+        sample      Dict[str, str]  A design line, by column name
+        contigs     Dict[str, int]  Reference contig lengths, by name
+
+    Return:
+                    List[str]       Descriptions of the problems found
+
+    Example:
+    >>> check_sample({"Normal_Bam": "a.bam", "Tumor_Bam": "b.bam"}, {})
+    []
+    """
+    return [
+        problem
+        for bam, bai in sample_files(sample)
+        for problem in check_bam(Path(bam), Path(bai), contigs)
+    ]
+
+
+def preflight(samples: List[Dict[str, str]],
+              fasta: Path,
+              threads: int = 1,
+              contig_index: Optional[Path] = None) -> Dict[str, List[str]]:
+    """
+    Check the bam files of all samples, in parallel. A bam file shared by
+    several samples (e.g. a normal bam) is checked once.
+
+    Parameters:
+        samples     List[Dict[str, str]]    Design lines, by column name
+        fasta       Path                    Path to the reference
+        threads     int                     Maximum number of bam files
+                                            checked at once
+        contig_index Path                   Path to the contig index built
+                                            at configuration time
+
+    Return:
+                    Dict[str, List[str]]    Problems found, by sample
+
+    Example:
+    >>> preflight(design, Path("genome.fa"), threads=8)
+    {'sample1': [], 'sample2': ['sample2_T.bam is truncated ...']}
+    """
+    if contig_index is not None:
+        contigs = read_contigs(contig_index)
+    else:
+        contigs = {entry.name: entry.length for entry in load_fai(fasta)}
+
+    def check(files: Tuple[str, str]) -> List[str]:
+        try:
+            return check_bam(Path(files[0]), Path(files[1]), contigs)
+        except Exception as error:
+            return [f"{type(error).__name__}: {error}"]
+
+    files = list(dict.fromkeys(
+        pair for sample in samples for pair in sample_files(sample)
+    ))
+    with ThreadPoolExecutor(max_workers=max(threads, 1)) as pool:
+        checked = dict(zip(files, pool.map(check, files)))
+    problems = {
+        sample["Sample_id"]: [
+            problem
+            for pair in sample_files(sample)
+            for problem in checked[pair]
+        ]
+        for sample in samples
+    }
+
+    failed = sum(1 for found in problems.values() if found)
+    logger.info(
+        f"Pre-flight checks: {failed}/{len(problems)} samples failed"
+        f" ({len(files)} bam files checked)"
+    )
+    for sample, found in problems.items():
+        for problem in found:
+            logger.error(f"{sample}: {problem}")
+    return problems
+
+
+def write_report(problems: Dict[str, List[str]], path: Path) -> None:
+    """
+    Save the summary of pre-flight checks
+
+    Parameters:
+        problems    Dict[str, List[str]]    Problems found, by sample
+        path        Path                    Path to the report
+
+    Example:
+    >>> write_report({"sample1": []}, Path("preflight.tsv"))
+    """
+    with path.open("w") as report_stream:
+        report_stream.write(report_header)
+        for sample, found in problems.items():
+            status = "FAILED" if found else "PASSED"
+            report_stream.write(f"{sample}\t{status}\t{'; '.join(found)}\n")
+
+
+def test_preflight(tmp_path: Path, monkeypatch: Any) -> None:
+    """
+    This function tests the preflight and write_report functions
+
+    Example:
+    >>> pytest -v preflight.py -k test_preflight
+    """
+    fasta = tmp_path / "genome.fa"
+    fasta.write_text(">1\nACGTACGT\n>2\nACGT\n")
+    headers = {
+        "good": BamHeader("", [("1", 8), ("2", 4)]),
+        "stale": BamHeader("", [("1", 8)]),
+        "contig": BamHeader("", [("1", 8), ("3", 4)]),
+        "truncated": BamHeader("", [("1", 8)])
+    }
+    for name, header in headers.items():
+        bam = tmp_path / f"{name}.bam"
+        with bam.open("wb") as bam_stream:
+            write_bgzf(bam_stream, encode_header(header))
+        Path(f"{bam}.bai").touch()
+    os.utime(tmp_path / "stale.bam.bai", (0, 0))
+    with (tmp_path / "truncated.bam").open("r+b") as bam_stream:
+        bam_stream.truncate(40)
+    for name, text in [("cram", "@SQ\tSN:1\tLN:8\n@SQ\tSN:3\tLN:4\n"),
+                       ("truncated_cram", "@SQ\tSN:1\tLN:8\n")]:
+        with (tmp_path / f"{name}.cram").open("wb") as cram_stream:
+            write_cram(cram_stream, BamHeader(text, []))
+        (tmp_path / f"{name}.cram.crai").touch()
+    with (tmp_path / "truncated_cram.cram").open("r+b") as cram_stream:
+        cram_stream.truncate(100)
+
+    samples = [
+        {
+            "Sample_id": name,
+            "Normal_Bam": str(tmp_path / "good.bam"),
+            "Tumor_Bam": str(tmp_path / f"{name}.bam")
+        }
+        for name in headers
+    ] + [
+        {
+            "Sample_id": name,
+            "Normal_Bam": str(tmp_path / "good.bam"),
+            "Tumor_Bam": str(tmp_path / f"{name}.cram")
+        }
+        for name in ["cram", "truncated_cram"]
+    ]
+    problems = preflight(samples, fasta, threads=4)
+    assert problems["good"] == []
+    assert problems["stale"] == [
+        f"{tmp_path}/stale.bam.bai is older than {tmp_path}/stale.bam"
+    ]
+    assert problems["contig"] == [
+        f"{tmp_path}/contig.bam contigs are missing from the reference: 3"
+    ]
+    assert problems["truncated"] == [
+        f"{tmp_path}/truncated.bam is truncated "
+        "(no BGZF end-of-file marker)"
+    ]
+    assert problems["cram"] == [
+        f"{tmp_path}/cram.cram contigs are missing from the reference: 3"
+    ]
+    assert problems["truncated_cram"] == [
+        f"{tmp_path}/truncated_cram.cram is truncated "
+        "(no cram end-of-file container)"
+    ]
+
+    contig_index = tmp_path / "genome.contigs"
+    contig_index.write_text("Name\tLength\n1\t8\n2\t4\n")
+    assert preflight(samples, fasta, 4, contig_index) == problems
+
+    # The normal bam shared by all samples is checked once
+    checked = []
+    monkeypatch.setattr(
+        sys.modules[__name__], "check_bam",
+        lambda bam, bai, contigs: checked.append(bam) or []
+    )
+    preflight(samples, fasta, 4, contig_index)
+    assert sorted(checked) == sorted({
+        Path(sample[kind]) for sample in samples for kind in bam_kinds
+    })
+
+    write_report(problems, tmp_path / "preflight.tsv")
+    lines = (tmp_path / "preflight.tsv").read_text().splitlines()
+    assert lines[:2] == [report_header.strip(), "good\tPASSED\t"]
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("design.tsv genome.fa"))
+    Namespace(contig_index=None, debug=False, design='design.tsv',
+    fasta='genome.fa', output='preflight.tsv', quiet=False, threads=8)
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "design",
+        help="Path to the design file",
+        type=str
+    )
+
+    main_parser.add_argument(
+        "fasta",
+        help="Path to the reference fasta file",
+        type=str
+    )
+
+    # Optional arguments
+    main_parser.add_argument(
+        "-t", "--threads",
+        help="Maximum number of bam files checked at once "
+             "(default: %(default)s)",
+        type=int,
+        default=8
+    )
+
+    main_parser.add_argument(
+        "-c", "--contig-index",
+        help="Path to the contig index built at configuration time "
+             "(default: read the fasta index)",
+        type=str,
+        default=None
+    )
+
+    main_parser.add_argument(
+        "-o", "--output",
+        help="Path to the summary report (default: %(default)s)",
+        type=str,
+        default="preflight.tsv"
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function checks all samples of a design file
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("design.tsv genome.fa")))
+    """
+    samples = design_records(read_design(Path(args.design)))
+    contig_index = Path(args.contig_index) if args.contig_index else None
+    problems = preflight(
+        samples, Path(args.fasta), args.threads, contig_index
+    )
+    write_report(problems, Path(args.output))
+    if any(problems.values()):
+        raise ValueError(f"Pre-flight checks failed, see {args.output}")
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="preflight.py", args=args)
+
+    try:
+        logger.debug("Running pre-flight checks")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
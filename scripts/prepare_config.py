@@ -34,6 +34,7 @@ from pathlib import Path             # Paths related methods
 from typing import Dict, Any         # Typing hints
 
 from common import *
+from fasta_index import index_reference
 
 logger = setup_logging(logger="prepare_config.py")
 
@@ -96,6 +97,130 @@ def parser() -> argparse.ArgumentParser:
         default=[" "]
     )
 
+    main_parser.add_argument(
+        "--scatter",
+        help="Number of region shards used to scatter MSISensor msi "
+             "(default: %(default)s)",
+        type=int,
+        default=1
+    )
+
+    main_parser.add_argument(
+        "--staging-method",
+        help="How input files are staged in the working directory: links "
+             "out of cold storage and copies out of it (auto), or always "
+             "the given method (default: %(default)s)",
+        choices=["auto", "symlink", "hardlink", "copy"],
+        default="auto"
+    )
+
+    main_parser.add_argument(
+        "--staging-batch-size",
+        help="Number of samples staged by a single job "
+             "(default: %(default)s)",
+        type=int,
+        default=1
+    )
+
+    main_parser.add_argument(
+        "--staging-concurrency",
+        help="Maximum number of files staged at once by a batch job "
+             "(default: %(default)s)",
+        type=int,
+        default=4
+    )
+
+    main_parser.add_argument(
+        "--staging-bandwidth",
+        help="Bandwidth limit of copies out of each mount point, in MB/s. "
+             "0 means no limit (default: %(default)s)",
+        type=float,
+        default=0
+    )
+
+    main_parser.add_argument(
+        "--scratch-budget",
+        help="Maximum size of the bam files copied in the working "
+             "directory at once, in GB. 0 means no limit "
+             "(default: %(default)s)",
+        type=float,
+        default=0
+    )
+
+    main_parser.add_argument(
+        "--native-scan",
+        help="Scan the fasta file with the multiprocess native scanner, "
+             "instead of MSISensor scan",
+        action="store_true"
+    )
+
+    main_parser.add_argument(
+        "--native-msi",
+        help="Count repeats and score MSI with the multiprocess native "
+             "engine, instead of MSISensor msi (always used for cram "
+             "files)",
+        action="store_true"
+    )
+
+    main_parser.add_argument(
+        "--incremental",
+        help="Re-run samples which bam files changed, according to the "
+             "design manifest written by prepare_design.py",
+        action="store_true"
+    )
+
+    main_parser.add_argument(
+        "--preflight",
+        help="Check bam files (truncation, index dates, contigs) "
+             "once, before any msi job",
+        action="store_true"
+    )
+
+    main_parser.add_argument(
+        "--scan-cache-dir",
+        help="Path to a directory where MSISensor scans are cached "
+             "and reused across runs (default: no cache)",
+        type=str,
+        metavar="PATH",
+        default=None
+    )
+
+    main_parser.add_argument(
+        "--scan-cache-max-size",
+        help="Maximum size of the scan cache, in GB (default: %(default)s)",
+        type=float,
+        default=50
+    )
+
+    main_parser.add_argument(
+        "--regions",
+        help="Path to a BED file of targeted regions (e.g. a capture "
+             "panel): only microsatellites overlapping them are analysed "
+             "(default: whole genome)",
+        type=str,
+        metavar="PATH",
+        default=None
+    )
+
+    main_parser.add_argument(
+        "--prune-depth",
+        help="Skip the sites which can not reach this depth in both bam "
+             "files of a sample, according to their indexes. 0 means no "
+             "pruning (default: %(default)s)",
+        type=int,
+        default=0
+    )
+
+    main_parser.add_argument(
+        "--index-cache-dir",
+        help="Path to a directory where the reference indexes are built, "
+             "when the fasta file directory is read-only "
+             "(default: WORKDIR/genome)",
+        type=str,
+        metavar="PATH",
+        default=None
+    )
+
     main_parser.add_argument(
         "--msi-scan-extra",
         help="Extra parameters for MSISensor scan (default: %(default)s)",
@@ -110,6 +235,21 @@ def parser() -> argparse.ArgumentParser:
         default=""
     )
 
+    main_parser.add_argument(
+        "--rescore-extra",
+        help="Extra parameters for MSI re-scoring (default: %(default)s)",
+        type=str,
+        default=""
+    )
+
+    main_parser.add_argument(
+        "--msi-native-extra",
+        help="Extra parameters for the native MSI engine, see "
+             "scripts/msi_count.py --help (default: %(default)s)",
+        type=str,
+        default=""
+    )
+
     # Logging options
     log = main_parser.add_mutually_exclusive_group()
     log.add_argument(
@@ -159,10 +299,27 @@ def test_parse_args() -> None:
         debug=False,
         design='design.tsv',
         fasta="/path/to/ref.fa",
+        incremental=False,
+        index_cache_dir=None,
         msi_extra='',
+        msi_native_extra='',
         msi_scan_extra='',
+        native_msi=False,
+        native_scan=False,
+        preflight=False,
+        prune_depth=0,
         quiet=False,
+        regions=None,
+        rescore_extra='',
+        scan_cache_dir=None,
+        scan_cache_max_size=50,
+        scatter=1,
+        scratch_budget=0,
         singularity='docker://continuumio/miniconda3:4.4.10',
+        staging_bandwidth=0,
+        staging_batch_size=1,
+        staging_concurrency=4,
+        staging_method='auto',
         threads=1,
         workdir='.'
     )
@@ -198,7 +355,19 @@ def args_to_dict(args: argparse.ArgumentParser) -> Dict[str, Any]:
      'singularity_docker_image':
      'singularity_image',
      'cold_storage': ['/path/cold/one'],
-     'params': {'msi_extra': '', 'msi_scan_extra': ' --option ok '}}
+     'scatter': 1,
+     'staging_method': 'auto',
+     'staging_batch_size': 1,
+     'staging_concurrency': 4,
+     'staging_bandwidth': 0,
+     'scratch_budget': 0,
+     'native_scan': False,
+     'native_msi': False,
+     'incremental': False,
+     'preflight': False,
+     'prune_depth': 0,
+     'params': {'msi_extra': '', 'msi_scan_extra': ' --option ok ',
+                'rescore_extra': '', 'msi_native_extra': ''}}
     """
     result_dict = {
         "design": args.design,
@@ -207,11 +376,32 @@ def args_to_dict(args: argparse.ArgumentParser) -> Dict[str, Any]:
         "threads": args.threads,
         "singularity_docker_image": args.singularity,
         "cold_storage": args.cold_storage,
+        "scatter": args.scatter,
+        "staging_method": args.staging_method,
+        "staging_batch_size": args.staging_batch_size,
+        "staging_concurrency": args.staging_concurrency,
+        "staging_bandwidth": args.staging_bandwidth,
+        "scratch_budget": args.scratch_budget,
+        "native_scan": args.native_scan,
+        "native_msi": args.native_msi,
+        "incremental": args.incremental,
+        "preflight": args.preflight,
+        "prune_depth": args.prune_depth,
         "params": {
             "msi_extra": args.msi_extra,
             "msi_scan_extra": args.msi_scan_extra,
+            "rescore_extra": args.rescore_extra,
+            "msi_native_extra": args.msi_native_extra,
         }
     }
+
+    if args.scan_cache_dir is not None:
+        result_dict["scan_cache_dir"] = args.scan_cache_dir
+        result_dict["scan_cache_max_size"] = args.scan_cache_max_size
+
+    if args.regions is not None:
+        result_dict["regions"] = os.path.abspath(args.regions)
+
     logger.debug(result_dict)
     return result_dict
 
@@ -230,6 +420,19 @@ def test_args_to_dict() -> None:
         "--threads 100 "
         "--singularity singularity_image "
         "--cold-storage /path/cold/one /path/cold/two "
+        "--scatter 4 "
+        "--staging-method copy "
+        "--staging-batch-size 10 "
+        "--staging-concurrency 8 "
+        "--staging-bandwidth 200 "
+        "--scratch-budget 500 "
+        "--native-scan "
+        "--native-msi "
+        "--incremental "
+        "--preflight "
+        "--scan-cache-dir /path/to/cache "
+        "--regions /path/to/panel.bed "
+        "--prune-depth 20 "
         "--msi-scan-extra ' --option ok ' "
         "--debug "
     ))
@@ -241,9 +444,25 @@ def test_args_to_dict() -> None:
         "design": "/path/to/design",
         "singularity_docker_image": "singularity_image",
         "cold_storage": ["/path/cold/one", "/path/cold/two"],
+        "scatter": 4,
+        "staging_method": "copy",
+        "staging_batch_size": 10,
+        "staging_concurrency": 8,
+        "staging_bandwidth": 200,
+        "scratch_budget": 500,
+        "native_scan": True,
+        "native_msi": True,
+        "incremental": True,
+        "preflight": True,
+        "prune_depth": 20,
+        "scan_cache_dir": "/path/to/cache",
+        "scan_cache_max_size": 50,
+        "regions": "/path/to/panel.bed",
         "params": {
             "msi_extra": '',
-            "msi_scan_extra": ' --option ok '
+            "msi_scan_extra": ' --option ok ',
+            "rescore_extra": '',
+            "msi_native_extra": ''
         }
     }
     assert sorted(args_to_dict(options)) == sorted(expected)
@@ -310,6 +529,14 @@ def main(args: argparse.ArgumentParser) -> None:
     config_params = args_to_dict(args)
     output_path = Path(args.workdir) / "config.yaml"
 
+    # Indexing the reference once, for all rules and scripts
+    fasta_index, contig_index = index_reference(
+        Path(args.fasta),
+        Path(args.index_cache_dir or Path(args.workdir) / "genome")
+    )
+    config_params["fasta_index"] = str(fasta_index)
+    config_params["contig_index"] = str(contig_index)
+
     # Saving as yaml
     with output_path.open("w") as config_yaml:
         logger.debug(f"Saving results to {str(output_path)}")
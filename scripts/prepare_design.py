@@ -5,9 +5,23 @@
 This script aims to prepare the list of files to be processed
 by the bam-msisensor pipeline
 
-It iterates over a given directory, lists all bam files.
+It iterates over a given directory, lists all bam (or cram) files and
+their indexes in a single pass. Sub-directories are listed in parallel,
+with a pool of threads, which matters on network file systems.
 
-The written file is a TSV file.
+Normal and tumor bam files are paired on their file names order, or with
+--pairing header, by the sample name found in their header (the SM field
+of their read groups). Only the first blocks of each
+bam file (or the first container of each cram file) are read, in
+parallel.
+
+When a fasta file is given, pre-flight checks are run on all pairs (see
+preflight.py) and the design file is not written if any of them fails.
+
+The written file is a TSV file. It is only rewritten when its content
+changes. A manifest of bam files (design.tsv.manifest) and the status of
+each sample since the previous run (design.tsv.diff) are kept next to it,
+so that only new or modified samples are processed again.
 
 You can test this script with:
 pytest -v ./prepare_design.py
@@ -21,39 +35,166 @@ python3.7 ./prepare_design.py path/to/normal path/to/tumor
 
 # Search in sub-directories:
 python3.7 ./prepare_design.py path/to/normal path/to/tumor --index --recursive
+
+# Pair sample1_N and sample1_T bam files on their header sample name:
+python3.7 ./prepare_design.py path/to/normal path/to/tumor --index \
+    --pairing header --pairing-regex '(.+)_[NT]$'
+
+# Also compare bam checksums, not only their modification time:
+python3.7 ./prepare_design.py path/to/normal path/to/tumor --index --checksum
+
+# Check bam files against the reference before writing the design:
+python3.7 ./prepare_design.py path/to/normal path/to/tumor --fasta genome.fa
 """
 
 import argparse           # Parse command line
+import filecmp            # Compare files
 import logging            # Traces and loggings
 import logging.handlers   # Logging behaviour
 import os                 # OS related activities
-import pandas as pd       # Parse TSV files
-import pytest             # Unit testing
+import re                 # Regular expressions
 import shlex              # Lexical analysis
 import sys                # System related methods
 
+from concurrent.futures import ThreadPoolExecutor    # Thread pools
 from pathlib import Path                        # Paths related methods
-from typing import Any, Dict, Generator, List, Optional, Union   # Type hints
+from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple
+from typing import Union
 from os.path import commonprefix
 
 from common import *
+from bgzf import BamHeader, encode_header, read_bam_header, sample_names
+from bgzf import index_suffix, write_bgzf, write_cram
+from design_manifest import update_manifest, write_diff
+from preflight import preflight, write_report
 
 logger = setup_logging(logger="prepare_design.py")
 
+design_columns = ["Sample_id", "Normal_Bam", "Tumor_Bam"]
+mapping_suffixes = (".bam", ".cram")
+index_suffixes = (".bai", ".crai")
+
 
 # Processing functions
-# Looking for fastq files
+# Listing a single directory
+def scan_directory(directory: str,
+                   recursive: bool = False) \
+                   -> Tuple[List[Path], List[Path], List[str]]:
+    """
+    List bam (or cram) files, their indexes and sub-directories of a
+    directory. File types are read from the directory entries, without any
+    further stat.
+
+    Parameters:
+        directory   str         Path to the directory
+        recursive   bool        Also return sub-directories (True) or not
+
+    Return:
+                    Tuple[List[Path], List[Path], List[str]]
+                                Bam files, bam indexes and sub-directories
+
+    Example:
+    >>> scan_directory("tests/normal_data")
+    ([PosixPath('tests/normal_data/example.normal.bam')],
+     [PosixPath('tests/normal_data/example.normal.bam.bai')], [])
+    """
+    bams, bais, subdirs = [], [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if recursive is True:
+                    subdirs.append(entry.path)
+            elif entry.name.endswith(mapping_suffixes):
+                bams.append(Path(entry.path))
+            elif entry.name.endswith(index_suffixes):
+                bais.append(Path(entry.path))
+    return bams, bais, subdirs
+
+
+# Looking for bam files and indexes at once
+def discover_bam(bam_dir: Path,
+                 recursive: bool = False,
+                 threads: int = 1) -> Tuple[List[Path], List[Path]]:
+    """
+    Search a directory for bam files and their indexes, in a single pass.
+    The tree is walked level by level, and the directories of a level are
+    listed in parallel.
+
+    Parameters:
+        bam_dir     Path        Path to the bam directory in which to search
+        recursive   bool        A boolean, weather to search recursively in
+                                sub-directories (True) or not (False)
+        threads     int         Maximum number of directories listed at once
+
+    Return:
+                    Tuple[List[Path], List[Path]]
+                                Sorted bam files and sorted bam indexes
+
+    Example:
+    >>> discover_bam(Path("tests/"), recursive=True)
+    ([PosixPath('tests/normal_data/example.normal.bam'),
+      PosixPath('tests/tumor_data/example.tumor.bam')],
+     [PosixPath('tests/normal_data/example.normal.bam.bai'),
+      PosixPath('tests/tumor_data/example.tumor.bam.bai')])
+    """
+    bams, bais = [], []
+    level = [str(bam_dir)]
+    with ThreadPoolExecutor(max_workers=max(threads, 1)) as pool:
+        while level:
+            mapper = map if threads <= 1 or len(level) == 1 else pool.map
+            listings = mapper(scan_directory, level, [recursive] * len(level))
+            level = []
+            for dir_bams, dir_bais, subdirs in listings:
+                bams += dir_bams
+                bais += dir_bais
+                level += subdirs
+    return sorted(bams), sorted(bais)
+
+
+def test_discover_bam(tmp_path: Path) -> None:
+    """
+    This function tests the discover_bam function on a nested tree
+
+    Example:
+    pytest -v prepare_design.py -k test_discover_bam
+    """
+    for subdir in ["a", "a/b", "c"]:
+        (tmp_path / subdir).mkdir()
+        (tmp_path / subdir / "s.bam").touch()
+        (tmp_path / subdir / "s.bam.bai").touch()
+        (tmp_path / subdir / "s.txt").touch()
+    (tmp_path / "top.bam").touch()
+    (tmp_path / "c" / "r.cram").touch()
+    (tmp_path / "c" / "r.cram.crai").touch()
+
+    bams, bais = discover_bam(tmp_path, recursive=True, threads=4)
+    assert bams == [
+        tmp_path / "a" / "b" / "s.bam",
+        tmp_path / "a" / "s.bam",
+        tmp_path / "c" / "r.cram",
+        tmp_path / "c" / "s.bam",
+        tmp_path / "top.bam"
+    ]
+    assert bais == sorted(
+        Path(f"{bam}{index_suffix(bam)}") for bam in bams[:4]
+    )
+    assert discover_bam(tmp_path) == ([tmp_path / "top.bam"], [])
+
+
+# Looking for bam files
 def search_bam(bam_dir: Path,
                recursive: bool = False,
-               index: bool = False) -> Generator[str, str, None]:
+               index: bool = False,
+               threads: int = 1) -> Generator[str, str, None]:
     """
-    Iterate over a directory and search for fastq files
+    Iterate over a directory and search for bam files
 
     Parameters:
         bam_dir     Path        Path to the bam directory in which to search
         recursive   bool        A boolean, weather to search recursively in
                                 sub-directories (True) or not (False)
         index       bool        Search for indexes and not for bam themselves
+        threads     int         Maximum number of directories listed at once
 
     Return:
                     Generator[str, str, None]       A Generator of paths
@@ -66,16 +207,8 @@ def search_bam(bam_dir: Path,
     [PosixPath('tests/bam/A_R2.bam'),
      PosixPath('tests/bam/B_R2.bam')]
     """
-    ext = (".bai" if index else ".bam")
-    for path in bam_dir.iterdir():
-        if path.is_dir():
-            if recursive is True:
-                yield from search_bam(path, recursive, index)
-            else:
-                continue
-
-        if path.name.endswith(ext):
-            yield path
+    bams, bais = discover_bam(bam_dir, recursive, threads)
+    yield from (bais if index else bams)
 
 
 # Testing search_bam
@@ -224,6 +357,264 @@ def test_classify_bam_only():
     assert sorted(classify_bam(nbam, tbam)) == sorted(expected)
 
 
+# Reading sample names out of bam headers
+def read_sample_name(bam: Path,
+                     tag: str = "SM",
+                     pattern: Optional[str] = None) -> str:
+    """
+    Return the sample name of a bam file, read in its header
+
+    Parameters:
+        bam         Path    Path to the bam file
+        tag         str     The read group field holding the sample name
+        pattern     str     A regular expression extracting the pairing
+                            key out of the sample name (first group)
+
+    Return:
+                    str     The sample name (or pairing key)
+
+    Example:
+    >>> read_sample_name(Path("patient1_N.bam"), pattern=r"(.+)_[NT]$")
+    'patient1'
+    """
+    names = sample_names(read_bam_header(bam).text, tag)
+    if not names:
+        raise ValueError(f"No read group with a {tag} field in {bam}")
+    if len(names) > 1:
+        logger.warning(f"Several samples in {bam}: {names}, using the first")
+
+    name = names[0]
+    if pattern is not None:
+        match = re.search(pattern, name)
+        if match is None:
+            raise ValueError(f"{name} ({bam}) does not match {pattern}")
+        name = match.group(1)
+    return name
+
+
+def find_index(bam: Path, indexes: Dict[str, Path]) -> Path:
+    """
+    Return the index of a bam file, named either sample.bam.bai or
+    sample.bai (sample.cram.crai or sample.crai for cram files)
+
+    Parameters:
+        bam         Path                Path to the bam (or cram) file
+        indexes     Dict[str, Path]     Known indexes, by path
+
+    Return:
+                    Path                Path to the bam index
+
+    Example:
+    >>> find_index(Path("a.bam"), {"a.bam.bai": Path("a.bam.bai")})
+    PosixPath('a.bam.bai')
+    """
+    suffix = index_suffix(bam)
+    for candidate in [f"{bam}{suffix}", str(bam.with_suffix(suffix))]:
+        if candidate in indexes:
+            return indexes[candidate]
+    raise ValueError(f"No index found for {bam}")
+
+
+# Pairing normal and tumor bam files by sample name
+def pair_bam(normal_bam_files: List[Path],
+             tumor_bam_files: List[Path],
+             normal_index_files: Optional[List[Path]] = None,
+             tumor_index_files: Optional[List[Path]] = None,
+             tag: str = "SM",
+             pattern: Optional[str] = None,
+             threads: int = 1) -> Dict[str, Dict[str, Path]]:
+    """
+    Pair normal and tumor bam files on the sample name found in their
+    headers. Headers are read in parallel, and files are paired through
+    a hash index of sample names.
+
+    Parameters:
+        normal_bam_files    List[Path]   List of path to normal mapping files
+        tumor_bam_files     List[Path]   List of path to tumor mapping files
+        normal_index_files  List[Path]   List of path to normal indexes files
+        tumor_index_files   List[Path]   List of path to tumor indexes files
+        tag                 str          Read group field used for pairing
+        pattern             str          A regular expression extracting the
+                                         pairing key out of the sample name
+        threads             int          Maximum number of headers read at
+                                         once
+
+    Return:
+        Dict[str, Dict[str, Path]]  For each sample name, the sample name
+                                    alongside with its bam files (and
+                                    indexes)
+
+    Example:
+    >>> pair_bam([Path("N/a.bam")], [Path("T/a.bam")])
+    {'patient1': {'Sample_id': 'patient1',
+                  'Normal_Bam': PosixPath('N/a.bam'),
+                  'Tumor_Bam': PosixPath('T/a.bam')}}
+    """
+    with ThreadPoolExecutor(max_workers=max(threads, 1)) as pool:
+        def names_of(bams: List[Path]) -> List[str]:
+            return list(pool.map(
+                lambda bam: read_sample_name(bam, tag, pattern), bams
+            ))
+
+        indexed = []
+        for bams in [normal_bam_files, tumor_bam_files]:
+            by_name = {}
+            for name, bam in zip(names_of(bams), bams):
+                if name in by_name:
+                    raise ValueError(
+                        f"{name} found in both {by_name[name]} and {bam}"
+                    )
+                by_name[name] = bam
+            indexed.append(by_name)
+    normals, tumors = indexed
+
+    for name in normals.keys() ^ tumors.keys():
+        bam = normals.get(name, tumors.get(name))
+        logger.warning(f"{name} ({bam}) has no matching normal/tumor bam")
+
+    with_index = (
+        normal_index_files is not None and tumor_index_files is not None
+    )
+    if with_index:
+        logger.debug("Bam and indexes are used in this pipeline")
+        indexes = {
+            str(bai): bai for bai in normal_index_files + tumor_index_files
+        }
+
+    bam_dict = {}
+    for name, normal in normals.items():
+        if name not in tumors:
+            continue
+        bam_dict[name] = {"Sample_id": name, "Normal_Bam": normal}
+        if with_index:
+            bam_dict[name]["Normal_Index"] = find_index(normal, indexes)
+        bam_dict[name]["Tumor_Bam"] = tumors[name]
+        if with_index:
+            bam_dict[name]["Tumor_Index"] = find_index(tumors[name], indexes)
+    return bam_dict
+
+
+def test_pair_bam(tmp_path: Path) -> None:
+    """
+    This function tests the pair_bam function, with a missing tumor that
+    would shift a pairing based on file names order
+
+    Example:
+    pytest -v ./prepare_design.py -k test_pair_bam
+    """
+    import pytest
+
+    for kind, samples in [("N", ["p1", "p2", "p3"]), ("T", ["p1", "p3"])]:
+        (tmp_path / kind).mkdir()
+        for index, sample in enumerate(samples):
+            header = BamHeader(f"@RG\tID:{index}\tSM:{sample}_{kind}\n", [])
+            with (tmp_path / kind / f"{index}.bam").open("wb") as stream:
+                write_bgzf(stream, encode_header(header))
+            (tmp_path / kind / f"{index}.bam.bai").touch()
+
+    nbam, nbai = discover_bam(tmp_path / "N")
+    tbam, tbai = discover_bam(tmp_path / "T")
+    got = pair_bam(nbam, tbam, nbai, tbai, pattern=r"(.+)_[NT]$", threads=4)
+    assert got == {
+        sample: {
+            "Sample_id": sample,
+            "Normal_Bam": tmp_path / "N" / f"{normal}.bam",
+            "Normal_Index": tmp_path / "N" / f"{normal}.bam.bai",
+            "Tumor_Bam": tmp_path / "T" / f"{tumor}.bam",
+            "Tumor_Index": tmp_path / "T" / f"{tumor}.bam.bai"
+        }
+        for sample, normal, tumor in [("p1", 0, 0), ("p3", 2, 1)]
+    }
+    assert list(pair_bam(nbam, tbam, pattern=r"(.+)_[NT]$")["p3"]) == [
+        "Sample_id", "Normal_Bam", "Tumor_Bam"
+    ]
+
+    with pytest.raises(ValueError):
+        pair_bam(nbam + nbam[:1], tbam, pattern=r"(.+)_[NT]$")
+
+    # Cram files are paired on their header as well, with their .crai
+    with (tmp_path / "T" / "2.cram").open("wb") as cram_stream:
+        write_cram(cram_stream, BamHeader("@RG\tID:2\tSM:p2_T\n", []))
+    (tmp_path / "T" / "2.cram.crai").touch()
+    tbam, tbai = discover_bam(tmp_path / "T")
+    got = pair_bam(nbam, tbam, nbai, tbai, pattern=r"(.+)_[NT]$")
+    assert got["p2"]["Tumor_Bam"] == tmp_path / "T" / "2.cram"
+    assert got["p2"]["Tumor_Index"] == tmp_path / "T" / "2.cram.crai"
+
+
+# Writing the design file
+def write_design(samples: Iterable[Dict[str, Path]], output: Path) -> int:
+    """
+    Stream design lines to a temporary file, then move it over the design
+    file, unless their content is the same: the design file is only
+    rewritten when it changes.
+
+    Parameters:
+        samples     Iterable[Dict[str, Path]]   Design lines, by column
+        output      Path                        Path to the design file
+
+    Return:
+                    int                         Number of written lines
+
+    Example:
+    >>> write_design(pair_bam(nbam, tbam).values(), Path("design.tsv"))
+    12
+    """
+    tmp = output.parent / f".{output.name}.{os.getpid()}"
+    lines = 0
+    with tmp.open("w") as design_stream:
+        columns = None
+        for sample in samples:
+            if columns is None:
+                columns = list(sample)
+                design_stream.write("\t".join(columns) + "\n")
+            design_stream.write(
+                "\t".join(str(sample.get(column, "")) for column in columns)
+                + "\n"
+            )
+            lines += 1
+        if columns is None:
+            design_stream.write("\t".join(design_columns) + "\n")
+
+    if output.exists() and filecmp.cmp(tmp, output, shallow=False):
+        logger.debug(f"{output} is up to date")
+        tmp.unlink()
+    else:
+        logger.debug(f"Saving {lines} samples to {output}")
+        os.replace(tmp, output)
+    return lines
+
+
+def test_write_design(tmp_path: Path) -> None:
+    """
+    This function tests the write_design function
+
+    Example:
+    pytest -v ./prepare_design.py -k test_write_design
+    """
+    output = tmp_path / "design.tsv"
+    samples = [
+        {"Sample_id": "p1", "Normal_Bam": Path("N/1.bam"),
+         "Tumor_Bam": Path("T/1.bam")},
+        {"Sample_id": "p2", "Normal_Bam": Path("N/2.bam"),
+         "Tumor_Bam": Path("T/2.bam")}
+    ]
+    assert write_design(iter(samples), output) == 2
+    assert output.read_text() == (
+        "Sample_id\tNormal_Bam\tTumor_Bam\n"
+        "p1\tN/1.bam\tT/1.bam\np2\tN/2.bam\tT/2.bam\n"
+    )
+
+    # Unchanged designs are not rewritten
+    os.utime(output, ns=(0, 0))
+    write_design(samples, output)
+    assert output.stat().st_mtime_ns == 0
+    assert list(tmp_path.iterdir()) == [output]
+
+    assert write_design([], output) == 0
+    assert output.read_text() == "Sample_id\tNormal_Bam\tTumor_Bam\n"
+
+
 # Parsing command line arguments
 # This function won't be tested
 def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
@@ -281,6 +672,56 @@ def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
         default="design.tsv"
     )
 
+    main_parser.add_argument(
+        "-p", "--pairing",
+        help="Pair normal and tumor bam files on the sample name found in "
+             "their headers, or on their file names order "
+             "(default: %(default)s)",
+        choices=["header", "filename"],
+        default="filename"
+    )
+
+    main_parser.add_argument(
+        "--pairing-tag",
+        help="Read group field holding the sample name "
+             "(default: %(default)s)",
+        type=str,
+        default="SM"
+    )
+
+    main_parser.add_argument(
+        "--pairing-regex",
+        help="Regular expression extracting the pairing key out of sample "
+             "names, as its first group, e.g. '(.+)_[NT]$' "
+             "(default: whole sample names)",
+        type=str,
+        default=None
+    )
+
+    main_parser.add_argument(
+        "-t", "--threads",
+        help="Maximum number of directories listed at once "
+             "(default: %(default)s)",
+        type=int,
+        default=8
+    )
+
+    main_parser.add_argument(
+        "-f", "--fasta",
+        help="Path to the reference fasta file. If given, bam files are "
+             "checked (truncation, index dates, contigs) before writing "
+             "the design (default: no check)",
+        type=str,
+        default=None
+    )
+
+    main_parser.add_argument(
+        "-c", "--checksum",
+        help="Compare bam checksums in the design manifest, "
+             "not only their size and modification time",
+        action="store_true"
+    )
+
     # Logging options
     log = main_parser.add_mutually_exclusive_group()
     log.add_argument(
@@ -313,13 +754,19 @@ def test_parse_args() -> None:
     )
 
     expected = argparse.Namespace(
+        checksum=False,
         debug=False,
+        fasta=None,
         output='design.tsv',
+        pairing='filename',
+        pairing_regex=None,
+        pairing_tag='SM',
         normal_bam='/path/to/normal/bam/',
         tumor_bam='/path/to/tumor/bam/',
         quiet=False,
         recursive=False,
-        index=False
+        index=False,
+        threads=8
     )
 
     assert options == expected
@@ -336,32 +783,96 @@ def main(args: argparse.ArgumentParser) -> None:
     Example:
     >>> main(parse_args(shlex.split("/path/to/bam/dir/")))
     """
-    # Searching for bam files and sorting them alphabetically
-    nbam = sorted(list(search_bam(Path(args.normal_bam), recursive=args.recursive)))
-    tbam = sorted(list(search_bam(Path(args.tumor_bam), recursive=args.recursive)))
+    # Searching for bam files and indexes, sorted alphabetically
+    nbam, nbai = discover_bam(
+        Path(args.normal_bam), args.recursive, args.threads
+    )
+    tbam, tbai = discover_bam(
+        Path(args.tumor_bam), args.recursive, args.threads
+    )
 
     logger.debug("Head of alphabetically sorted list of bam files:")
     logger.debug([str(i) for i in nbam[0:5]])
     logger.debug([str(i) for i in tbam[0:5]])
 
-    nbai = None
-    tbai = None
-    if args.index is True:
-        nbai = sorted(list(search_bam(Path(args.normal_bam), recursive=args.recursive, index=args.index)))
-        tbai = sorted(list(search_bam(Path(args.tumor_bam), recursive=args.recursive, index=args.index)))
-
+    if args.index is not True:
+        nbai = None
+        tbai = None
+    else:
         logger.debug("Head of alphabetically sorted bai files:")
         logger.debug([str(i) for i in nbai[0:5]])
         logger.debug([str(i) for i in tbai[0:5]])
 
     # Building a dictionnary of bam with indexes
-    bam_dict = classify_bam(nbam, tbam, nbai, tbai)
+    if args.pairing == "header":
+        bam_dict = pair_bam(
+            nbam, tbam, nbai, tbai,
+            args.pairing_tag, args.pairing_regex, args.threads
+        )
+    else:
+        bam_dict = classify_bam(nbam, tbam, nbai, tbai)
+    if not bam_dict:
+        hint = ""
+        if args.pairing == "header" and args.pairing_regex is None:
+            hint = " (normal and tumor sample names may differ, see " \
+                   "--pairing-regex)"
+        raise ValueError(
+            "No normal/tumor pair found in "
+            f"{args.normal_bam} and {args.tumor_bam}{hint}"
+        )
+
+    # Failing fast on broken bam files
+    if args.fasta is not None:
+        problems = preflight(
+            [
+                {key: str(value) for key, value in sample.items()}
+                for sample in bam_dict.values()
+            ],
+            Path(args.fasta),
+            args.threads
+        )
+        write_report(problems, Path(f"{args.output}.preflight.tsv"))
+        if any(problems.values()):
+            raise ValueError(
+                f"Pre-flight checks failed, see {args.output}.preflight.tsv"
+            )
+
+    # Writing design lines from the paired bam dictionnary
+    write_design(bam_dict.values(), Path(args.output))
+
+    # Keeping track of new and modified samples
+    statuses = update_manifest(
+        bam_dict, Path(f"{args.output}.manifest"), args.checksum
+    )
+    write_diff(statuses, Path(f"{args.output}.diff"))
+
+
+def test_main_without_pair(tmp_path: Path) -> None:
+    """
+    This function tests that no design is written when no normal/tumor
+    pair is found
 
-    # Using Pandas to handle TSV output (yes pretty harsh I know)
-    data = pd.DataFrame(bam_dict).T
-    logger.debug("\n{}".format(data.head()))
-    logger.debug("Saving results to {}".format(args.output))
-    data.to_csv(args.output, sep="\t", index=False)
+    Example:
+    >>> pytest -v prepare_design.py -k test_main_without_pair
+    """
+    import pytest
+
+    for kind in ["N", "T"]:
+        (tmp_path / kind).mkdir()
+        header = BamHeader(f"@RG\tID:0\tSM:p1_{kind}\n", [])
+        with (tmp_path / kind / "p1.bam").open("wb") as stream:
+            write_bgzf(stream, encode_header(header))
+
+    output = tmp_path / "design.tsv"
+    command = f"{tmp_path}/N {tmp_path}/T -o {output} --pairing header"
+    with pytest.raises(ValueError, match="see --pairing-regex"):
+        main(parse_args(shlex.split(command)))
+    assert not output.exists()
+
+    main(parse_args(shlex.split(f"{command} --pairing-regex '(.+)_[NT]$'")))
+    assert output.read_text().splitlines()[1:] == [
+        f"p1\t{tmp_path}/N/p1.bam\t{tmp_path}/T/p1.bam"
+    ]
 
 
 # Running programm if not imported
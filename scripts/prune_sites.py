@@ -0,0 +1,444 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script removes, from the homopolymers and microsatellites list, the
+sites which can not reach the coverage threshold of msisensor msi in a
+set of bam files (e.g. off-target sites of exome or panel bam files).
+
+Reads are never decompressed: the number of reads of each 16kb window is
+estimated from the bam index (.bai) alone. The linear index gives the
+virtual offset of the first read of each window, so the distance between
+the offset of a window and the next greater offset is (at most) the size
+of its reads: empty windows share the offset of a neighbour, and are
+given the reads of that neighbour. Sizes are converted to a number of
+reads with the size of a read, averaged over the contig (pseudo-bin of
+the index). Compressed offsets are converted to uncompressed sizes with
+the compression ratio of a sample of BGZF blocks, read from their
+headers and footers only.
+
+The reads overlapping a site start in its window, or in the previous
+one. Their number is an upper bound of the site depth: a site is kept
+when this bound, in every bam file, reaches the minimal depth (times a
+slack factor, for the estimation error).
+
+You can test this script with:
+pytest -v ./prune_sites.py
+
+Usage example:
+# Keep the sites which may be covered by 20 reads in both bam files
+python3.7 ./prune_sites.py homopolymers_micosats.msi \
+    -b normal.bam tumor.bam -o sample1.msi --min-depth 20
+"""
+
+import argparse           # Parse command line
+import logging            # Traces and loggings
+import shlex              # Lexical analysis
+import struct             # Binary data handling
+import sys                # System related methods
+
+from pathlib import Path                        # Paths related methods
+from typing import Any, Dict, List, Set, Tuple  # Type hints
+
+from common import *
+from bgzf import BaiReference, BgzfReader, block_size, is_cram
+from bgzf import linear_shift
+from bgzf import pseudo_bin, read_bai, read_header
+
+logger = setup_logging(logger="prune_sites.py")
+
+
+# Processing functions
+def compression_ratio(reader: BgzfReader,
+                      offsets: List[int],
+                      samples: int = 256) -> float:
+    """
+    Estimate the compression ratio of a bam file, out of a sample of the
+    blocks pointed by virtual offsets, from their sizes only
+
+    Parameters:
+        reader      BgzfReader  The opened bam file
+        offsets     List[int]   Virtual offsets (e.g. of the linear index)
+        samples     int         Maximum number of sampled blocks
+
+    Return:
+                    float       Uncompressed bytes per compressed byte
+
+    Example:
+    >>> compression_ratio(reader, read_bai(Path("s.bam.bai"))[0].linear)
+    3.41
+    """
+    blocks = sorted({
+        offset >> 16 for offset in offsets
+        if (offset >> 16) < len(reader.buffer)
+    })
+    compressed = inflated = 0
+    for block in blocks[::max(len(blocks) // samples, 1)]:
+        size = block_size(reader.buffer, block)
+        isize, = struct.unpack_from("<I", reader.buffer, block + size - 4)
+        compressed += size
+        inflated += isize
+    return inflated / compressed if compressed else 1.0
+
+
+def window_reads(reference: BaiReference, ratio: float) -> List[float]:
+    """
+    Estimate the number of reads starting in each 16kb window of a contig,
+    or in the neighbour windows sharing its linear offset (an upper bound)
+
+    Parameters:
+        reference   BaiReference    The index of the contig
+        ratio       float           The compression ratio of the bam file
+
+    Return:
+                    List[float]     Estimated number of reads, by window
+
+    Example:
+    >>> window_reads(read_bai(Path("sample.bam.bai"))[0], 3.41)
+    [480.2, 512.9, 0.0, ...]
+    """
+    if pseudo_bin not in reference.bins or not reference.linear:
+        return []
+    (start, end), (mapped, unmapped) = reference.bins[pseudo_bin]
+
+    def position(offset: int) -> float:
+        return (offset >> 16) * ratio + (offset & 0xffff)
+
+    reads_count = max(mapped + unmapped, 1)
+    read_size = (position(end) - position(start)) / reads_count
+    if read_size <= 0:
+        return [0.0] * len(reference.linear)
+    offsets = [max(offset, start) for offset in reference.linear] + [end]
+    reads = [0.0] * len(reference.linear)
+    following = end
+    for window in range(len(offsets) - 2, -1, -1):
+        if offsets[window + 1] > offsets[window]:
+            following = offsets[window + 1]
+        reads[window] = max(
+            position(following) - position(offsets[window]), 0
+        ) / read_size
+    return reads
+
+
+def estimate_reads(bam: Path, bai: Path) -> Dict[str, List[float]]:
+    """
+    Estimate the number of reads starting in each 16kb window of every
+    contig of a bam file, out of its header and index only
+
+    Parameters:
+        bam     Path                    Path to the bam file
+        bai     Path                    Path to the bam index
+
+    Return:
+                Dict[str, List[float]]  Estimated number of reads, by
+                                        window, by contig
+
+    Example:
+    >>> estimate_reads(Path("sample.bam"), Path("sample.bam.bai"))
+    {'1': [480.2, 512.9, 0.0, ...], ...}
+    """
+    index = read_bai(bai)
+    with BgzfReader(bam) as reader:
+        references = read_header(reader).references
+        ratio = compression_ratio(
+            reader, [offset for ref in index for offset in ref.linear]
+        )
+    logger.debug(f"{bam}: compression ratio {ratio:.2f}")
+    return {
+        name: window_reads(reference, ratio)
+        for (name, _), reference in zip(references, index)
+    }
+
+
+def site_reads(windows: List[float], location: int) -> float:
+    """
+    Return the estimated number of reads which may overlap a site: those
+    starting in its window, or in the previous one
+
+    Parameters:
+        windows     List[float]     Estimated number of reads, by window
+        location    int             The location of the site
+
+    Return:
+                    float           The estimated number of reads
+
+    Example:
+    >>> site_reads([10.0, 5.0, 0.0], 20000)
+    15.0
+    """
+    window = location >> linear_shift
+    return sum(windows[max(window - 1, 0):window + 1])
+
+
+def test_estimate_reads(tmp_path: Path) -> None:
+    """
+    This function tests the compression_ratio, window_reads,
+    estimate_reads and site_reads functions
+
+    Example:
+    >>> pytest -v prune_sites.py -k test_estimate_reads
+    """
+    from synthetic_data import make_bam_pair, make_reference
+
+    assert site_reads([10.0, 5.0, 0.0], 20000) == 15.0
+    assert site_reads([10.0, 5.0, 0.0], 100) == 10.0
+    assert site_reads([10.0], 50000) == 0
+
+    sequences, sites = make_reference(
+        tmp_path / "genome.fa", length=200000, density=0.03
+    )
+    bam, _ = make_bam_pair(tmp_path, "s1", sequences, sites, depth=30)
+    reads = estimate_reads(bam, Path(f"{bam}.bai"))["1"]
+
+    # Windows holding a site, or sharing its linear offset, hold its reads
+    windows = {site.start >> linear_shift for site in sites}
+    for window, count in enumerate(reads):
+        if window in windows:
+            assert abs(count - 30) < 1
+        elif not {window - 1, window + 1} & windows:
+            assert count == 0
+
+
+def prune_scan(scan: Path,
+               estimates: List[Dict[str, List[float]]],
+               output: Path,
+               min_reads: float) -> Tuple[int, int]:
+    """
+    Stream a scan file, and keep the sites which may be overlapped by
+    enough reads in every bam file
+
+    Parameters:
+        scan        Path    Path to the MSISensor scan file
+        estimates   List[Dict[str, List[float]]]
+                            Estimated number of reads, by window, by
+                            contig, for each bam file
+        output      Path    Path to the pruned scan file
+        min_reads   float   Minimal estimated number of reads
+
+    Return:
+                    Tuple[int, int]     Number of kept sites, and of sites
+
+    Example:
+    >>> prune_scan(Path("scan.msi"), [estimate_reads(bam, bai)],
+    ...            Path("sample1.msi"), 10)
+    (210431, 33112780)
+    """
+    kept = total = 0
+    with scan.open("r") as scan_stream, output.open("w") as output_stream:
+        output_stream.write(scan_stream.readline())
+        for line in scan_stream:
+            total += 1
+            contig, location = line.split("\t", 2)[:2]
+            if all(
+                site_reads(estimate.get(contig, []), int(location))
+                >= min_reads
+                for estimate in estimates
+            ):
+                output_stream.write(line)
+                kept += 1
+    logger.info(f"{kept}/{total} sites may reach the minimal depth")
+    return kept, total
+
+
+def test_prune_scan(tmp_path: Path) -> None:
+    """
+    This function tests the prune_scan function
+
+    Example:
+    >>> pytest -v prune_sites.py -k test_prune_scan
+    """
+    header = "chromosome\tlocation\trepeat_unit_length\t...\n"
+    sites = [
+        "1\t100\t1\t1\t5\t0\t0\tA\tCCCCC\tGGGGG\n",
+        "1\t20000\t1\t1\t5\t0\t0\tA\tCCCCC\tGGGGG\n",
+        "1\t40000\t1\t1\t5\t0\t0\tA\tCCCCC\tGGGGG\n",
+        "2\t100\t1\t1\t5\t0\t0\tA\tCCCCC\tGGGGG\n"
+    ]
+    scan = tmp_path / "scan.msi"
+    scan.write_text(header + "".join(sites))
+    normal = {"1": [30.0, 0.0, 0.0], "2": [30.0]}
+    tumor = {"1": [30.0, 0.0, 0.0], "2": [5.0]}
+
+    output = tmp_path / "pruned.msi"
+    assert prune_scan(scan, [normal, tumor], output, 10) == (2, 4)
+    assert output.read_text() == header + "".join(sites[:2])
+    assert prune_scan(scan, [normal], output, 10) == (3, 4)
+    assert prune_scan(scan, [normal], output, 50) == (0, 4)
+
+
+def cram_normals(normals: Dict[str, str], paths: Dict[str, str]) -> Set[str]:
+    """
+    List the normal bams which sites can not be pruned, because the normal
+    bam, or the tumor of any sample sharing it, is a cram file. The profile
+    of a normal bam and the sites of its samples are pruned together, or
+    not at all
+
+    Parameters:
+        normals     Dict[str, str]  Key of the normal bam of each sample
+        paths       Dict[str, str]  Path to each normal and tumor bam,
+                                    by key ({sample}_T for tumors)
+
+    Return:
+                    Set[str]        Keys of the normal bams not pruned
+
+    Example:
+    >>> cram_normals({"s1": "s1_N", "s2": "s1_N"},
+    ...              {"s1_N": "n.bam", "s1_T": "t1.bam", "s2_T": "t2.cram"})
+    {'s1_N'}
+    """
+    return {
+        normal for sample, normal in normals.items()
+        if is_cram(paths[normal]) or is_cram(paths[f"{sample}_T"])
+    }
+
+
+def test_cram_normals() -> None:
+    """
+    This function tests the cram_normals function on a design mixing bam
+    and cram files
+
+    Example:
+    >>> pytest -v prune_sites.py -k test_cram_normals
+    """
+    normals = {"s1": "s1_N", "s2": "s1_N", "s3": "s3_N", "s4": "s4_N"}
+    paths = {
+        "s1_N": "n1.bam", "s1_T": "t1.bam", "s2_T": "t2.cram",
+        "s3_N": "n3.cram", "s3_T": "t3.bam",
+        "s4_N": "n4.bam", "s4_T": "t4.bam"
+    }
+    assert cram_normals(normals, paths) == {"s1_N", "s3_N"}
+    paths["s2_T"] = "t2.bam"
+    assert cram_normals(normals, paths) == {"s3_N"}
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("scan.msi -b normal.bam tumor.bam"))
+    Namespace(bam=['normal.bam', 'tumor.bam'], debug=False, index=None,
+    min_depth=20, output='pruned.msi', quiet=False, scan='scan.msi',
+    slack=0.5)
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "scan",
+        help="Path to the MSISensor scan file",
+        type=str
+    )
+
+    main_parser.add_argument(
+        "-b", "--bam",
+        help="Path to the bam file(s)",
+        type=str,
+        nargs="+",
+        required=True
+    )
+
+    # Optional arguments
+    main_parser.add_argument(
+        "-i", "--index",
+        help="Path to the bam indexes, in the order of the bam files "
+             "(default: next to the bam files)",
+        type=str,
+        nargs="+",
+        default=None
+    )
+
+    main_parser.add_argument(
+        "-o", "--output",
+        help="Path to the pruned scan file (default: %(default)s)",
+        type=str,
+        default="pruned.msi"
+    )
+
+    main_parser.add_argument(
+        "-m", "--min-depth",
+        help="Minimal depth of the kept sites, in every bam file "
+             "(default: %(default)s)",
+        type=int,
+        default=20
+    )
+
+    main_parser.add_argument(
+        "-s", "--slack",
+        help="Fraction of the minimal depth an estimate must reach, to "
+             "absorb the estimation error (default: %(default)s)",
+        type=float,
+        default=0.5
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function prunes the sites of a scan file which can not reach the
+    minimal depth in the given bam files
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("scan.msi -b normal.bam tumor.bam")))
+    """
+    indexes = args.index or [f"{bam}.bai" for bam in args.bam]
+    if len(indexes) != len(args.bam):
+        raise ValueError("Expected one index per bam file")
+    estimates = [
+        estimate_reads(Path(bam), Path(bai))
+        for bam, bai in zip(args.bam, indexes)
+    ]
+    kept, _ = prune_scan(
+        Path(args.scan), estimates, Path(args.output),
+        args.min_depth * args.slack
+    )
+    if kept == 0:
+        logger.warning(f"No site may reach a depth of {args.min_depth}")
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="prune_sites.py", args=args)
+
+    try:
+        logger.debug("Pruning sites on estimated depth")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
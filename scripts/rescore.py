@@ -0,0 +1,526 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script re-scores microsatellite instability out of stored read count
+distributions (see dis_store.py), without reading the bam files again.
+
+For each site covered enough in both normal and tumor samples, the two
+read length distributions are compared with a Pearson chi-square test.
+P-values are corrected with Benjamini-Hochberg procedure (FDR), and sites
+under the FDR threshold are called somatic, as MSISensor msi does. All
+sites are tested at once, with NumPy array operations.
+
+Several coverage and FDR thresholds can be swept in one run. P-values are
+computed once per coverage threshold.
+
+You can test this script with:
+pytest -v ./rescore.py
+
+Usage example:
+# Re-score sample1 with a coverage threshold of 15
+python3.7 ./rescore.py msisensor/store/sample1 msisensor/rescore/sample1 -c 15
+
+# Sweep thresholds
+python3.7 ./rescore.py msisensor/store/sample1 msisensor/rescore/sample1 \
+    --sweep-coverage 10 15 20 --sweep-fdr 0.01 0.05 0.1
+"""
+
+import argparse           # Parse command line
+import logging            # Traces and loggings
+import math               # Mathematical functions
+import numpy              # Numeric arrays
+import shlex              # Lexical analysis
+import sys                # System related methods
+
+from pathlib import Path                          # Paths related methods
+from typing import Any, Dict, List, Tuple         # Type hints
+
+from common import *
+from dis_store import load_store
+from gather_msi import format_score, somatic_header
+
+logger = setup_logging(logger="rescore.py")
+
+sweep_header = (
+    "coverage\tFDR\tTotal_Number_of_Sites\tNumber_of_Somatic_Sites\t%\n"
+)
+log_gamma = numpy.vectorize(math.lgamma, otypes=[float])
+
+
+# Processing functions
+def chi2_sf(statistic: numpy.ndarray,
+            freedom: numpy.ndarray,
+            iterations: int = 200) -> numpy.ndarray:
+    """
+    Return the survival function of the chi-square distribution, that is
+    the regularized upper incomplete gamma function Q(freedom/2, stat/2).
+    The series expansion is used below a+1, the continued fraction
+    (modified Lentz) above.
+
+    Parameters:
+        statistic   ndarray     Chi-square statistics
+        freedom     ndarray     Degrees of freedom (> 0)
+        iterations  int         Number of series/fraction terms
+
+    Return:
+                    ndarray     The p-values
+
+    Example:
+    >>> chi2_sf(numpy.array([3.841459]), numpy.array([1]))
+    array([0.05])
+    """
+    a = numpy.asarray(freedom, dtype=float) / 2
+    x = numpy.asarray(statistic, dtype=float) / 2
+    tiny = 1e-300
+
+    with numpy.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        prefix = numpy.exp(-x + a * numpy.log(x) - log_gamma(a))
+
+        # Series of the lower incomplete gamma
+        term = 1 / a
+        total = term.copy()
+        for step in range(1, iterations):
+            term = term * x / (a + step)
+            total += term
+        lower = prefix * total
+
+        # Continued fraction of the upper incomplete gamma
+        b = x + 1 - a
+        c = numpy.full_like(x, 1 / tiny)
+        d = 1 / numpy.where(numpy.abs(b) < tiny, tiny, b)
+        fraction = d.copy()
+        for step in range(1, iterations):
+            an = -step * (step - a)
+            b = b + 2
+            d = an * d + b
+            d = 1 / numpy.where(numpy.abs(d) < tiny, tiny, d)
+            c = b + an / c
+            c = numpy.where(numpy.abs(c) < tiny, tiny, c)
+            fraction *= d * c
+        upper = prefix * fraction
+
+    sf = numpy.where(x < a + 1, 1 - lower, upper)
+    sf = numpy.where(x <= 0, 1.0, sf)
+    return numpy.clip(sf, 0, 1)
+
+
+def test_chi2_sf() -> None:
+    """
+    This function tests the chi2_sf function against known quantiles
+
+    Example:
+    >>> pytest -v rescore.py -k test_chi2_sf
+    """
+    got = chi2_sf(
+        numpy.array([3.841459, 5.991465, 10.0, 0.0, 150.0]),
+        numpy.array([1, 2, 5, 3, 99])
+    )
+    expected = numpy.array([0.05, 0.05, 0.0752352, 1.0, 0.00072045])
+    assert numpy.allclose(got, expected, rtol=1e-4)
+
+
+def bh_fdr(pvalues: numpy.ndarray) -> numpy.ndarray:
+    """
+    Return Benjamini-Hochberg corrected p-values
+
+    Parameters:
+        pvalues     ndarray     The p-values
+
+    Return:
+                    ndarray     The FDR, in the same order
+
+    Example:
+    >>> bh_fdr(numpy.array([0.01, 0.04, 0.03]))
+    array([0.03, 0.04, 0.04])
+    """
+    count = len(pvalues)
+    if count == 0:
+        return pvalues.astype(float)
+    order = numpy.argsort(pvalues, kind="stable")
+    ranked = pvalues[order] * count / numpy.arange(1, count + 1)
+    ranked = numpy.minimum.accumulate(ranked[::-1])[::-1]
+    fdr = numpy.empty(count, dtype=float)
+    fdr[order] = numpy.minimum(ranked, 1)
+    return fdr
+
+
+def test_bh_fdr() -> None:
+    """
+    This function tests the bh_fdr function
+
+    Example:
+    >>> pytest -v rescore.py -k test_bh_fdr
+    """
+    got = bh_fdr(numpy.array([0.01, 0.04, 0.03, 0.5]))
+    assert numpy.allclose(got, [0.04, 0.0533333, 0.0533333, 0.5])
+    assert len(bh_fdr(numpy.array([]))) == 0
+
+
+def compare_sites(normal: numpy.ndarray,
+                  tumor: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Compare normal and tumor read length distributions of each site
+    with a Pearson chi-square test
+
+    Parameters:
+        normal  ndarray     Normal read counts (sites x lengths)
+        tumor   ndarray     Tumor read counts (sites x lengths)
+
+    Return:
+                Tuple[ndarray, ndarray] P-values and differences (half
+                                        the L1 distance between the
+                                        normalized distributions)
+
+    Example:
+    >>> compare_sites(numpy.array([[10, 0]]), numpy.array([[0, 10]]))
+    (array([7.74421643e-06]), array([1.]))
+    """
+    normal = numpy.asarray(normal, dtype=float)
+    tumor = numpy.asarray(tumor, dtype=float)
+    normal_cov = normal.sum(axis=1, keepdims=True)
+    tumor_cov = tumor.sum(axis=1, keepdims=True)
+    columns = normal + tumor
+    total = normal_cov + tumor_cov
+
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        normal_exp = columns * normal_cov / total
+        tumor_exp = columns * tumor_cov / total
+        statistic = numpy.where(
+            columns > 0,
+            (normal - normal_exp) ** 2 / normal_exp
+            + (tumor - tumor_exp) ** 2 / tumor_exp,
+            0
+        )
+        difference = numpy.abs(
+            normal / normal_cov - tumor / tumor_cov
+        ).sum(axis=1) / 2
+
+    statistic = numpy.nan_to_num(statistic).sum(axis=1)
+    freedom = (columns > 0).sum(axis=1) - 1
+    pvalues = numpy.ones(len(statistic))
+    testable = freedom > 0
+    pvalues[testable] = chi2_sf(statistic[testable], freedom[testable])
+    return pvalues, numpy.nan_to_num(difference)
+
+
+def test_compare_sites() -> None:
+    """
+    This function tests the compare_sites function
+
+    Example:
+    >>> pytest -v rescore.py -k test_compare_sites
+    """
+    pvalues, difference = compare_sites(
+        numpy.array([[10, 0], [5, 5], [4, 0]]),
+        numpy.array([[0, 10], [5, 5], [8, 0]])
+    )
+    assert numpy.allclose(pvalues, [7.744216e-06, 1, 1])
+    assert numpy.allclose(difference, [1, 0, 0])
+
+
+def score(store: Dict[str, Any],
+          coverage: int = 20,
+          fdr: float = 0.05) -> Dict[str, Any]:
+    """
+    Score all sites of a store
+
+    Parameters:
+        store       Dict[str, Any]  A store loaded with load_store
+        coverage    int             Minimal coverage in both samples
+        fdr         float           FDR threshold for somatic sites
+
+    Return:
+                    Dict[str, Any]  Indexes of tested sites ('sites'), and
+                                    their 'pvalues', 'fdr', 'difference'
+                                    and 'somatic' status
+
+    Example:
+    >>> score(load_store(Path("store/sample1")))["somatic"].sum()
+    3
+    """
+    covered = (
+        (store["normal"].sum(axis=1) >= coverage)
+        & (store["tumor"].sum(axis=1) >= coverage)
+    )
+    sites = numpy.flatnonzero(covered)
+    pvalues, difference = compare_sites(
+        store["normal"][sites], store["tumor"][sites]
+    )
+    corrected = bh_fdr(pvalues)
+    return {
+        "sites": sites,
+        "pvalues": pvalues,
+        "fdr": corrected,
+        "difference": difference,
+        "somatic": corrected <= fdr
+    }
+
+
+def sweep(store: Dict[str, Any],
+          coverages: List[int],
+          fdrs: List[float]) -> List[Tuple[int, float, int, int]]:
+    """
+    Count tested and somatic sites for each pair of thresholds
+
+    Parameters:
+        store       Dict[str, Any]  A store loaded with load_store
+        coverages   List[int]       Coverage thresholds
+        fdrs        List[float]     FDR thresholds
+
+    Return:
+                    List[Tuple[int, float, int, int]]   Coverage, FDR,
+                                                        number of sites and
+                                                        of somatic sites
+
+    Example:
+    >>> sweep(load_store(Path("store/sample1")), [15, 20], [0.05])
+    [(15, 0.05, 1230, 4), (20, 0.05, 1003, 3)]
+    """
+    results = []
+    for coverage in coverages:
+        scores = score(store, coverage)
+        for fdr in fdrs:
+            somatic = int((scores["fdr"] <= fdr).sum())
+            results.append((coverage, fdr, len(scores["sites"]), somatic))
+    return results
+
+
+def test_score_and_sweep() -> None:
+    """
+    This function tests the score and sweep functions
+
+    Example:
+    >>> pytest -v rescore.py -k test_score_and_sweep
+    """
+    store = {
+        "normal": numpy.array([[30, 0, 0], [15, 15, 0], [5, 0, 0]]),
+        "tumor": numpy.array([[0, 0, 30], [15, 15, 0], [0, 5, 0]])
+    }
+    scores = score(store, coverage=20)
+    assert scores["sites"].tolist() == [0, 1]
+    assert scores["somatic"].tolist() == [True, False]
+    assert sweep(store, [5, 20], [0.05]) == [(5, 0.05, 3, 2), (20, 0.05, 2, 1)]
+
+
+def write_somatic(store: Dict[str, Any],
+                  scores: Dict[str, Any],
+                  path: Path) -> None:
+    """
+    Save somatic sites, ranked by p-value
+
+    Parameters:
+        store   Dict[str, Any]  A store loaded with load_store
+        scores  Dict[str, Any]  Scores returned by the score function
+        path    Path            Path to the somatic sites file
+
+    Example:
+    >>> store = load_store(Path("store/sample1"))
+    >>> write_somatic(store, score(store), Path("rescore/sample1_somatic"))
+    """
+    somatic = numpy.flatnonzero(scores["somatic"])
+    somatic = somatic[numpy.argsort(scores["pvalues"][somatic], kind="stable")]
+    with path.open("w") as somatic_stream:
+        somatic_stream.write(somatic_header)
+        for rank, index in enumerate(somatic, start=1):
+            site = scores["sites"][index]
+            somatic_stream.write(
+                f"{store['contigs'][store['contig'][site]]}\t"
+                f"{store['location'][site]}\t"
+                f"{store['left_flank'][site].decode()}\t"
+                f"{store['repeat_times'][site]}\t"
+                f"{store['repeat_unit'][site].decode()}\t"
+                f"{store['right_flank'][site].decode()}\t"
+                f"{scores['difference'][index]:.5f}\t"
+                f"{scores['pvalues'][index]:g}\t"
+                f"{scores['fdr'][index]:g}\t{rank}\n"
+            )
+
+
+def rescore(store: Path,
+            prefix: Path,
+            coverage: int = 20,
+            fdr: float = 0.05,
+            coverages: List[int] = None,
+            fdrs: List[float] = None) -> Tuple[int, int]:
+    """
+    Re-score a sample, and save its score, somatic sites and threshold sweep
+
+    Parameters:
+        store       Path        Path to the store directory
+        prefix      Path        Prefix of the output files
+        coverage    int         Minimal coverage in both samples
+        fdr         float       FDR threshold for somatic sites
+        coverages   List[int]   Coverage thresholds to sweep
+        fdrs        List[float] FDR thresholds to sweep
+
+    Return:
+                    Tuple[int, int] Number of tested and of somatic sites
+
+    Example:
+    >>> rescore(Path("store/sample1"), Path("rescore/sample1"))
+    (1003, 3)
+    """
+    columns = load_store(store)
+    scores = score(columns, coverage, fdr)
+    total, somatic = len(scores["sites"]), int(scores["somatic"].sum())
+    logger.debug(f"{somatic} somatic sites out of {total}")
+
+    prefix.parent.mkdir(parents=True, exist_ok=True)
+    prefix.write_text(format_score(total, somatic))
+    write_somatic(columns, scores, Path(f"{prefix}_somatic"))
+
+    with Path(f"{prefix}_sweep.tsv").open("w") as sweep_stream:
+        sweep_stream.write(sweep_header)
+        grid = sweep(columns, coverages or [coverage], fdrs or [fdr])
+        for cov, threshold, sites, somatic_sites in grid:
+            percent = (100 * somatic_sites / sites) if sites > 0 else 0
+            sweep_stream.write(
+                f"{cov}\t{threshold}\t{sites}\t{somatic_sites}\t"
+                f"{percent:.2f}\n"
+            )
+    return total, somatic
+
+
+def test_rescore(tmp_path: Path) -> None:
+    """
+    This function re-scores tests/msisensor/msi/example._dis, which has
+    no covered site, like MSISensor reported
+
+    Example:
+    >>> pytest -v rescore.py -k test_rescore
+    """
+    from dis_store import write_store
+    path = Path(__file__).parent.parent / "tests" / "msisensor" / "msi"
+    write_store(path / "example._dis", tmp_path / "store")
+
+    prefix = tmp_path / "rescore" / "example."
+    assert rescore(tmp_path / "store", prefix, coverages=[0, 20]) == (0, 0)
+    assert prefix.read_text() == (path / "example.").read_text()
+    assert Path(f"{prefix}_somatic").read_text() == somatic_header
+    assert Path(f"{prefix}_sweep.tsv").read_text().splitlines()[1:] == [
+        "0\t0.05\t458\t0\t0.00", "20\t0.05\t0\t0\t0.00"
+    ]
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("store/sample1 rescore/sample1"))
+    Namespace(coverage=20, debug=False, fdr=0.05, prefix='rescore/sample1',
+    quiet=False, store='store/sample1', sweep_coverage=None, sweep_fdr=None)
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "store",
+        help="Path to the read count distributions store",
+        type=str
+    )
+
+    main_parser.add_argument(
+        "prefix",
+        help="Prefix of the output files",
+        type=str
+    )
+
+    # Optional arguments, named after MSISensor msi ones
+    main_parser.add_argument(
+        "-c", "--coverage",
+        help="Coverage threshold for msi analysis (default: %(default)s)",
+        type=int,
+        default=20
+    )
+
+    main_parser.add_argument(
+        "-f", "--fdr",
+        help="FDR threshold for somatic sites detection "
+             "(default: %(default)s)",
+        type=float,
+        default=0.05
+    )
+
+    main_parser.add_argument(
+        "--sweep-coverage",
+        help="Coverage thresholds to sweep (default: --coverage)",
+        type=int,
+        nargs="+",
+        default=None
+    )
+
+    main_parser.add_argument(
+        "--sweep-fdr",
+        help="FDR thresholds to sweep (default: --fdr)",
+        type=float,
+        nargs="+",
+        default=None
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function performs the whole re-scoring sequence
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("store/sample1 rescore/sample1")))
+    """
+    rescore(
+        Path(args.store),
+        Path(args.prefix),
+        coverage=args.coverage,
+        fdr=args.fdr,
+        coverages=args.sweep_coverage,
+        fdrs=args.sweep_fdr
+    )
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="rescore.py", args=args)
+
+    try:
+        logger.debug("Re-scoring sample")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
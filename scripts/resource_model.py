@@ -0,0 +1,736 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script predicts the memory and walltime of MSISensor msi jobs from
+the size of the bam files, the number of sites in the scan file and the
+number of threads.
+
+The model is linear:
+
+    mem_mb   = a + b * bam_gb + c * sites_m
+    time_min = a + b * bam_gb / threads + c * sites_m / threads
+
+Its coefficients start from conservative priors, and are learnt from the
+Snakemake benchmark files of previous runs. Observations are kept in a
+history file, so they survive the removal of samples from the design.
+The fit is a ridge regression towards the priors, with non-negative
+coefficients: the priors weigh as much as a few observations (the
+penalty is scaled to the features), and collinear features (e.g. a
+single scan file for all samples) do not make the fit diverge. A model
+learnt on small jobs (e.g. panels) says little about large ones: outside
+the range of bam sizes and sites it was fitted on, predictions never go
+below those of the priors.
+
+You can test this script with:
+pytest -v ./resource_model.py
+
+Usage example:
+# Print the fitted model of msi, from a history file
+python3.7 ./resource_model.py benchmarks/resources.tsv --rule msi
+
+# Predict the resources of a 100GB pair, over 30 million sites
+python3.7 ./resource_model.py benchmarks/resources.tsv --rule msi \
+    --bam-gb 100 --sites-m 30 --threads 8
+"""
+
+import argparse           # Parse command line
+import logging            # Traces and loggings
+import math               # Mathematical functions
+import os                 # OS related activities
+import itertools          # Iterators building blocks
+import shlex              # Lexical analysis
+import sys                # System related methods
+
+from pathlib import Path                                      # Paths
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from common import *
+
+logger = setup_logging(logger="resource_model.py")
+
+history_header = (
+    "Rule\tName\tMtime_ns\tBam_gb\tSites_m\tThreads\tSeconds\tMax_rss_mb\n"
+)
+sample_bytes = 1024 * 1024
+headroom = {"mem_mb": 1.2, "time_min": 1.5}
+floors = {"mem_mb": 512, "time_min": 5}
+
+
+class Observation(NamedTuple):
+    """
+    The features and the measured resources of a single job
+    """
+    rule: str
+    name: str
+    mtime_ns: int
+    bam_gb: float
+    sites_m: float
+    threads: int
+    seconds: float
+    max_rss_mb: float
+
+
+class ResourceModel(NamedTuple):
+    """
+    Coefficients of the memory and walltime models (intercept, per bam
+    GB, per million sites), the number of observations they learnt, the
+    range of bam sizes and sites of these observations, and the prior
+    they were learnt from
+    """
+    mem_mb: Tuple[float, float, float]
+    time_min: Tuple[float, float, float]
+    observations: int = 0
+    bam_gb: Tuple[float, float] = (0.0, 0.0)
+    sites_m: Tuple[float, float] = (0.0, 0.0)
+    prior: Optional["ResourceModel"] = None
+
+
+priors = {
+    "msi": ResourceModel(mem_mb=(2048, 32, 128), time_min=(5, 4, 1)),
+    "msi_shard": ResourceModel(mem_mb=(1024, 32, 128), time_min=(5, 4, 1)),
+    "msi_native": ResourceModel(mem_mb=(1024, 0, 512), time_min=(5, 2, 2))
+}
+
+
+# Processing functions
+def read_benchmark(path: Path) -> Optional[Tuple[float, float]]:
+    """
+    Read the walltime and peak memory of a Snakemake benchmark file.
+    When the job was benchmarked several times, the worst run is kept.
+
+    Parameters:
+        path    Path                    Path to the benchmark file
+
+    Return:
+                Tuple[float, float]     Seconds and max RSS (MB), or None
+                                        when no usable line is found
+
+    Example:
+    >>> read_benchmark(Path("benchmarks/msi/sample1.tsv"))
+    (1534.25, 6120.5)
+    """
+    measures = []
+    with path.open("r") as benchmark_stream:
+        columns = benchmark_stream.readline().rstrip("\n").split("\t")
+        if "s" not in columns or "max_rss" not in columns:
+            return None
+        for line in benchmark_stream:
+            fields = dict(zip(columns, line.rstrip("\n").split("\t")))
+            try:
+                measures.append(
+                    (float(fields["s"]), float(fields["max_rss"]))
+                )
+            except (KeyError, ValueError):
+                continue
+    if not measures:
+        return None
+    return (
+        max(seconds for seconds, _ in measures),
+        max(rss for _, rss in measures)
+    )
+
+
+def load_history(path: Path) -> Dict[Tuple[str, str], Observation]:
+    """
+    Load the observations of previous runs. Malformed lines are skipped.
+
+    Parameters:
+        path    Path    Path to the history file
+
+    Return:
+                Dict[Tuple[str, str], Observation]
+                        Observations, by rule and benchmark name
+
+    Example:
+    >>> load_history(Path("benchmarks/resources.tsv"))
+    {('msi', 'sample1'): Observation(rule='msi', name='sample1', ...)}
+    """
+    history = {}
+    if not path.exists():
+        return history
+    with path.open("r") as history_stream:
+        history_stream.readline()
+        for line in history_stream:
+            try:
+                rule, name, mtime, bam, sites, threads, seconds, rss = (
+                    line.rstrip("\n").split("\t")
+                )
+                history[(rule, name)] = Observation(
+                    rule, name, int(mtime), float(bam), float(sites),
+                    int(threads), float(seconds), float(rss)
+                )
+            except ValueError:
+                logger.debug(f"Malformed line in {path}: {line!r}")
+    return history
+
+
+def merge_observations(history: Dict[Tuple[str, str], Observation],
+                       observations: Iterable[Observation]) -> int:
+    """
+    Add new observations to a history, in place. An observation replaces a
+    previous one of the same rule and name if its benchmark is newer.
+
+    Parameters:
+        history         Dict[Tuple[str, str], Observation]
+                                                Observations, by rule and
+                                                benchmark name
+        observations    Iterable[Observation]   Candidate observations
+
+    Return:
+                        int                     Number of added or
+                                                replaced observations
+
+    Example:
+    >>> merge_observations(load_history(Path("resources.tsv")), observations)
+    2
+    """
+    updated = 0
+    for observation in observations:
+        key = (observation.rule, observation.name)
+        if key in history and history[key].mtime_ns >= observation.mtime_ns:
+            continue
+        history[key] = observation
+        updated += 1
+    return updated
+
+
+def update_history(path: Path,
+                   observations: Iterable[Observation]) -> int:
+    """
+    Add new observations to the history file (see merge_observations).
+    The file is written to a temporary file, then moved, so that readers
+    never see a partial history.
+
+    Parameters:
+        path            Path                    Path to the history file
+        observations    Iterable[Observation]   Candidate observations
+
+    Return:
+                        int                     Number of added or
+                                                replaced observations
+
+    Example:
+    >>> update_history(Path("benchmarks/resources.tsv"), observations)
+    2
+    """
+    history = load_history(path)
+    updated = merge_observations(history, observations)
+
+    if updated > 0:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.parent / f".{path.name}.{os.getpid()}"
+        with tmp.open("w") as history_stream:
+            history_stream.write(history_header)
+            for observation in history.values():
+                history_stream.write(
+                    "\t".join(map(str, observation)) + "\n"
+                )
+        os.replace(tmp, path)
+    return updated
+
+
+def test_history(tmp_path: Path) -> None:
+    """
+    This function tests the read_benchmark, load_history and
+    update_history functions
+
+    Example:
+    >>> pytest -v resource_model.py -k test_history
+    """
+    benchmark = tmp_path / "sample1.tsv"
+    benchmark.write_text(
+        "s\th:m:s\tmax_rss\tmax_vms\tmax_uss\tmax_pss\tio_in\tio_out\n"
+        "120.5\t0:02:00\t2048.2\t4096\t2000\t2010\t1\t2\n"
+        "130.0\t0:02:10\t1024.0\t4096\t1000\t1010\t1\t2\n"
+    )
+    assert read_benchmark(benchmark) == (130.0, 2048.2)
+    benchmark.write_text("s\th:m:s\tmax_rss\n-\t-\t-\n")
+    assert read_benchmark(benchmark) is None
+
+    path = tmp_path / "resources.tsv"
+    first = Observation("msi", "sample1", 10, 50.0, 30.0, 8, 600.0, 9000.0)
+    assert update_history(path, [first]) == 1
+    assert update_history(path, [first]) == 0
+    assert load_history(path) == {("msi", "sample1"): first}
+
+    newer = first._replace(mtime_ns=20, seconds=700.0)
+    assert update_history(path, [newer]) == 1
+    assert load_history(path)[("msi", "sample1")].seconds == 700.0
+    assert list(tmp_path.glob(".resources.tsv.*")) == []
+
+    # Truncated or malformed lines are skipped
+    with path.open("a") as history_stream:
+        history_stream.write("msi\tsample2\t30\t50.0\nmsi\tx\t1\ta\n")
+    assert list(load_history(path)) == [("msi", "sample1")]
+
+
+def features(bam_gb: float,
+             sites_m: float,
+             threads: int) -> Dict[str, Tuple[float, float, float]]:
+    """
+    Build the feature vectors of the memory and walltime models
+
+    Parameters:
+        bam_gb      float   Size of the normal and tumor bam files, in GB
+        sites_m     float   Number of scanned sites, in millions
+        threads     int     Number of threads of the job
+
+    Return:
+                    Dict[str, Tuple[float, float, float]]
+                            Feature vectors, by resource
+
+    Example:
+    >>> features(100, 30, 8)
+    {'mem_mb': (1, 100, 30), 'time_min': (1, 12.5, 3.75)}
+    """
+    threads = max(threads, 1)
+    return {
+        "mem_mb": (1, bam_gb, sites_m),
+        "time_min": (1, bam_gb / threads, sites_m / threads)
+    }
+
+
+def solve(matrix: List[List[float]], vector: List[float]) -> List[float]:
+    """
+    Solve a small linear system with Gaussian elimination (partial
+    pivoting)
+
+    Parameters:
+        matrix  List[List[float]]   A square, invertible, matrix
+        vector  List[float]         The right hand side
+
+    Return:
+                List[float]         The solution
+
+    Example:
+    >>> solve([[2, 0], [0, 4]], [2, 2])
+    [1.0, 0.5]
+    """
+    size = len(vector)
+    rows = [list(map(float, row)) + [float(value)]
+            for row, value in zip(matrix, vector)]
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda r: abs(rows[r][column]))
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        for row in range(column + 1, size):
+            factor = rows[row][column] / rows[column][column]
+            for index in range(column, size + 1):
+                rows[row][index] -= factor * rows[column][index]
+
+    solution = [0.0] * size
+    for row in reversed(range(size)):
+        solution[row] = (
+            rows[row][size] - sum(
+                rows[row][index] * solution[index]
+                for index in range(row + 1, size)
+            )
+        ) / rows[row][row]
+    return solution
+
+
+def fit_coefficients(samples: List[Tuple[Tuple[float, ...], float]],
+                     prior: Tuple[float, ...],
+                     ridge: float) -> Tuple[float, ...]:
+    """
+    Fit non-negative coefficients on samples, with a ridge penalty towards
+    the prior coefficients. The penalty of each coefficient is scaled to
+    the mean square of its feature, so that the prior weighs as much as
+    `ridge` observations, whatever the units. With three coefficients,
+    the problem is solved exactly: the penalised least squares are solved
+    on each subset of coefficients (the others being null), and the best
+    non-negative solution is kept.
+
+    Parameters:
+        samples     List[Tuple[Tuple[float, ...], float]]
+                                        Feature vectors and targets
+        prior       Tuple[float, ...]   The prior coefficients
+        ridge       float               Weight of the prior, in
+                                        observations
+
+    Return:
+                    Tuple[float, ...]   The fitted coefficients
+
+    Example:
+    >>> fit_coefficients([((1, 2, 1), 300)], (2048, 32, 128), 4)
+    (1716.2, 13.3, 0.0)
+    """
+    size = len(prior)
+    penalties = [
+        ridge * (
+            sum(vector[index] ** 2 for vector, _ in samples) / len(samples)
+            or 1.0
+        )
+        for index in range(size)
+    ]
+
+    def loss(coefficients: Tuple[float, ...]) -> float:
+        return sum(
+            (sum(c * v for c, v in zip(coefficients, vector)) - target) ** 2
+            for vector, target in samples
+        ) + sum(
+            penalty * (coefficient - value) ** 2
+            for penalty, coefficient, value
+            in zip(penalties, coefficients, prior)
+        )
+
+    best = tuple([0.0] * size)
+    for free in itertools.product([True, False], repeat=size):
+        indexes = [index for index in range(size) if free[index]]
+        if not indexes:
+            continue
+        gram = [
+            [
+                sum(vector[row] * vector[column] for vector, _ in samples)
+                + penalties[row] * (row == column)
+                for column in indexes
+            ]
+            for row in indexes
+        ]
+        moment = [
+            sum(vector[row] * target for vector, target in samples)
+            + penalties[row] * prior[row]
+            for row in indexes
+        ]
+        solution = solve(gram, moment)
+        if min(solution) < 0:
+            continue
+        candidate = [0.0] * size
+        for index, value in zip(indexes, solution):
+            candidate[index] = value
+        if loss(tuple(candidate)) < loss(best):
+            best = tuple(candidate)
+    return best
+
+
+def fit(observations: List[Observation],
+        prior: ResourceModel,
+        ridge: float = 4.0) -> ResourceModel:
+    """
+    Fit the memory and walltime models on observations, with non-negative
+    coefficients and a ridge penalty towards the prior coefficients (see
+    fit_coefficients)
+
+    Parameters:
+        observations    List[Observation]   Observations of a single rule
+        prior           ResourceModel       The prior coefficients
+        ridge           float               Weight of the prior, in
+                                            observations
+
+    Return:
+                        ResourceModel       The fitted model
+
+    Example:
+    >>> fit(observations, priors["msi"])
+    ResourceModel(mem_mb=(1850.2, 41.3, 120.9), time_min=(...), ...)
+    """
+    if not observations:
+        return prior
+
+    coefficients = {}
+    for resource in ["mem_mb", "time_min"]:
+        samples = [
+            (
+                features(
+                    observation.bam_gb, observation.sites_m,
+                    observation.threads
+                )[resource],
+                observation.max_rss_mb if resource == "mem_mb"
+                else observation.seconds / 60
+            )
+            for observation in observations
+        ]
+        coefficients[resource] = fit_coefficients(
+            samples, getattr(prior, resource), ridge
+        )
+
+    bams = [observation.bam_gb for observation in observations]
+    sites = [observation.sites_m for observation in observations]
+    return ResourceModel(
+        mem_mb=coefficients["mem_mb"],
+        time_min=coefficients["time_min"],
+        observations=len(observations),
+        bam_gb=(min(bams), max(bams)),
+        sites_m=(min(sites), max(sites)),
+        prior=prior
+    )
+
+
+def predict(model: ResourceModel,
+            bam_gb: float,
+            sites_m: float,
+            threads: int,
+            attempt: int = 1,
+            maximum: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """
+    Predict the memory and walltime of a job. Predictions get some
+    headroom, and grow with the attempt number, up to a maximum. Outside
+    the range of bam sizes and sites a model was fitted on, predictions
+    are never below those of its prior.
+
+    Parameters:
+        model       ResourceModel       The fitted model
+        bam_gb      float               Size of the bam files, in GB
+        sites_m     float               Number of sites, in millions
+        threads     int                 Number of threads of the job
+        attempt     int                 The Snakemake attempt number
+        maximum     Dict[str, int]      Upper bounds, by resource
+
+    Return:
+                    Dict[str, int]      Memory (MB) and walltime (minutes)
+
+    Example:
+    >>> predict(priors["msi"], 100, 30, 8)
+    {'mem_mb': 10906, 'time_min': 89}
+    """
+    maximum = maximum or {}
+    models = [model]
+    if model.prior is not None and not (
+        model.bam_gb[0] <= bam_gb <= model.bam_gb[1]
+        and model.sites_m[0] <= sites_m <= model.sites_m[1]
+    ):
+        models.append(model.prior)
+
+    predictions = {}
+    for resource, vector in features(bam_gb, sites_m, threads).items():
+        estimate = max(
+            sum(
+                coefficient * value
+                for coefficient, value in zip(getattr(known, resource), vector)
+            )
+            for known in models
+        )
+        value = math.ceil(
+            max(estimate * headroom[resource], floors[resource]) * attempt
+        )
+        predictions[resource] = min(value, maximum.get(resource, value))
+    return predictions
+
+
+def test_fit_predict() -> None:
+    """
+    This function tests the solve, fit and predict functions
+
+    Example:
+    >>> pytest -v resource_model.py -k test_fit_predict
+    """
+    assert solve([[0, 1], [2, 0]], [3, 4]) == [2.0, 3.0]
+
+    prior = priors["msi"]
+    assert fit([], prior) == prior
+
+    observations = [
+        Observation(
+            "msi", str(bam), 0, bam, sites, 4,
+            60 * (2 + 3 * bam / 4 + sites / 4),
+            1000 + 50 * bam + 10 * sites
+        )
+        for bam in [1, 10, 50, 100] for sites in [1, 30]
+    ]
+    model = fit(observations, prior, ridge=1e-6)
+    assert model.observations == 8
+    for learnt, expected in zip(model.mem_mb + model.time_min,
+                                (1000, 50, 10, 2, 3, 1)):
+        assert abs(learnt - expected) < 1e-3
+
+    model = ResourceModel(mem_mb=(1000, 50, 10), time_min=(2, 3, 1))
+    assert predict(model, 10, 1, 4) == {"mem_mb": 1812, "time_min": 15}
+    assert predict(model, 10, 1, 4, attempt=2) == {
+        "mem_mb": 3624, "time_min": 30
+    }
+    assert predict(model, 0, 0, 1) == {"mem_mb": 1200, "time_min": 5}
+    assert predict(model, 100, 30, 4, maximum={"mem_mb": 4096}) == {
+        "mem_mb": 4096, "time_min": 127
+    }
+
+    # A panel history says nothing about a whole genome
+    small = [Observation("msi", "panel", 0, 1, 0.01, 8, 120, 300)]
+    model = fit(small, prior)
+    assert model.bam_gb == (1, 1) and model.sites_m == (0.01, 0.01)
+    assert min(model.mem_mb + model.time_min) >= 0
+    assert predict(prior, 100, 30, 8) == {"mem_mb": 10906, "time_min": 89}
+    assert predict(model, 100, 30, 8) == predict(prior, 100, 30, 8)
+    assert predict(model, 1, 0.01, 8)["mem_mb"] < \
+        predict(prior, 1, 0.01, 8)["mem_mb"]
+
+    small = [
+        Observation("msi", str(bam), 0, bam, 0.01, 8, 60 * bam, 200 * bam)
+        for bam in [0.5, 1, 2]
+    ]
+    model = fit(small, prior)
+    assert min(model.mem_mb + model.time_min) >= 0
+    assert predict(model, 100, 30, 8)["mem_mb"] >= 10906
+
+
+def estimate_sites(scan: Path, fasta: Path, fraction: float = 1.0) -> float:
+    """
+    Estimate the number of sites of a scan file, in millions, from its
+    size and the mean length of its first lines. When the scan file does
+    not exist yet, the estimate is based on the fasta file size, and on
+    the fraction of the genome the scan is restricted to.
+
+    Parameters:
+        scan        Path    Path to the scan file
+        fasta       Path    Path to the fasta file
+        fraction    float   Fraction of the genome covered by the scan
+
+    Return:
+                float   The estimated number of sites, in millions
+
+    Example:
+    >>> estimate_sites(Path("homopolymers_micosats.msi"), Path("hg38.fa"))
+    31.2
+    """
+    if scan.exists():
+        size = scan.stat().st_size
+        with scan.open("rb") as scan_stream:
+            head = scan_stream.read(sample_bytes)
+        lines = head.count(b"\n")
+        if lines <= 1:
+            return 0.0
+        return (lines - 1) * size / len(head) / 1e6
+    if fasta.exists():
+        return fasta.stat().st_size / 100 / 1e6 * fraction
+    return 0.0
+
+
+def test_estimate_sites(tmp_path: Path) -> None:
+    """
+    This function tests the estimate_sites function
+
+    Example:
+    >>> pytest -v resource_model.py -k test_estimate_sites
+    """
+    scan = tmp_path / "scan.msi"
+    fasta = tmp_path / "genome.fa"
+    assert estimate_sites(scan, fasta) == 0.0
+
+    fasta.write_bytes(b"A" * 2000)
+    assert estimate_sites(scan, fasta) == 20 / 1e6
+    assert estimate_sites(scan, fasta, fraction=0.5) == 10 / 1e6
+
+    scan.write_text(
+        "chromosome\tlocation\n" + "".join(f"1\t{i}\n" for i in range(1000))
+    )
+    assert abs(estimate_sites(scan, fasta) * 1e6 - 1000) < 10
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("resources.tsv"))
+    Namespace(bam_gb=None, debug=False, history='resources.tsv',
+    quiet=False, rule='msi', sites_m=0, threads=1)
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "history",
+        help="Path to the history file",
+        type=str
+    )
+
+    # Optional arguments
+    main_parser.add_argument(
+        "--rule",
+        help="Rule to model (default: %(default)s)",
+        choices=sorted(priors.keys()),
+        default="msi"
+    )
+
+    main_parser.add_argument(
+        "--bam-gb",
+        help="Predict the resources of bam files of this size, in GB",
+        type=float,
+        default=None
+    )
+
+    main_parser.add_argument(
+        "--sites-m",
+        help="Number of sites, in millions (default: %(default)s)",
+        type=float,
+        default=0
+    )
+
+    main_parser.add_argument(
+        "--threads",
+        help="Number of threads (default: %(default)s)",
+        type=int,
+        default=1
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function fits the model of a rule, and prints its coefficients or
+    a prediction
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("resources.tsv --rule msi")))
+    """
+    observations = [
+        observation for observation in load_history(Path(args.history))
+        .values() if observation.rule == args.rule
+    ]
+    model = fit(observations, priors[args.rule])
+    logger.debug(f"{args.rule} model fitted on {len(observations)} jobs")
+
+    if args.bam_gb is None:
+        for resource in ["mem_mb", "time_min"]:
+            print(resource, *getattr(model, resource), sep="\t")
+    else:
+        prediction = predict(model, args.bam_gb, args.sites_m, args.threads)
+        for resource, value in prediction.items():
+            print(resource, value, sep="\t")
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="resource_model.py", args=args)
+
+    try:
+        logger.debug("Fitting resource model")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
@@ -0,0 +1,364 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script handles a persistent cache of MSISensor scan results.
+
+Scanning a whole genome for homopolymers and microsatellites only depends
+on the fasta file and on the scan parameters. Scan results are stored in a
+shared directory, under a key built from the fasta (and its .fai) content
+and the scan parameters, so that they can be reused across workdirs.
+
+The least recently used scans are evicted when the cache grows over
+a given size.
+
+You can test this script with:
+pytest -v ./scan_cache.py
+
+Usage example:
+# Print the cached scan path of a fasta file
+python3.7 ./scan_cache.py /path/to/genome.fa --cache-dir /path/to/cache
+
+# Also evict old scans to keep the cache under 50GB
+python3.7 ./scan_cache.py /path/to/genome.fa --cache-dir /path/to/cache \
+    --max-size 50
+"""
+
+import argparse           # Parse command line
+import hashlib            # Checksums
+import logging            # Traces and loggings
+import os                 # OS related activities
+import shlex              # Lexical analysis
+import sys                # System related methods
+import time               # Time related methods
+
+from pathlib import Path                        # Paths related methods
+from typing import Any, Dict, List, Optional    # Type hints
+
+from common import *
+
+logger = setup_logging(logger="scan_cache.py")
+
+chunk_size = 1024 * 1024
+fingerprints_name = "fingerprints.tsv"
+
+
+# Processing functions
+def file_checksum(path: Path) -> str:
+    """
+    Return the sha256 checksum of a file, read by chunks
+
+    Parameters:
+        path    Path    Path to the file
+
+    Return:
+                str     The hexadecimal checksum
+
+    Example:
+    >>> file_checksum(Path("tests/example.fa"))
+    '5f6a...'
+    """
+    checksum = hashlib.sha256()
+    with path.open("rb") as file_stream:
+        for chunk in iter(lambda: file_stream.read(chunk_size), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def load_fingerprints(cache_dir: Path) -> Dict[str, str]:
+    """
+    Return already known fasta fingerprints, keyed by path, size
+    and modification time
+
+    Parameters:
+        cache_dir   Path            Path to the cache directory
+
+    Return:
+                    Dict[str, str]  Known fingerprints
+
+    Example:
+    >>> load_fingerprints(Path("/path/to/cache"))
+    {'/path/to/genome.fa:655968:1586476800000000000': '5f6a...'}
+    """
+    fingerprints = {}
+    try:
+        with (cache_dir / fingerprints_name).open("r") as tsv:
+            for line in tsv:
+                stat_key, fingerprint = line.rstrip("\n").split("\t")
+                fingerprints[stat_key] = fingerprint
+    except FileNotFoundError:
+        pass
+    return fingerprints
+
+
+def fasta_fingerprint(fasta: Path, cache_dir: Path) -> str:
+    """
+    Return the checksum of a fasta file content and of its index. The
+    result is remembered in the cache directory, and the fasta file is
+    read again only if its size or modification time change.
+
+    Parameters:
+        fasta       Path    Path to the fasta file
+        cache_dir   Path    Path to the cache directory
+
+    Return:
+                    str     The fasta fingerprint
+
+    Example:
+    >>> fasta_fingerprint(Path("genome.fa"), Path("/path/to/cache"))
+    '5f6a...'
+    """
+    paths = [fasta.resolve(), Path(f"{fasta}.fai").resolve()]
+    paths = [path for path in paths if path.exists()]
+    stat_key = ";".join(
+        f"{path}:{path.stat().st_size}:{path.stat().st_mtime_ns}"
+        for path in paths
+    )
+
+    fingerprints = load_fingerprints(cache_dir)
+    if stat_key in fingerprints:
+        return fingerprints[stat_key]
+
+    logger.info(f"Computing checksum of {fasta}")
+    fingerprint = hashlib.sha256(
+        "".join(file_checksum(path) for path in paths).encode()
+    ).hexdigest()
+    fingerprints[stat_key] = fingerprint
+
+    # Written in a temporary file then moved, since the cache is shared
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = cache_dir / f".{fingerprints_name}.{os.getpid()}"
+    with tmp.open("w") as tsv:
+        for key, value in fingerprints.items():
+            tsv.write(f"{key}\t{value}\n")
+    os.replace(tmp, cache_dir / fingerprints_name)
+    return fingerprint
+
+
+def scan_key(fasta: Path, cache_dir: Path, params: str = "") -> str:
+    """
+    Return the cache key of a scan
+
+    Parameters:
+        fasta       Path    Path to the fasta file
+        cache_dir   Path    Path to the cache directory
+        params      str     Scan parameters
+
+    Return:
+                    str     The cache key
+
+    Example:
+    >>> scan_key(Path("genome.fa"), Path("/path/to/cache"), "-l 5")
+    'a1b2...'
+    """
+    normalized = " ".join(shlex.split(params))
+    return hashlib.sha256(
+        f"{fasta_fingerprint(fasta, cache_dir)}\t{normalized}".encode()
+    ).hexdigest()
+
+
+def test_scan_key(tmp_path: Path) -> None:
+    """
+    This function tests the scan_key function
+
+    Example:
+    >>> pytest -v scan_cache.py -k test_scan_key
+    """
+    fasta = tmp_path / "genome.fa"
+    fasta.write_text(">1\nACGTACGT\n")
+    cache_dir = tmp_path / "cache"
+
+    key = scan_key(fasta, cache_dir, " -l  5 ")
+    assert key == scan_key(fasta, cache_dir, "-l 5")
+    assert key != scan_key(fasta, cache_dir, "-l 6")
+    assert (cache_dir / fingerprints_name).exists()
+
+    fasta.write_text(">1\nACGTACGA\n")
+    os.utime(fasta, ns=(0, 0))
+    assert key != scan_key(fasta, cache_dir, "-l 5")
+
+
+def cached_scan(cache_dir: Path, key: str) -> Path:
+    """
+    Return the path to a scan in the cache. If it already exists, its
+    access time is updated to mark it as recently used. The modification
+    time is left untouched, not to trigger downstream reruns.
+
+    Parameters:
+        cache_dir   Path    Path to the cache directory
+        key         str     The cache key
+
+    Return:
+                    Path    Path to the cached scan
+
+    Example:
+    >>> cached_scan(Path("/path/to/cache"), "a1b2")
+    PosixPath('/path/to/cache/a1b2.msi')
+    """
+    path = cache_dir / f"{key}.msi"
+    if path.exists():
+        logger.debug(f"Scan found in cache: {path}")
+        os.utime(path, (time.time(), path.stat().st_mtime))
+    return path
+
+
+def evict_scans(cache_dir: Path,
+                max_size: int,
+                keep: Optional[List[Path]] = None) -> List[Path]:
+    """
+    Remove least recently used scans until the cache fits in the
+    given size
+
+    Parameters:
+        cache_dir   Path        Path to the cache directory
+        max_size    int         Maximum size of the cache, in bytes
+        keep        List[Path]  Scans that must not be evicted
+
+    Return:
+                    List[Path]  The evicted scans
+
+    Example:
+    >>> evict_scans(Path("/path/to/cache"), 50 * 1024 ** 3)
+    [PosixPath('/path/to/cache/a1b2.msi')]
+    """
+    keep = [path.resolve() for path in (keep or [])]
+    scans = sorted(
+        cache_dir.glob("*.msi"),
+        key=lambda path: path.stat().st_atime
+    )
+    size = sum(path.stat().st_size for path in scans)
+
+    evicted = []
+    for path in scans:
+        if size <= max_size:
+            break
+        if path.resolve() in keep:
+            continue
+        size -= path.stat().st_size
+        logger.info(f"Evicting {path} from scan cache")
+        path.unlink()
+        evicted.append(path)
+    return evicted
+
+
+def test_evict_scans(tmp_path: Path) -> None:
+    """
+    This function tests the evict_scans function
+
+    Example:
+    >>> pytest -v scan_cache.py -k test_evict_scans
+    """
+    scans = [tmp_path / f"{key}.msi" for key in "abc"]
+    for age, path in enumerate(scans):
+        path.write_text("x" * 10)
+        os.utime(path, (100 + age, 100 + age))
+
+    # 'a' is the oldest, but in use
+    assert evict_scans(tmp_path, 15, keep=[scans[0]]) == scans[1:]
+    assert evict_scans(tmp_path, 15) == []
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("genome.fa --cache-dir cache"))
+    Namespace(cache_dir='cache', debug=False, fasta='genome.fa',
+    max_size=None, params='', quiet=False)
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "fasta",
+        help="Path to the fasta-formatted reference",
+        type=str
+    )
+
+    main_parser.add_argument(
+        "--cache-dir",
+        help="Path to the scan cache directory",
+        type=str,
+        required=True
+    )
+
+    # Optional arguments
+    main_parser.add_argument(
+        "--params",
+        help="Scan parameters (default: %(default)s)",
+        type=str,
+        default=""
+    )
+
+    main_parser.add_argument(
+        "--max-size",
+        help="Evict old scans to keep the cache under this size, in GB",
+        type=float,
+        default=None
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function prints the cached scan path, and evicts old scans
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("genome.fa --cache-dir cache")))
+    """
+    cache_dir = Path(args.cache_dir)
+    key = scan_key(Path(args.fasta), cache_dir, args.params)
+    path = cached_scan(cache_dir, key)
+    print(path)
+
+    if args.max_size is not None:
+        evict_scans(cache_dir, int(args.max_size * 1024 ** 3), keep=[path])
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="scan_cache.py", args=args)
+
+    try:
+        logger.debug("Looking for scan in cache")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
@@ -0,0 +1,229 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script splits the homopolymers and microsatellites list produced
+by MSISensor scan into a given number of region shards.
+
+Shards are contiguous, genome-ordered chunks holding roughly the same
+number of sites. Each shard keeps the original header line, so that
+it can be given to MSISensor msi as a regular scan file.
+
+You can test this script with:
+pytest -v ./split_scan.py
+
+Usage example:
+# Split the scan in 4 shards
+python3.7 ./split_scan.py homopolymers_micosats.msi shard_0.msi shard_1.msi \
+    shard_2.msi shard_3.msi
+"""
+
+import argparse           # Parse command line
+import logging            # Traces and loggings
+import shlex              # Lexical analysis
+import sys                # System related methods
+
+from pathlib import Path                         # Paths related methods
+from typing import Any, List, Tuple   # Type hints
+
+from common import *
+
+logger = setup_logging(logger="split_scan.py")
+
+
+# Processing functions
+def count_sites(scan: Path) -> Tuple[str, int]:
+    """
+    Return the header line and the number of sites of a scan file,
+    without loading it in memory
+
+    Parameters:
+        scan    Path            Path to the MSISensor scan file
+
+    Return:
+                Tuple[str, int] The header line, and the number of sites
+
+    Example:
+    >>> count_sites(Path("homopolymers_micosats.msi"))
+    ('chromosome\tlocation\t...\n', 6149)
+    """
+    with scan.open("r") as scan_stream:
+        header = scan_stream.readline()
+        return header, sum(1 for _ in scan_stream)
+
+
+def shard_bounds(sites: int, shards: int) -> List[Tuple[int, int]]:
+    """
+    Return the [start, stop) site indexes of each shard
+
+    Parameters:
+        sites   int         Total number of sites
+        shards  int         Number of shards
+
+    Return:
+                List[Tuple[int, int]]   One (start, stop) pair per shard
+
+    Example:
+    >>> shard_bounds(10, 3)
+    [(0, 4), (4, 7), (7, 10)]
+    """
+    if shards < 1:
+        raise ValueError("At least one shard is required")
+
+    size, rest = divmod(sites, shards)
+    bounds = []
+    start = 0
+    for shard in range(shards):
+        stop = start + size + (1 if shard < rest else 0)
+        bounds.append((start, stop))
+        start = stop
+    return bounds
+
+
+def test_shard_bounds() -> None:
+    """
+    This function tests the shard_bounds function
+
+    Example:
+    >>> pytest -v split_scan.py -k test_shard_bounds
+    """
+    import pytest
+
+    assert shard_bounds(10, 3) == [(0, 4), (4, 7), (7, 10)]
+    assert shard_bounds(2, 3) == [(0, 1), (1, 2), (2, 2)]
+    with pytest.raises(ValueError):
+        shard_bounds(10, 0)
+
+
+def split_scan(scan: Path, outputs: List[Path]) -> List[int]:
+    """
+    Stream a scan file into the given shard files
+
+    Parameters:
+        scan        Path        Path to the MSISensor scan file
+        outputs     List[Path]  Paths to the shard files, in genome order
+
+    Return:
+                    List[int]   The number of sites written in each shard
+
+    Example:
+    >>> split_scan(Path("scan.msi"), [Path("0.msi"), Path("1.msi")])
+    [3075, 3074]
+    """
+    header, sites = count_sites(scan)
+    bounds = shard_bounds(sites, len(outputs))
+    logger.debug(f"Splitting {sites} sites into {len(outputs)} shards")
+
+    with scan.open("r") as scan_stream:
+        scan_stream.readline()
+        for path, (start, stop) in zip(outputs, bounds):
+            with path.open("w") as shard_stream:
+                shard_stream.write(header)
+                for _ in range(stop - start):
+                    shard_stream.write(scan_stream.readline())
+            logger.debug(f"{path}: {stop - start} sites")
+
+    return [stop - start for start, stop in bounds]
+
+
+def test_split_scan(tmp_path: Path) -> None:
+    """
+    This function tests the split_scan function
+
+    Example:
+    >>> pytest -v split_scan.py -k test_split_scan
+    """
+    header = "chromosome\tlocation\trepeat_times\n"
+    sites = [f"1\t{position}\t10\n" for position in range(5)]
+    scan = tmp_path / "scan.msi"
+    scan.write_text(header + "".join(sites))
+
+    outputs = [tmp_path / f"{shard}.msi" for shard in range(2)]
+    assert split_scan(scan, outputs) == [3, 2]
+    assert outputs[0].read_text() == header + "".join(sites[:3])
+    assert outputs[1].read_text() == header + "".join(sites[3:])
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("scan.msi 0.msi 1.msi"))
+    Namespace(debug=False, quiet=False, scan='scan.msi',
+    shards=['0.msi', '1.msi'])
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "scan",
+        help="Path to the MSISensor scan file",
+        type=str
+    )
+
+    main_parser.add_argument(
+        "shards",
+        help="Paths to the shard files, in genome order",
+        type=str,
+        nargs="+"
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function performs the whole splitting sequence
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("scan.msi 0.msi 1.msi")))
+    """
+    split_scan(Path(args.scan), [Path(shard) for shard in args.shards])
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="split_scan.py", args=args)
+
+    try:
+        logger.debug("Splitting scan")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
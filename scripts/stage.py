@@ -0,0 +1,540 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script stages input files (bam, bam indexes, fasta) in the working
+directory, moving as few bytes as possible.
+
+For each file, the cheapest method is chosen:
+
+    - files out of cold storage are linked: a hard link when source and
+      destination share a file system, a symbolic link otherwise,
+    - files on cold storage are copied, since cold storage is not open for
+      intensive IO: a reflink (copy-on-write clone, FICLONE) when the file
+      system allows it, an in-kernel copy (copy_file_range, or sendfile)
+      otherwise.
+
+Many files can be staged at once, with a pool of threads. Copies out of a
+given mount point share a bandwidth limit, and the throughput is logged.
+
+You can test this script with:
+pytest -v ./stage.py
+
+Usage example:
+# Stage a bam file and its index
+python3.7 ./stage.py -i /data/s1.bam /data/s1.bam.bai \
+    -o raw_data/s1_N.bam raw_data/s1_N.bam.bai
+
+# Stage a bam file out of a cold storage
+python3.7 ./stage.py -i /cold/s1.bam -o raw_data/s1_N.bam \
+    --cold-storage /cold
+
+# Stage two bam files at once, copying at most 200MB/s out of /cold
+python3.7 ./stage.py -i /cold/s1.bam /cold/s2.bam \
+    -o raw_data/s1_N.bam raw_data/s2_N.bam \
+    --cold-storage /cold --concurrency 2 --bandwidth 200
+"""
+
+import argparse           # Parse command line
+import errno              # System error codes
+import fcntl              # File control (ioctl)
+import logging            # Traces and loggings
+import os                 # OS related activities
+import shlex              # Lexical analysis
+import sys                # System related methods
+import threading          # Locks
+import time               # Time related methods
+
+from concurrent.futures import ThreadPoolExecutor    # Thread pools
+from pathlib import Path                             # Paths related methods
+from typing import Any, List, Optional, Tuple        # Type hints
+
+from common import *
+
+logger = setup_logging(logger="stage.py")
+
+ficlone = 0x40049409
+chunk_size = 64 * 1024 * 1024
+throttled_chunk_size = 8 * 1024 * 1024
+methods = ["auto", "symlink", "hardlink", "copy"]
+copies = ["copy_file_range", "sendfile", "buffered copy"]
+
+
+class Throttle:
+    """
+    Limit the bandwidth shared by several threads: each chunk of data
+    books a time slot, at the given rate, and waits for its end
+    """
+    def __init__(self, rate: float = 0) -> None:
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self, size: int) -> None:
+        """
+        Wait until a chunk of the given size (in bytes) can be sent
+        """
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.next_slot = max(now, self.next_slot) + size / self.rate
+            slot_end = self.next_slot
+        time.sleep(slot_end - now)
+
+
+# Processing functions
+def is_cold(path: Path, cold_storage: List[str]) -> bool:
+    """
+    Return True if a file lies on a cold storage
+
+    Parameters:
+        path            Path        Path to the file
+        cold_storage    List[str]   Cold storage mount points
+
+    Return:
+                        bool        True if the file is on cold storage
+
+    Example:
+    >>> is_cold(Path("/cold/s1.bam"), ["/cold"])
+    True
+    """
+    resolved = str(path.resolve())
+    for mount in cold_storage:
+        mount = mount.strip().rstrip("/")
+        if mount and (resolved == mount or resolved.startswith(f"{mount}/")):
+            return True
+    return False
+
+
+def reflink(source: Path, destination: Path) -> bool:
+    """
+    Clone a file (copy-on-write), if the file system allows it
+
+    Parameters:
+        source          Path    Path to the file to clone
+        destination     Path    Path to the clone
+
+    Return:
+                        bool    True if the file was cloned
+
+    Example:
+    >>> reflink(Path("/data/s1.bam"), Path("raw_data/s1_N.bam"))
+    False
+    """
+    with source.open("rb") as source_stream, \
+            destination.open("wb") as destination_stream:
+        try:
+            fcntl.ioctl(destination_stream.fileno(), ficlone,
+                        source_stream.fileno())
+            return True
+        except OSError as error:
+            logger.debug(f"No reflink for {source}: {error}")
+    destination.unlink()
+    return False
+
+
+def kernel_copy(source: Path,
+                destination: Path,
+                throttle: Optional[Throttle] = None) -> str:
+    """
+    Copy a file within the kernel, by chunks, with copy_file_range or,
+    when it is not available, sendfile. Falls back to a buffered copy.
+
+    Parameters:
+        source          Path        Path to the file to copy
+        destination     Path        Path to the copy
+        throttle        Throttle    Bandwidth limit of the copy
+
+    Return:
+                        str     The copy method used
+
+    Example:
+    >>> kernel_copy(Path("/data/s1.bam"), Path("raw_data/s1_N.bam"))
+    'copy_file_range'
+    """
+    size = source.stat().st_size
+    chunk = chunk_size if throttle is None else throttled_chunk_size
+    throttle = throttle or Throttle()
+    with source.open("rb") as source_stream, \
+            destination.open("wb") as destination_stream:
+        source_fd = source_stream.fileno()
+        destination_fd = destination_stream.fileno()
+        for name in ["copy_file_range", "sendfile"]:
+            if not hasattr(os, name):
+                continue
+            try:
+                copied = 0
+                while copied < size:
+                    throttle.wait(min(chunk, size - copied))
+                    if name == "copy_file_range":
+                        sent = os.copy_file_range(
+                            source_fd, destination_fd,
+                            min(chunk, size - copied)
+                        )
+                    else:
+                        sent = os.sendfile(
+                            destination_fd, source_fd, copied,
+                            min(chunk, size - copied)
+                        )
+                    if sent == 0:
+                        break
+                    copied += sent
+                if copied == size:
+                    return name
+            except OSError as error:
+                if error.errno not in (errno.EXDEV, errno.ENOSYS,
+                                       errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+                logger.debug(f"No {name} for {source}: {error}")
+            os.lseek(source_fd, 0, os.SEEK_SET)
+            os.lseek(destination_fd, 0, os.SEEK_SET)
+            os.ftruncate(destination_fd, 0)
+
+        data = b"-"
+        while data:
+            throttle.wait(chunk)
+            data = source_stream.read(chunk)
+            destination_stream.write(data)
+    return "buffered copy"
+
+
+def stage_file(source: Path,
+               destination: Path,
+               cold_storage: Optional[List[str]] = None,
+               method: str = "auto",
+               throttle: Optional[Throttle] = None) -> str:
+    """
+    Stage a file in the working directory, with the cheapest method
+
+    Parameters:
+        source          Path        Path to the file to stage
+        destination     Path        Path to the staged file
+        cold_storage    List[str]   Cold storage mount points
+        method          str         One of auto, symlink, hardlink, copy
+        throttle        Throttle    Bandwidth limit of copies
+
+    Return:
+                        str         The staging method used
+
+    Example:
+    >>> stage_file(Path("/data/s1.bam"), Path("raw_data/s1_N.bam"))
+    'hardlink'
+    """
+    if method not in methods:
+        raise ValueError(f"Unknown staging method: {method}")
+    source = source.absolute()
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    if destination.is_symlink() or destination.exists():
+        destination.unlink()
+
+    if method == "auto":
+        if is_cold(source, cold_storage or []):
+            method = "copy"
+        elif source.stat().st_dev == destination.parent.stat().st_dev:
+            method = "hardlink"
+        else:
+            method = "symlink"
+
+    if method == "hardlink":
+        try:
+            os.link(source, destination)
+            return "hardlink"
+        except OSError as error:
+            logger.debug(f"No hardlink for {source}: {error}")
+            method = "symlink"
+
+    if method == "symlink":
+        destination.symlink_to(source)
+        return "symlink"
+
+    if reflink(source, destination):
+        return "reflink"
+    return kernel_copy(source, destination, throttle)
+
+
+def test_stage_file(tmp_path: Path) -> None:
+    """
+    This function tests the stage_file function, with all methods
+
+    Example:
+    >>> pytest -v stage.py -k test_stage_file
+    """
+    import pytest
+
+    source = tmp_path / "cold" / "s1.bam"
+    source.parent.mkdir()
+    content = os.urandom(3 * 1024 * 1024 + 7)
+    source.write_bytes(content)
+
+    staged = tmp_path / "raw_data" / "s1_N.bam"
+    assert stage_file(source, staged) == "hardlink"
+    assert staged.stat().st_ino == source.stat().st_ino
+
+    assert stage_file(source, staged, method="symlink") == "symlink"
+    assert staged.is_symlink() and staged.read_bytes() == content
+
+    used = stage_file(source, staged, [str(source.parent)])
+    assert used in ["reflink", "copy_file_range", "sendfile", "buffered copy"]
+    assert not staged.is_symlink()
+    assert staged.stat().st_ino != source.stat().st_ino
+    assert staged.read_bytes() == content
+
+    assert kernel_copy(source, staged) != "buffered copy"
+    assert staged.read_bytes() == content
+
+    start = time.monotonic()
+    assert kernel_copy(source, staged, Throttle(20 * 1024 * 1024)) in copies
+    assert time.monotonic() - start > 0.1
+    assert staged.read_bytes() == content
+
+    with pytest.raises(ValueError):
+        stage_file(source, staged, method="teleport")
+
+
+def test_is_cold(tmp_path: Path) -> None:
+    """
+    This function tests the is_cold function
+
+    Example:
+    >>> pytest -v stage.py -k test_is_cold
+    """
+    assert is_cold(tmp_path / "a.bam", [f"{tmp_path}/"])
+    assert not is_cold(tmp_path / "a.bam", [" "])
+    assert not is_cold(Path(f"{tmp_path}2/a.bam"), [str(tmp_path)])
+
+
+def mount_of(path: Path, cold_storage: List[str]) -> str:
+    """
+    Return the mount point (or device) a file is read from
+
+    Parameters:
+        path            Path        Path to the file
+        cold_storage    List[str]   Cold storage mount points
+
+    Return:
+                        str         The cold storage mount point, or the
+                                    device identifier of the file
+
+    Example:
+    >>> mount_of(Path("/cold/s1.bam"), ["/cold"])
+    '/cold'
+    """
+    for mount in cold_storage:
+        if is_cold(path, [mount]):
+            return mount.strip().rstrip("/")
+    return str(path.stat().st_dev)
+
+
+def stage_batch(files: List[Tuple[Path, Path]],
+                cold_storage: Optional[List[str]] = None,
+                method: str = "auto",
+                concurrency: int = 1,
+                bandwidth: float = 0) -> Tuple[int, float]:
+    """
+    Stage many files at once, with a pool of threads. Copies out of a
+    same mount point share the same bandwidth limit.
+
+    Parameters:
+        files           List[Tuple[Path, Path]]     Files to stage, and
+                                                    their destinations
+        cold_storage    List[str]                   Cold storage mount
+                                                    points
+        method          str                         Staging method
+        concurrency     int                         Maximum number of files
+                                                    staged at once
+        bandwidth       float                       Bandwidth limit per
+                                                    mount point (MB/s), 0
+                                                    for no limit
+
+    Return:
+                        Tuple[int, float]           Number of bytes copied
+                                                    and elapsed time
+
+    Example:
+    >>> stage_batch([(Path("/cold/s1.bam"), Path("raw_data/s1_N.bam"))],
+    ...             ["/cold"], concurrency=4, bandwidth=200)
+    (10737418240, 53.7)
+    """
+    cold_storage = cold_storage or []
+    throttles = {
+        mount: Throttle(bandwidth * 1024 * 1024)
+        for mount in {mount_of(source, cold_storage) for source, _ in files}
+    }
+
+    def stage(source: Path, destination: Path) -> int:
+        throttle = throttles[mount_of(source, cold_storage)]
+        used = stage_file(source, destination, cold_storage, method, throttle)
+        copied = source.stat().st_size if used in copies else 0
+        logger.info(f"{source} -> {destination} ({used})")
+        return copied
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        copied = sum(pool.map(lambda pair: stage(*pair), files))
+    elapsed = time.monotonic() - start
+
+    logger.info(
+        f"{len(files)} files staged, {copied / 1024 ** 2:.1f}MB copied "
+        f"in {elapsed:.1f}s "
+        f"({copied / 1024 ** 2 / max(elapsed, 1e-6):.1f}MB/s)"
+    )
+    return copied, elapsed
+
+
+def test_stage_batch(tmp_path: Path) -> None:
+    """
+    This function tests the stage_batch function
+
+    Example:
+    >>> pytest -v stage.py -k test_stage_batch
+    """
+    files = []
+    for index in range(4):
+        source = tmp_path / "cold" / f"s{index}.bam"
+        source.parent.mkdir(exist_ok=True)
+        source.write_bytes(os.urandom(1024 * 1024))
+        files.append((source, tmp_path / "raw_data" / f"s{index}_N.bam"))
+
+    copied, elapsed = stage_batch(
+        files, [str(tmp_path / "cold")], "copy",
+        concurrency=4, bandwidth=16
+    )
+    assert copied == 4 * 1024 * 1024
+    assert elapsed > 0.15
+    for source, destination in files:
+        assert destination.read_bytes() == source.read_bytes()
+
+    assert stage_batch(files, method="symlink")[0] == 0
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("-i s1.bam -o raw_data/s1_N.bam"))
+    Namespace(bandwidth=0, cold_storage=[], concurrency=1, debug=False,
+    input=['s1.bam'], method='auto', output=['raw_data/s1_N.bam'],
+    quiet=False)
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "-i", "--input",
+        help="Path to the files to stage",
+        type=str,
+        nargs="+",
+        required=True
+    )
+
+    main_parser.add_argument(
+        "-o", "--output",
+        help="Path to the staged files, in the same order",
+        type=str,
+        nargs="+",
+        required=True
+    )
+
+    # Optional arguments
+    main_parser.add_argument(
+        "--cold-storage",
+        help="Cold storage mount points, not open for intensive IO",
+        type=str,
+        nargs="*",
+        default=[]
+    )
+
+    main_parser.add_argument(
+        "-m", "--method",
+        help="Staging method (default: %(default)s)",
+        choices=methods,
+        default="auto"
+    )
+
+    main_parser.add_argument(
+        "-c", "--concurrency",
+        help="Maximum number of files staged at once (default: %(default)s)",
+        type=int,
+        default=1
+    )
+
+    main_parser.add_argument(
+        "-b", "--bandwidth",
+        help="Bandwidth limit of copies, per mount point, in MB/s. "
+             "0 means no limit (default: %(default)s)",
+        type=float,
+        default=0
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function stages all given files
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("-i s1.bam -o raw_data/s1_N.bam")))
+    """
+    if len(args.input) != len(args.output):
+        raise ValueError("Un-matching number of input/output files")
+
+    stage_batch(
+        [
+            (Path(source), Path(destination))
+            for source, destination in zip(args.input, args.output)
+        ],
+        args.cold_storage,
+        args.method,
+        args.concurrency,
+        args.bandwidth
+    )
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="stage.py", args=args)
+
+    try:
+        logger.debug("Staging files")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)
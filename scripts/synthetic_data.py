@@ -0,0 +1,608 @@
+#!/usr/bin/python3.7
+# -*- coding: utf-8 -*-
+
+"""
+This script generates synthetic, reproducible, test data for the
+pipeline:
+
+    - a fasta-formatted reference (and its .fai index) made of random
+      bases, with microsatellites injected at a given density,
+    - normal/tumor pairs of sorted and indexed bam files, with reads
+      spanning each microsatellite at a given depth. A fraction of tumor
+      reads carry a shifted repeat length (insertion or deletion of a few
+      repeat units), the signature of microsatellite instability.
+
+Bam files and their .bai indexes are written directly, without samtools
+nor pysam. The same seed always produces the same files.
+
+You can test this script with:
+pytest -v ./synthetic_data.py
+
+Usage example:
+# A 1Mb reference, and ten pairs of bam files at 30X
+python3.7 ./synthetic_data.py data --samples 10 --length 1000000 --depth 30
+"""
+
+import argparse           # Parse command line
+import logging            # Traces and loggings
+import random             # Pseudo-random numbers
+import shlex              # Lexical analysis
+import struct             # Binary data handling
+import sys                # System related methods
+
+from pathlib import Path                                      # Paths
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
+
+from common import *
+from bgzf import BamHeader, BgzfWriter, encode_header, read_bam_header
+from bgzf import read_block
+from fasta_index import build_fai, write_fai
+
+logger = setup_logging(logger="synthetic_data.py")
+
+bases = "ACGT"
+seq_codes = {base: code for code, base in enumerate("=ACMGRSVTWYHKDBN")}
+cigar_codes = {op: code for code, op in enumerate("MIDNSHP=X")}
+reference_ops = "MDN=X"
+linear_shift = 14
+pseudo_bin = 37450
+flank = 10
+
+
+class Microsatellite(NamedTuple):
+    """
+    A microsatellite injected in the reference: its contig, 0-based start,
+    repeat unit and number of repeats
+    """
+    contig: str
+    start: int
+    unit: str
+    repeats: int
+
+
+class Read(NamedTuple):
+    """
+    A mapped read: its reference index, 0-based position, name, CIGAR
+    operations and sequence
+    """
+    ref_id: int
+    pos: int
+    name: str
+    cigar: List[Tuple[str, int]]
+    seq: str
+
+
+# Processing functions
+def make_reference(path: Path,
+                   contigs: int = 1,
+                   length: int = 100000,
+                   density: float = 1.0,
+                   seed: int = 0) -> Tuple[Dict[str, str], List[Any]]:
+    """
+    Write a random reference, with microsatellites evenly spaced along each
+    contig, and its .fai index
+
+    Parameters:
+        path        Path        Path to the fasta file
+        contigs     int         Number of contigs
+        length      int         Length of each contig
+        density     float       Number of microsatellites per kilobase
+        seed        int         Seed of the pseudo-random generator
+
+    Return:
+                    Tuple[Dict[str, str], List[Microsatellite]]
+                                Sequences by contig name, and injected
+                                microsatellites
+
+    Example:
+    >>> make_reference(Path("genome.fa"), contigs=2, length=1000)
+    ({'1': 'ACGG...', '2': 'TTAC...'}, [Microsatellite(contig='1', ...)])
+    """
+    rng = random.Random(seed)
+    sequences = {}
+    sites = []
+    spacing = int(1000 / density) if density > 0 else length
+    for index in range(1, contigs + 1):
+        name = str(index)
+        sequence = [rng.choice(bases) for _ in range(length)]
+        for anchor in range(spacing // 2, length - spacing // 2, spacing):
+            size = rng.randint(1, 5)
+            unit = "".join(rng.choice(bases) for _ in range(size))
+            while size > 1 and len(set(unit)) == 1:
+                unit = "".join(rng.choice(bases) for _ in range(size))
+            repeats = rng.randint(10, 20) if size == 1 else rng.randint(5, 10)
+            if anchor + size * repeats + flank >= length:
+                continue
+            sequence[anchor:anchor + size * repeats] = unit * repeats
+            sites.append(Microsatellite(name, anchor, unit, repeats))
+        sequences[name] = "".join(sequence)
+
+    with path.open("w") as fasta_stream:
+        for name, sequence in sequences.items():
+            fasta_stream.write(f">{name}\n")
+            for start in range(0, len(sequence), 60):
+                fasta_stream.write(sequence[start:start + 60] + "\n")
+    write_fai(build_fai(path), Path(f"{path}.fai"))
+    logger.debug(f"{path}: {contigs} contigs, {len(sites)} microsatellites")
+    return sequences, sites
+
+
+def make_reads(sequences: Dict[str, str],
+               sites: List[Microsatellite],
+               sample: str,
+               depth: int = 30,
+               read_length: int = 100,
+               shift: float = 0.0,
+               seed: int = 0) -> List[Read]:
+    """
+    Draw reads spanning each microsatellite. A fraction of them carries a
+    repeat length shifted by one to three units.
+
+    Parameters:
+        sequences   Dict[str, str]          Sequences by contig name
+        sites       List[Microsatellite]    Injected microsatellites
+        sample      str                     Sample name, used in read names
+        depth       int                     Number of reads per site
+        read_length int                     Length of the reads
+        shift       float                   Fraction of shifted reads
+        seed        int                     Seed of the pseudo-random
+                                            generator
+
+    Return:
+                    List[Read]              Reads sorted by position
+
+    Example:
+    >>> make_reads(sequences, sites, "patient1", depth=2)
+    [Read(ref_id=0, pos=412, name='patient1:0', cigar=[('M', 100)], ...)]
+    """
+    rng = random.Random(seed)
+    ref_ids = {name: index for index, name in enumerate(sequences)}
+    reads = []
+    for site in sites:
+        sequence = sequences[site.contig]
+        size = len(site.unit)
+        end = site.start + size * site.repeats
+        for _ in range(depth):
+            delta = 0
+            if rng.random() < shift:
+                delta = rng.choice([-3, -2, -1, 1, 2, 3])
+                delta = max(delta, 1 - site.repeats)
+            lowest = max(end + max(delta, 0) * size + flank - read_length, 0)
+            highest = site.start - flank
+            if lowest > highest:
+                continue
+            start = rng.randint(lowest, highest)
+
+            if delta >= 0:
+                left = end - start
+                inserted = site.unit * delta
+                right = read_length - left - len(inserted)
+                seq = (
+                    sequence[start:end] + inserted
+                    + sequence[end:end + right]
+                )
+                cigar = [("M", left), ("I", len(inserted)), ("M", right)]
+            else:
+                left = end + delta * size - start
+                right = read_length - left
+                seq = sequence[start:start + left] + sequence[end:end + right]
+                cigar = [("M", left), ("D", -delta * size), ("M", right)]
+            if len(seq) < read_length:
+                continue
+            cigar = [(op, count) for op, count in cigar if count > 0]
+            if len(cigar) > 1 and cigar[1][0] == "M":
+                cigar = [("M", cigar[0][1] + cigar[1][1])]
+            reads.append(Read(
+                ref_ids[site.contig], start, f"{sample}:{len(reads)}",
+                cigar, seq
+            ))
+    return sorted(reads, key=lambda read: (read.ref_id, read.pos))
+
+
+def test_make_reference_reads(tmp_path: Path) -> None:
+    """
+    This function tests the make_reference and make_reads functions
+
+    Example:
+    >>> pytest -v synthetic_data.py -k test_make_reference_reads
+    """
+    fasta = tmp_path / "genome.fa"
+    sequences, sites = make_reference(fasta, contigs=2, length=5000)
+    assert [len(sequence) for sequence in sequences.values()] == [5000] * 2
+    assert len(sites) == 8
+    assert (tmp_path / "genome.fa.fai").read_text().startswith("1\t5000\t3")
+    for site in sites:
+        assert sequences[site.contig][site.start:].startswith(
+            site.unit * site.repeats
+        )
+    assert make_reference(tmp_path / "again.fa", 2, 5000) == (sequences, sites)
+
+    normal = make_reads(sequences, sites, "a", depth=10)
+    assert len(normal) == 80
+    assert all(read.cigar == [("M", 100)] for read in normal)
+    assert all(
+        sequences[str(read.ref_id + 1)][read.pos:read.pos + 100] == read.seq
+        for read in normal
+    )
+
+    tumor = make_reads(sequences, sites, "a", depth=10, shift=1.0)
+    assert all(len(read.cigar) == 3 for read in tumor)
+    assert all(len(read.seq) == 100 for read in tumor)
+
+
+def reg2bin(start: int, end: int) -> int:
+    """
+    Return the smallest UCSC bin containing a 0-based, half-open, region,
+    as described in the SAM/BAM specifications
+
+    Parameters:
+        start   int     Start of the region
+        end     int     End of the region (excluded)
+
+    Return:
+                int     The bin number
+
+    Example:
+    >>> reg2bin(0, 100)
+    4681
+    """
+    end -= 1
+    for shift, offset in [(14, 4681), (17, 585), (20, 73), (23, 9), (26, 1)]:
+        if start >> shift == end >> shift:
+            return offset + (start >> shift)
+    return 0
+
+
+def encode_record(read: Read) -> bytes:
+    """
+    Encode a mapped read as a bam record (with its block size)
+
+    Parameters:
+        read    Read    The read to encode
+
+    Return:
+                bytes   The binary bam record
+
+    Example:
+    >>> encode_record(Read(0, 10, "r1", [("M", 4)], "ACGT"))
+    b'2\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\n\\x00\\x00\\x00\\x03<...'
+    """
+    name = read.name.encode() + b"\x00"
+    span = sum(count for op, count in read.cigar if op in reference_ops)
+    codes = [seq_codes.get(base, 15) for base in read.seq] + [0]
+    body = b"".join([
+        struct.pack(
+            "<iiBBHHHiiii",
+            read.ref_id, read.pos, len(name), 60,
+            reg2bin(read.pos, read.pos + max(span, 1)), len(read.cigar), 0,
+            len(read.seq), -1, -1, 0
+        ),
+        name,
+        b"".join(
+            struct.pack("<I", count << 4 | cigar_codes[op])
+            for op, count in read.cigar
+        ),
+        bytes(
+            codes[index] << 4 | codes[index + 1]
+            for index in range(0, len(read.seq), 2)
+        ),
+        b"\x1e" * len(read.seq)
+    ])
+    return struct.pack("<i", len(body)) + body
+
+
+def write_bam(path: Path, header: BamHeader, reads: Iterable[Read]) -> int:
+    """
+    Write sorted reads as a bam file, and index it (.bai) on the fly
+
+    Parameters:
+        path    Path            Path to the bam file
+        header  BamHeader       The header of the bam file
+        reads   Iterable[Read]  Reads, sorted by position
+
+    Return:
+                int             Number of written reads
+
+    Example:
+    >>> write_bam(Path("sample.bam"), header, reads)
+    12000
+    """
+    bins = [{} for _ in header.references]
+    linear = [[] for _ in header.references]
+    mapped = [0 for _ in header.references]
+    written = 0
+    with path.open("wb") as bam_stream:
+        writer = BgzfWriter(bam_stream)
+        writer.write(encode_header(header))
+        writer.flush()
+        for read in reads:
+            start = writer.tell()
+            writer.write(encode_record(read))
+            written += 1
+            end = writer.tell()
+
+            span = sum(
+                count for op, count in read.cigar if op in reference_ops
+            )
+            last = read.pos + max(span, 1)
+            chunks = bins[read.ref_id].setdefault(
+                reg2bin(read.pos, last), []
+            )
+            if chunks and chunks[-1][1] == start:
+                chunks[-1][1] = end
+            else:
+                chunks.append([start, end])
+
+            mapped[read.ref_id] += 1
+            offsets = linear[read.ref_id]
+            for window in range(read.pos >> linear_shift,
+                                ((last - 1) >> linear_shift) + 1):
+                while len(offsets) <= window:
+                    offsets.append(None)
+                if offsets[window] is None:
+                    offsets[window] = start
+        writer.close()
+
+    with Path(f"{path}.bai").open("wb") as bai_stream:
+        bai_stream.write(b"BAI\x01" + struct.pack("<i", len(bins)))
+        for ref_bins, offsets, count in zip(bins, linear, mapped):
+            bai_stream.write(struct.pack("<i", len(ref_bins) + (count > 0)))
+            for bin_id, chunks in sorted(ref_bins.items()):
+                bai_stream.write(struct.pack("<Ii", bin_id, len(chunks)))
+                for chunk in chunks:
+                    bai_stream.write(struct.pack("<QQ", *chunk))
+            if count > 0:
+                # Pseudo-bin: span of the reference reads, and read counts
+                bai_stream.write(struct.pack(
+                    "<IiQQQQ", pseudo_bin, 2,
+                    min(chunks[0][0] for chunks in ref_bins.values()),
+                    max(chunks[-1][1] for chunks in ref_bins.values()),
+                    count, 0
+                ))
+            previous = 0
+            for window, offset in enumerate(offsets):
+                offsets[window] = previous = (
+                    previous if offset is None else offset
+                )
+            bai_stream.write(struct.pack("<i", len(offsets)))
+            bai_stream.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+    return written
+
+
+def make_bam_pair(directory: Path,
+                  sample: str,
+                  sequences: Dict[str, str],
+                  sites: List[Microsatellite],
+                  depth: int = 30,
+                  read_length: int = 100,
+                  shift: float = 0.2,
+                  seed: int = 0) -> Tuple[Path, Path]:
+    """
+    Write the normal and tumor bam files of a sample, in the normal and
+    tumor sub-directories of a directory. Both share the sample name (SM
+    field of their read group), and only the tumor reads carry shifted
+    microsatellites.
+
+    Parameters:
+        directory   Path                    Path to the output directory
+        sample      str                     Sample name
+        sequences   Dict[str, str]          Sequences by contig name
+        sites       List[Microsatellite]    Injected microsatellites
+        depth       int                     Number of reads per site
+        read_length int                     Length of the reads
+        shift       float                   Fraction of shifted tumor reads
+        seed        int                     Seed of the pseudo-random
+                                            generator
+
+    Return:
+                    Tuple[Path, Path]       Paths to the normal and tumor
+                                            bam files
+
+    Example:
+    >>> make_bam_pair(Path("data"), "patient1", sequences, sites)
+    (PosixPath('data/normal/patient1.bam'), PosixPath('data/tumor/...'))
+    """
+    paths = []
+    for kind, kind_shift, kind_seed in [
+        ("normal", 0.0, seed * 2), ("tumor", shift, seed * 2 + 1)
+    ]:
+        header = BamHeader(
+            "@HD\tVN:1.6\tSO:coordinate\n"
+            + "".join(
+                f"@SQ\tSN:{name}\tLN:{len(sequence)}\n"
+                for name, sequence in sequences.items()
+            )
+            + f"@RG\tID:{sample}_{kind}\tSM:{sample}\n",
+            [(name, len(sequence)) for name, sequence in sequences.items()]
+        )
+        path = directory / kind / f"{sample}.bam"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        reads = make_reads(
+            sequences, sites, f"{sample}_{kind}", depth, read_length,
+            kind_shift, kind_seed
+        )
+        write_bam(path, header, reads)
+        paths.append(path)
+    return tuple(paths)
+
+
+def test_make_bam_pair(tmp_path: Path) -> None:
+    """
+    This function tests the reg2bin, encode_record, write_bam and
+    make_bam_pair functions
+
+    Example:
+    >>> pytest -v synthetic_data.py -k test_make_bam_pair
+    """
+    assert reg2bin(0, 100) == 4681
+    assert reg2bin(16383, 16385) == 585
+    assert reg2bin(0, 1 << 29) == 0
+
+    record = encode_record(Read(0, 10, "r1", [("M", 3)], "ACG"))
+    assert struct.unpack("<iii", record[:12]) == (len(record) - 4, 0, 10)
+    assert record[-5:] == b"\x12\x40\x1e\x1e\x1e"
+
+    sequences, sites = make_reference(tmp_path / "genome.fa", length=40000)
+    normal, tumor = make_bam_pair(tmp_path, "patient1", sequences, sites)
+    assert read_bam_header(tumor).references == [("1", 40000)]
+    assert "SM:patient1" in read_bam_header(normal).text
+
+    with normal.open("rb") as bam_stream:
+        read_block(bam_stream)
+        block = read_block(bam_stream)
+    size, ref_id, pos = struct.unpack("<iii", block[:12])
+    assert (ref_id, pos) == (0, make_reads(sequences, sites, "")[0].pos)
+
+    bai = Path(f"{normal}.bai").read_bytes()
+    assert bai[:8] == b"BAI\x01\x01\x00\x00\x00"
+    n_intv, first = struct.unpack("<iQ", bai[-8 * 3 - 4:-8 * 2])
+    assert n_intv == 3 and first >> 16 > 0
+
+
+# Parsing command line arguments
+# This function won't be tested
+def parse_args(args: Any = sys.argv[1:]) -> argparse.ArgumentParser:
+    """
+    Build a command line parser object
+
+    Parameters:
+        args    Any                 Command line arguments
+
+    Return:
+                ArgumentParser      Parsed command line object
+
+    Example:
+    >>> parse_args(shlex.split("data"))
+    Namespace(contigs=1, debug=False, density=1.0, depth=30, length=100000,
+    output='data', quiet=False, read_length=100, samples=1, seed=0,
+    shift=0.2)
+    """
+    main_parser = argparse.ArgumentParser(
+        description=sys.modules[__name__].__doc__,
+        formatter_class=CustomFormatter,
+        epilog="This script does not perform any magic. Check the result."
+    )
+
+    # Required arguments
+    main_parser.add_argument(
+        "output",
+        help="Path to the output directory",
+        type=str
+    )
+
+    # Optional arguments
+    main_parser.add_argument(
+        "--samples",
+        help="Number of normal/tumor pairs (default: %(default)s)",
+        type=int,
+        default=1
+    )
+
+    main_parser.add_argument(
+        "--contigs",
+        help="Number of contigs (default: %(default)s)",
+        type=int,
+        default=1
+    )
+
+    main_parser.add_argument(
+        "--length",
+        help="Length of each contig (default: %(default)s)",
+        type=int,
+        default=100000
+    )
+
+    main_parser.add_argument(
+        "--density",
+        help="Number of microsatellites per kilobase "
+             "(default: %(default)s)",
+        type=float,
+        default=1.0
+    )
+
+    main_parser.add_argument(
+        "--depth",
+        help="Number of reads per microsatellite (default: %(default)s)",
+        type=int,
+        default=30
+    )
+
+    main_parser.add_argument(
+        "--read-length",
+        help="Length of the reads (default: %(default)s)",
+        type=int,
+        default=100
+    )
+
+    main_parser.add_argument(
+        "--shift",
+        help="Fraction of tumor reads with a shifted repeat length "
+             "(default: %(default)s)",
+        type=float,
+        default=0.2
+    )
+
+    main_parser.add_argument(
+        "--seed",
+        help="Seed of the pseudo-random generator (default: %(default)s)",
+        type=int,
+        default=0
+    )
+
+    # Logging options
+    log = main_parser.add_mutually_exclusive_group()
+    log.add_argument(
+        "-d", "--debug",
+        help="Set logging in debug mode",
+        default=False,
+        action='store_true'
+    )
+
+    log.add_argument(
+        "-q", "--quiet",
+        help="Turn off logging behaviour",
+        default=False,
+        action='store_true'
+    )
+
+    return main_parser.parse_args(args)
+
+
+# Main function, the core of this script
+def main(args: argparse.ArgumentParser) -> None:
+    """
+    This function writes a synthetic reference and bam pairs
+
+    Parameters:
+        args    ArgumentParser      The parsed command line
+
+    Example:
+    >>> main(parse_args(shlex.split("data --samples 10")))
+    """
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    sequences, sites = make_reference(
+        output / "genome.fa", args.contigs, args.length, args.density,
+        args.seed
+    )
+    for index in range(args.samples):
+        make_bam_pair(
+            output, f"sample{index}", sequences, sites, args.depth,
+            args.read_length, args.shift, args.seed + index
+        )
+    logger.info(f"{args.samples} bam pairs written in {output}")
+
+
+# Running programm if not imported
+if __name__ == '__main__':
+    # Parsing command line
+    args = parse_args()
+    logger = setup_logging(logger="synthetic_data.py", args=args)
+
+    try:
+        logger.debug("Generating synthetic data")
+        main(args)
+    except Exception as e:
+        logger.exception("%s", e)
+        sys.exit(1)
+    sys.exit(0)